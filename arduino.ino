@@ -1,7 +1,9 @@
 #include <ESP8266WiFi.h>
 #include <ESP8266HTTPClient.h>
+#include <WiFiUdp.h>
 #include <SPI.h>
 #include <MFRC522.h>
+#include <EEPROM.h>
 
 // WiFi credentials
 const char* ssid = "Urmi";        
@@ -10,19 +12,48 @@ const char* password = "zdtm8900";
 // Flask server details
 const char* serverName = "http://192.168.15.121:5001/log";
 
+// Identifies this reader; with seq it makes retries idempotent on the server
+const char* readerId = "reader-1";
+#define MAX_SEND_ATTEMPTS 3
+#define HTTP_TIMEOUT_MS 3000
+
+// Binary UDP protocol (see binary_ingest.py): one small datagram and a 14-byte
+// ack instead of an HTTP request, so the radio is on for far less time.
+// Needs BINARY_INGEST_UDP set on the server; 0 posts to /log instead.
+#define USE_BINARY_UDP 0
+const char* binaryHost = "192.168.15.121";
+const uint16_t binaryPort = 5005;
+#define ACK_TIMEOUT_MS 300
+
+// Per-scan sequence number. It only ever increases, across reboots too, so a
+// new scan never reuses a number the server still keeps, and a retried scan
+// keeps its number so the server stores it only once.
+uint32_t scanSeq = 0;
+
+// scanSeq survives reboots in EEPROM (flash on the ESP8266) as a ceiling
+// reserved SEQ_RESERVE numbers ahead, so flash is written once per block of
+// scans rather than on every scan; a reboot skips what is left of the block.
+#define SEQ_RESERVE 256
+#define SEQ_MAGIC 0x53455131  // "SEQ1"
+struct SeqRecord {
+  uint32_t magic;
+  uint32_t ceiling;
+};
+uint32_t seqCeiling = 0;
+
 // RFID Pins
 #define RST_PIN   2
 #define SS_PIN    15
 
 MFRC522 mfrc522(SS_PIN, RST_PIN);
 
-// Known cards
-byte user1UID[4] = {0x71, 0x18, 0x6E, 0x05};
-byte user2UID[4] = {0xDD, 0xB6, 0xAA, 0x04};
+// Card owners are looked up on the server (see /api/cards), so
+// staff changes never require reflashing the reader.
 
 // WiFi + HTTP
 WiFiClient client;
 HTTPClient http;
+WiFiUDP udp;
 
 // LED pin (found: GPIO16)
 #define LED_PIN 16
@@ -39,14 +70,6 @@ bool ledState = HIGH;              // LED off (active low)
 unsigned long cardFlashStart = 0;
 bool cardFlashing = false;
 
-// Compare two UIDs
-bool compareUID(byte *uid, byte *knownUID) {
-  for (byte i = 0; i < 4; i++) {
-    if (uid[i] != knownUID[i]) return false;
-  }
-  return true;
-}
-
 void setup() {
   Serial.begin(115200);
   pinMode(LED_PIN, OUTPUT);
@@ -55,10 +78,38 @@ void setup() {
   SPI.begin();
   mfrc522.PCD_Init();
 
+  EEPROM.begin(sizeof(SeqRecord));
+  SeqRecord record;
+  EEPROM.get(0, record);
+  // Resume above every number handed out before the reboot. Only the very
+  // first boot starts at a random value (hardware RNG), clear of the numbers
+  // of a firmware that did not keep them.
+  scanSeq = record.magic == SEQ_MAGIC ? record.ceiling : (RANDOM_REG32 & 0x7FFFFFFF);
+  reserveSeq();
+#if USE_BINARY_UDP
+  udp.begin(binaryPort);
+#endif
+
   WiFi.begin(ssid, password);
   Serial.print("Connecting to WiFi...\n");
 }
 
+// Persists a new ceiling above scanSeq before any number below it is used
+void reserveSeq() {
+  seqCeiling = scanSeq + SEQ_RESERVE;
+  SeqRecord record = { SEQ_MAGIC, seqCeiling };
+  EEPROM.put(0, record);
+  EEPROM.commit();
+}
+
+uint32_t nextSeq() {
+  scanSeq++;
+  if (scanSeq >= seqCeiling) {
+    reserveSeq();
+  }
+  return scanSeq;
+}
+
 void handleLED() {
   unsigned long currentMillis = millis();
 
@@ -89,6 +140,51 @@ void handleLED() {
   }
 }
 
+// Sends one scan as a binary frame and waits for its ack.
+// Returns true once the server has it (stored, duplicate or invalid);
+// false on timeout, busy or error, which are worth a retry.
+bool sendBinaryScan(const byte* uid, byte uidSize, uint32_t seq) {
+  uint8_t frame[2 + 64 + 13 + 10];
+  size_t idLen = strlen(readerId);
+  size_t n = 0;
+  frame[n++] = 1;      // version
+  frame[n++] = idLen;
+  memcpy(frame + n, readerId, idLen);
+  n += idLen;
+  for (int i = 3; i >= 0; i--) frame[n++] = (seq >> (8 * i)) & 0xFF;
+  for (int i = 0; i < 8; i++) frame[n++] = 0;  // timestamp 0: use the server's clock
+  frame[n++] = uidSize;
+  memcpy(frame + n, uid, uidSize);
+  n += uidSize;
+
+  udp.beginPacket(binaryHost, binaryPort);
+  udp.write(frame, n);
+  if (!udp.endPacket()) {
+    return false;
+  }
+
+  unsigned long start = millis();
+  while (millis() - start < ACK_TIMEOUT_MS) {
+    if (udp.parsePacket() > 0) {
+      uint8_t ack[14 * 8];
+      int len = udp.read(ack, sizeof(ack));
+      // Acks are version, status, seq (4 bytes), log id (8 bytes)
+      for (int off = 0; off + 14 <= len; off += 14) {
+        uint32_t ackSeq = ((uint32_t)ack[off + 2] << 24) | ((uint32_t)ack[off + 3] << 16) |
+                          ((uint32_t)ack[off + 4] << 8) | ack[off + 5];
+        if (ackSeq == seq) {
+          uint8_t status = ack[off + 1];
+          Serial.printf("Server ack: status %d\n", status);
+          return status != 2 && status != 3;
+        }
+      }
+    }
+    delay(1);
+  }
+  Serial.println("No ack from server");
+  return false;
+}
+
 void loop() {
   handleLED();
 
@@ -114,35 +210,42 @@ void loop() {
     }
     uidStr.toUpperCase();
 
-    // Identify user
-    String user = "Unknown";
-    if (compareUID(mfrc522.uid.uidByte, user1UID)) {
-      user = "User 1";
-    } else if (compareUID(mfrc522.uid.uidByte, user2UID)) {
-      user = "User 2";
-    }
-
-    Serial.printf("Scanned UID: %s (%s)\n", uidStr.c_str(), user.c_str());
+    Serial.printf("Scanned UID: %s\n", uidStr.c_str());
 
     // Trigger LED flash (500ms ON)
     cardFlashing = true;
     cardFlashStart = millis();
 
-    // Send data to Flask server
-    if (WiFi.status() == WL_CONNECTED) {
+    // Send data to Flask server, retrying with the same seq on failure
+    uint32_t seq = nextSeq();
+#if USE_BINARY_UDP
+    for (int attempt = 0; attempt < MAX_SEND_ATTEMPTS && WiFi.status() == WL_CONNECTED; attempt++) {
+      if (sendBinaryScan(mfrc522.uid.uidByte, mfrc522.uid.size, seq)) {
+        break;
+      }
+      delay(200 * (attempt + 1));
+    }
+#else
+    String postData = "uid=" + uidStr + "&reader_id=" + readerId + "&seq=" + String(seq);
+    for (int attempt = 0; attempt < MAX_SEND_ATTEMPTS && WiFi.status() == WL_CONNECTED; attempt++) {
       http.begin(client, serverName);
+      http.setTimeout(HTTP_TIMEOUT_MS);
       http.addHeader("Content-Type", "application/x-www-form-urlencoded");
 
-      String postData = "uid=" + uidStr + "&user=" + user;
       int httpResponseCode = http.POST(postData);
+      http.end();
 
       if (httpResponseCode > 0) {
         Serial.printf("Server Response: %d\n", httpResponseCode);
+        if (httpResponseCode < 500) {
+          break;  // stored, or a repeat the server already has
+        }
       } else {
         Serial.printf("Error sending data: %s\n", http.errorToString(httpResponseCode).c_str());
       }
-      http.end();
+      delay(200 * (attempt + 1));
     }
+#endif
 
     mfrc522.PICC_HaltA();
     mfrc522.PCD_StopCrypto1();
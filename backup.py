@@ -0,0 +1,324 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from models import DatabaseManager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks (Windows): only backups within one process are serialised
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "backup_chain.json"
+LOCK_FILE = "backup.lock"
+# Microseconds keep two backups taken within the same second apart
+NAME_TIMESTAMP = "%Y%m%d_%H%M%S_%f"
+INCREMENT_FORMAT = "rfid-incremental-v1"
+_PAGE_RECORD = struct.Struct(">I")
+
+
+class _BackupRestarted(Exception):
+    """Raised from the progress callback to abandon a restarting stepwise copy"""
+
+
+class BackupEngine:
+    """Online backups built on ``sqlite3.Connection.backup``
+
+    A snapshot is first copied ``pages_per_step`` pages at a time with a
+    pause between steps. A write from another connection restarts an online
+    backup, so after ``max_restarts`` restarts the copy falls back to one
+    step, which in WAL mode holds only a read snapshot and never blocks
+    writers.
+
+    Full backups store the whole snapshot (optionally gzip-compressed).
+    Incremental backups store only the pages that changed since the previous
+    backup in the chain, tracked by a per-page hash file.
+
+    Backups and restores hold a thread lock and an ``flock`` on a lock file
+    in the backup directory for their whole run, so the scheduled backup,
+    an API request and a CLI run never interleave their chain updates.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, backup_dir: str = "database_backups",
+                 pages_per_step: int = 1024, step_pause: float = 0.005, max_restarts: int = 3,
+                 compress: bool = True, compress_level: int = 6):
+        self.db_manager = db_manager
+        self.backup_dir = backup_dir
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.max_restarts = max_restarts
+        self.compress = compress
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+    @property
+    def _prefix(self) -> str:
+        return os.path.splitext(os.path.basename(self.db_manager.db_path))[0]
+
+    @contextmanager
+    def _locked(self):
+        """Hold the backup directory exclusively against other threads and processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.backup_dir, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _new_path(directory: str, name: str) -> str:
+        """Path for a new backup file; never replaces an existing backup"""
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            raise FileExistsError(f"Backup file already exists: {path}")
+        return path
+
+    def snapshot(self, target_path: str) -> str:
+        """Copy a transactionally consistent snapshot of the live database"""
+        target = sqlite3.connect(target_path)
+        try:
+            with self.db_manager.connection() as source:
+                try:
+                    self._copy_stepwise(source, target)
+                except _BackupRestarted:
+                    logger.info("Backup kept restarting under writes; copying snapshot in one step")
+                    source.backup(target, pages=-1)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+        return target_path
+
+    def _copy_stepwise(self, source: sqlite3.Connection, target: sqlite3.Connection):
+        state = {"remaining": None, "restarts": 0}
+
+        def progress(status: int, remaining: int, total: int):
+            if state["remaining"] is not None and remaining > state["remaining"]:
+                state["restarts"] += 1
+                if state["restarts"] > self.max_restarts:
+                    raise _BackupRestarted()
+            state["remaining"] = remaining
+            # Yield between steps so the writer is never starved
+            time.sleep(self.step_pause)
+
+        source.backup(target, pages=self.pages_per_step, progress=progress)
+
+    def full_backup(self, backup_name: Optional[str] = None, compress: Optional[bool] = None) -> str:
+        """Write a full backup and start a new incremental chain from it"""
+        with self._locked():
+            return self._full_backup(backup_name, compress)
+
+    def _full_backup(self, backup_name: Optional[str], compress: Optional[bool]) -> str:
+        compress = self.compress if compress is None else compress
+        timestamp = datetime.now().strftime(NAME_TIMESTAMP)
+        if backup_name is None:
+            backup_name = f"{self._prefix}_full_{timestamp}.db" + (".gz" if compress else "")
+        backup_path = self._new_path(self.backup_dir, backup_name)
+
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as tmp:
+            snapshot_path = self.snapshot(os.path.join(tmp, "snapshot.db"))
+            page_size, hashes = self._hash_pages(snapshot_path)
+
+            if backup_name.endswith(".gz"):
+                with open(snapshot_path, "rb") as src, gzip.open(backup_path, "xb", self.compress_level) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            else:
+                shutil.move(snapshot_path, backup_path)
+
+        hashes_name = backup_name.split(".")[0] + ".hashes"
+        self._write_hashes(os.path.join(self.backup_dir, hashes_name), hashes)
+        self._save_state({
+            "base": backup_name,
+            "page_size": page_size,
+            "hashes": hashes_name,
+            "increments": []
+        })
+
+        logger.info(f"Full backup created: {backup_path}")
+        return backup_path
+
+    def incremental_backup(self) -> str:
+        """Write only the pages changed since the last backup in the chain"""
+        with self._locked():
+            return self._incremental_backup()
+
+    def _incremental_backup(self) -> str:
+        state = self._load_state()
+        if state is None or not os.path.exists(os.path.join(self.backup_dir, state["base"])):
+            return self._full_backup(None, None)
+
+        timestamp = datetime.now().strftime(NAME_TIMESTAMP)
+        backup_name = f"{self._prefix}_incr_{timestamp}.pages.gz"
+        backup_path = self._new_path(self.backup_dir, backup_name)
+        hashes_path = os.path.join(self.backup_dir, state["hashes"])
+        previous = self._read_hashes(hashes_path)
+
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as tmp:
+            snapshot_path = self.snapshot(os.path.join(tmp, "snapshot.db"))
+            page_size, hashes = self._hash_pages(snapshot_path)
+            if page_size != state["page_size"]:
+                return self._full_backup(None, None)
+
+            changed = [page for page, digest in enumerate(hashes)
+                       if page >= len(previous) or previous[page] != digest]
+            header = {
+                "format": INCREMENT_FORMAT,
+                "base": state["base"],
+                "page_size": page_size,
+                "page_count": len(hashes),
+                "changed_pages": len(changed),
+                "created": datetime.now().isoformat()
+            }
+            with open(snapshot_path, "rb") as src, gzip.open(backup_path, "xb", self.compress_level) as dst:
+                dst.write(json.dumps(header).encode() + b"\n")
+                for page in changed:
+                    src.seek(page * page_size)
+                    dst.write(_PAGE_RECORD.pack(page))
+                    dst.write(src.read(page_size))
+
+        self._write_hashes(hashes_path, hashes)
+        state["increments"].append(backup_name)
+        self._save_state(state)
+
+        logger.info(f"Incremental backup created: {backup_path} ({len(changed)} of {len(hashes)} pages)")
+        return backup_path
+
+    def materialize(self, backup_path: str, target_path: str) -> str:
+        """Rebuild a plain database file from a full or incremental backup"""
+        name = os.path.basename(backup_path)
+        if ".pages" not in name:
+            self._decompress_to(backup_path, target_path)
+            return target_path
+
+        header = self._read_header(backup_path)
+        base_path = os.path.join(os.path.dirname(backup_path), header["base"])
+        self._decompress_to(base_path, target_path)
+
+        # Apply every increment of the same chain up to and including this one
+        for increment in self.list_increments(header["base"], os.path.dirname(backup_path)):
+            self._apply_increment(os.path.join(os.path.dirname(backup_path), increment), target_path)
+            if increment == name:
+                break
+        return target_path
+
+    def restore(self, backup_path: str):
+        """Restore the live database in place through the backup API"""
+        with self._locked(), tempfile.TemporaryDirectory(dir=self.backup_dir) as tmp:
+            restored_path = self.materialize(backup_path, os.path.join(tmp, "restore.db"))
+            source = sqlite3.connect(restored_path)
+            try:
+                result = source.execute("PRAGMA integrity_check").fetchone()[0]
+                if result != "ok":
+                    raise ValueError(f"Backup failed integrity check: {result}")
+                with self.db_manager.connection() as target:
+                    source.backup(target)
+            finally:
+                source.close()
+
+            # Pages no longer match the chain's hashes; the next backup must be full
+            self._clear_state()
+
+    def list_increments(self, base: str, directory: Optional[str] = None) -> List[str]:
+        """Incremental backup files chained to ``base``, oldest first"""
+        directory = directory or self.backup_dir
+        increments = []
+        for file in sorted(os.listdir(directory)):
+            if file.endswith(".pages.gz") and self._read_header(os.path.join(directory, file))["base"] == base:
+                increments.append(file)
+        return increments
+
+    def chain_files(self) -> List[str]:
+        """Files the current incremental chain depends on"""
+        state = self._load_state()
+        if state is None:
+            return []
+        return [state["base"], state["hashes"], *state["increments"]]
+
+    @staticmethod
+    def _hash_pages(db_path: str):
+        with sqlite3.connect(db_path) as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        hashes = []
+        with open(db_path, "rb") as f:
+            while True:
+                page = f.read(page_size)
+                if not page:
+                    break
+                hashes.append(hashlib.blake2b(page, digest_size=16).digest())
+        return page_size, hashes
+
+    @staticmethod
+    def _write_hashes(path: str, hashes: List[bytes]):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(hashes))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_hashes(path: str) -> List[bytes]:
+        with open(path, "rb") as f:
+            data = f.read()
+        return [data[i:i + 16] for i in range(0, len(data), 16)]
+
+    @staticmethod
+    def _read_header(path: str) -> Dict:
+        with gzip.open(path, "rb") as f:
+            header = json.loads(f.readline())
+        if header.get("format") != INCREMENT_FORMAT:
+            raise ValueError(f"Not an incremental backup: {path}")
+        return header
+
+    @staticmethod
+    def _decompress_to(path: str, target_path: str):
+        if path.endswith(".gz"):
+            with gzip.open(path, "rb") as src, open(target_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            shutil.copyfile(path, target_path)
+
+    @staticmethod
+    def _apply_increment(path: str, target_path: str):
+        with gzip.open(path, "rb") as src, open(target_path, "r+b") as dst:
+            header = json.loads(src.readline())
+            page_size = header["page_size"]
+            for _ in range(header["changed_pages"]):
+                page = _PAGE_RECORD.unpack(src.read(_PAGE_RECORD.size))[0]
+                dst.seek(page * page_size)
+                dst.write(src.read(page_size))
+            dst.truncate(header["page_count"] * page_size)
+
+    def _load_state(self) -> Optional[Dict]:
+        path = os.path.join(self.backup_dir, STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_state(self, state: Dict):
+        path = os.path.join(self.backup_dir, STATE_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def _clear_state(self):
+        path = os.path.join(self.backup_dir, STATE_FILE)
+        if os.path.exists(path):
+            os.remove(path)
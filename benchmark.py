@@ -0,0 +1,149 @@
+"""Benchmark card-scan ingestion throughput while dashboards read concurrently.
+
+Compares the legacy connect-per-call access pattern (rollback journal) with
+the pooled WAL-mode ``DatabaseManager`` used by ``LogManager``, and with the
+group-commit ``BatchWriter`` that serves ``POST /log``.
+
+Usage:
+    python benchmark.py --seconds 10 --writers 32 --readers 8
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from ingest import BatchWriter
+from models import DatabaseManager, LogManager
+
+
+class LegacyLogManager:
+    """Connect-per-call access pattern used before the connection pool"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Reuse the schema definition, then switch back to the default journal
+        DatabaseManager(db_path, pool_size=1).close()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('PRAGMA journal_mode=DELETE')
+
+    def add_log(self, uid: str):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('INSERT INTO card_logs (uid, timestamp) VALUES (?, ?)',
+                         (uid, int(time.time() * 1000)))
+            conn.commit()
+
+    def get_recent_logs(self, limit: int = 50):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute('SELECT id, uid, user_id, timestamp FROM card_logs '
+                                'ORDER BY timestamp DESC LIMIT ?', (limit,)).fetchall()
+
+
+class BatchedLogManager:
+    """Routes writes through the group-commit BatchWriter like ``/log`` does"""
+
+    def __init__(self, log_manager: LogManager):
+        self.log_manager = log_manager
+        self.writer = BatchWriter(log_manager)
+        self.writer.start()
+
+    def add_log(self, uid: str):
+        return self.writer.add_log(uid)
+
+    def get_recent_logs(self, limit: int = 50):
+        return self.log_manager.get_recent_logs(limit)
+
+
+def run(manager, seconds: float, writers: int, readers: int) -> dict:
+    """Hammer ``manager`` with writer and reader threads for ``seconds``"""
+    stop = threading.Event()
+    counts = {'scans': 0, 'reads': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def writer(n: int):
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                manager.add_log(f'{n:02X}{done:06X}')
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+        with lock:
+            counts['scans'] += done
+            counts['errors'] += errors
+
+    def reader():
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                manager.get_recent_logs(50)
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+        with lock:
+            counts['reads'] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'scans_per_sec': round(counts['scans'] / seconds, 1),
+        'reads_per_sec': round(counts['reads'] / seconds, 1),
+        'errors': counts['errors']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--synchronous', default='FULL')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacyLogManager(os.path.join(tmp, 'legacy.db'))
+        before = run(legacy, args.seconds, args.writers, args.readers)
+
+        pooled = LogManager(db_manager=DatabaseManager(
+            os.path.join(tmp, 'pooled.db'),
+            pool_size=args.writers + args.readers,
+            synchronous=args.synchronous
+        ))
+        after = run(pooled, args.seconds, args.writers, args.readers)
+        pooled.db_manager.close()
+
+        batched = BatchedLogManager(LogManager(db_manager=DatabaseManager(
+            os.path.join(tmp, 'batched.db'),
+            pool_size=args.writers + args.readers,
+            synchronous=args.synchronous
+        )))
+        group_commit = run(batched, args.seconds, args.writers, args.readers)
+        batched.writer.stop()
+        batched.log_manager.db_manager.close()
+
+    def speedup(result: dict):
+        if not before['scans_per_sec']:
+            return None
+        return round(result['scans_per_sec'] / before['scans_per_sec'], 2)
+
+    print(json.dumps({
+        'before': before,
+        'after': after,
+        'group_commit': group_commit,
+        'scan_speedup': speedup(after),
+        'group_commit_speedup': speedup(group_commit)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""Compact binary scan protocol over UDP and TCP for low-power readers.
+
+A reader that keeps a radio on for an HTTP request per tap (TCP handshake,
+headers, form encoding, JSON reply) spends most of its battery on protocol
+overhead. Here one scan is a frame of 20-90 bytes, big-endian:
+
+    version      1 byte   always 1
+    id_length    1 byte   1-64
+    reader_id    id_length bytes of UTF-8
+    seq          4 bytes  unsigned, the reader's sequence number
+    timestamp    8 bytes  epoch milliseconds; 0 means "when the server got it"
+    uid_length   1 byte   4-10
+    uid          uid_length raw UID bytes, stored as upper-case hex
+
+Frames are self-delimiting: a UDP datagram may carry several, and a TCP
+connection is a plain stream of them. Every frame is answered with a 14-byte
+ack, several per datagram or write when they complete together:
+
+    version      1 byte   always 1
+    status       1 byte   0 stored, 1 duplicate, 2 busy, 3 error, 4 invalid
+    seq          4 bytes  the seq of the acknowledged frame
+    log_id       8 bytes  the stored log, or the one a duplicate repeats; 0 otherwise
+
+``(reader_id, seq)`` is the same idempotency key as on ``/log``, so a reader
+that gets no ack over UDP resends the identical frame and is answered
+"duplicate" if the first copy made it. Busy and error are worth a retry,
+invalid is not.
+
+Scans go through the same ``BatchWriter`` as ``/log``, so they are
+deduplicated, group-committed and broadcast exactly like HTTP scans.
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import metrics
+from ingest import BatchWriter, DuplicateScan, IngestQueueFull
+from runtime import native_selector, native_socket
+from timeutils import from_epoch_ms, to_epoch_ms
+from writer_service import parse_address
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+STATUS_STORED = 0
+STATUS_DUPLICATE = 1
+STATUS_BUSY = 2
+STATUS_ERROR = 3
+STATUS_INVALID = 4
+
+MAX_READER_ID = 64
+MIN_UID, MAX_UID = 4, 10
+# Reader clocks are trusted for offline backlogs, not for scans from the future
+MAX_CLOCK_SKEW_MS = 5 * 60 * 1000
+
+_HEAD = struct.Struct(">BB")    # version, id_length
+_BODY = struct.Struct(">IqB")   # seq, timestamp, uid_length
+ACK = struct.Struct(">BBIQ")    # version, status, seq, log_id
+# Acks per UDP datagram, keeping replies within one Ethernet frame
+ACKS_PER_DATAGRAM = 100
+# Datagrams read per wake-up of the event loop
+UDP_READ_BATCH = 256
+
+# ``(reader_id, seq, timestamp_ms, uid)`` with the UID still raw bytes
+Frame = Tuple[bytes, int, int, bytes]
+
+
+class FrameError(ValueError):
+    """Raised when data cannot be parsed as frames; a stream cannot be resumed after it"""
+
+
+def encode_frame(reader_id: str, seq: int, uid: bytes, timestamp_ms: int = 0) -> bytes:
+    """One scan as a frame, for readers and load tests"""
+    reader = reader_id.encode()
+    return _HEAD.pack(VERSION, len(reader)) + reader + _BODY.pack(seq, timestamp_ms, len(uid)) + uid
+
+
+def decode_frames(data: bytes) -> Tuple[List[Frame], int]:
+    """Parse every complete frame at the start of ``data``; returns them and the bytes used"""
+    frames: List[Frame] = []
+    offset = 0
+    size = len(data)
+    while offset + _HEAD.size <= size:
+        version, id_length = _HEAD.unpack_from(data, offset)
+        if version != VERSION:
+            raise FrameError(f"Unsupported frame version {version}")
+        if not 0 < id_length <= MAX_READER_ID:
+            raise FrameError(f"Invalid reader id length {id_length}")
+        body = offset + _HEAD.size + id_length
+        if body + _BODY.size > size:
+            break
+        seq, timestamp_ms, uid_length = _BODY.unpack_from(data, body)
+        end = body + _BODY.size + uid_length
+        if end > size:
+            break
+        frames.append((bytes(data[offset + _HEAD.size:body]), seq, timestamp_ms,
+                       bytes(data[end - uid_length:end])))
+        offset = end
+    return frames, offset
+
+
+def decode_acks(data: bytes) -> List[Tuple[int, int, int]]:
+    """``(status, seq, log_id)`` for every ack in a datagram or stream chunk"""
+    acks = []
+    for offset in range(0, len(data) - ACK.size + 1, ACK.size):
+        _, status, seq, log_id = ACK.unpack_from(data, offset)
+        acks.append((status, seq, log_id))
+    return acks
+
+
+class _DatagramSocket:
+    """The UDP socket shared by every reader that sends datagrams
+
+    Read directly from a loop reader callback rather than through a datagram
+    transport, which takes one datagram per wake-up: a busy socket is
+    drained up to ``UDP_READ_BATCH`` datagrams at a time. Replies are sent
+    without buffering; one the kernel cannot take is dropped and the reader
+    resends its frame.
+    """
+
+    transport_name = "udp"
+
+    def __init__(self, server: "BinaryIngestServer", sock: socket.socket):
+        self.server = server
+        self.sock = sock
+        sock.setblocking(False)
+
+    def read_ready(self):
+        for _ in range(UDP_READ_BATCH):
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # e.g. ICMP port unreachable left behind by an ack to a reader that went away
+                logger.debug(f"UDP receive failed: {str(e)}")
+                continue
+            self.datagram_received(data, addr)
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            frames, used = decode_frames(data)
+        except FrameError as e:
+            # Nothing in the datagram can be trusted, not even the seq to reject
+            logger.debug(f"Dropped datagram from {addr}: {str(e)}")
+            metrics.SCANS_TOTAL.inc(transport="udp", result="invalid")
+            return
+        if used != len(data):
+            metrics.SCANS_TOTAL.inc(transport="udp", result="invalid")
+        for frame in frames:
+            self.server.submit(frame, self, addr)
+
+    def send_acks(self, acks: List[bytes], addr):
+        for start in range(0, len(acks), ACKS_PER_DATAGRAM):
+            try:
+                self.sock.sendto(b"".join(acks[start:start + ACKS_PER_DATAGRAM]), addr)
+            except OSError as e:
+                logger.debug(f"Dropped acks to {addr}: {str(e)}")
+
+
+class _StreamProtocol(asyncio.Protocol):
+    """One persistent reader connection; reads pause while too many of its scans are unacknowledged"""
+
+    transport_name = "tcp"
+
+    def __init__(self, server: "BinaryIngestServer"):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer = bytearray()
+        self.pending = 0
+        self.paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        self.buffer += data
+        try:
+            frames, used = decode_frames(self.buffer)
+        except FrameError as e:
+            logger.warning(f"Closing reader connection {self.transport.get_extra_info('peername')}: {str(e)}")
+            metrics.SCANS_TOTAL.inc(transport="tcp", result="invalid")
+            self.transport.close()
+            return
+        del self.buffer[:used]
+        self.pending += len(frames)
+        for frame in frames:
+            self.server.submit(frame, self, None)
+        if self.pending >= self.server.max_pending and not self.paused:
+            self.paused = True
+            self.transport.pause_reading()
+
+    def send_acks(self, acks: List[bytes], addr):
+        self.pending -= len(acks)
+        if self.transport.is_closing():
+            return
+        self.transport.write(b"".join(acks))
+        if self.paused and self.pending <= self.server.max_pending // 2:
+            self.paused = False
+            self.transport.resume_reading()
+
+
+class BinaryIngestServer:
+    """asyncio UDP/TCP listener that feeds binary frames into the ingest writer
+
+    The event loop runs on its own OS thread with an unpatched selector and
+    sockets, so it works the same beside the threading, eventlet or gevent
+    server and never waits on the green hub. It does no blocking work:
+    frames are queued on the writer with ``submit`` and acknowledged from
+    the futures' callbacks. Completed acks are handed back to the loop in
+    bulk, one wake-up per committed batch rather than one per scan, and
+    written out together per connection or UDP peer.
+    """
+
+    def __init__(self, writer: BatchWriter, udp_address: Optional[str] = None,
+                 tcp_address: Optional[str] = None, max_pending: int = 1000):
+        self.writer = writer
+        self.udp_address = udp_address
+        self.tcp_address = tcp_address
+        self.max_pending = max_pending
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # ``(protocol, addr, ack)`` completed on the writer thread, waiting to be sent
+        self._acks: Deque[Tuple[Any, Any, bytes]] = deque()
+        self._wakeup_pending = False
+        self._udp: Optional[_DatagramSocket] = None
+
+    def start(self):
+        """Bind the listeners and start the event loop thread; raises OSError if a port is taken"""
+        if self._thread and self._thread.is_alive():
+            return
+        self.loop = asyncio.SelectorEventLoop(native_selector())
+        try:
+            self.loop.run_until_complete(self._listen())
+        except BaseException:
+            if self._udp:
+                self._udp.sock.close()
+                self._udp = None
+            self.loop.close()
+            raise
+        self._thread = threading.Thread(target=self.loop.run_forever, name="binary-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop accepting frames; scans already queued are still committed by the writer"""
+        if not self._thread:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        if self._udp:
+            self.loop.remove_reader(self._udp.sock)
+            self._udp.sock.close()
+            self._udp = None
+        self.loop.close()
+
+    async def _listen(self):
+        if self.udp_address:
+            host, port = parse_address(self.udp_address)
+            sock = native_socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((host, port))
+            self._udp = _DatagramSocket(self, sock)
+            self.loop.add_reader(sock, self._udp.read_ready)
+            logger.info(f"Binary ingest listening on udp://{host}:{port}")
+        if self.tcp_address:
+            host, port = parse_address(self.tcp_address)
+            sock = native_socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+            sock.listen(128)
+            await self.loop.create_server(lambda: _StreamProtocol(self), sock=sock)
+            logger.info(f"Binary ingest listening on tcp://{host}:{port}")
+
+    def submit(self, frame: Frame, protocol, addr):
+        """Validate one frame and queue it on the writer (event loop thread)"""
+        reader, seq, timestamp_ms, uid = frame
+        timestamp: Optional[datetime] = None
+        try:
+            reader_id = reader.decode()
+            if not MIN_UID <= len(uid) <= MAX_UID:
+                raise ValueError(f"UID must be {MIN_UID}-{MAX_UID} bytes")
+            if timestamp_ms:
+                if timestamp_ms < 0 or timestamp_ms > to_epoch_ms(datetime.now()) + MAX_CLOCK_SKEW_MS:
+                    raise ValueError(f"Timestamp {timestamp_ms} is out of range")
+                timestamp = from_epoch_ms(timestamp_ms)
+        except ValueError as e:
+            logger.debug(f"Rejected frame {reader!r}/{seq}: {str(e)}")
+            self._complete(protocol, addr, "invalid", ACK.pack(VERSION, STATUS_INVALID, seq, 0))
+            return
+
+        try:
+            future = self.writer.submit(uid.hex().upper(), timestamp, reader_id, seq)
+        except IngestQueueFull:
+            self._complete(protocol, addr, "busy", ACK.pack(VERSION, STATUS_BUSY, seq, 0))
+            return
+        future.add_done_callback(lambda done: self._committed(done, protocol, addr, seq))
+
+    def _committed(self, future: Future, protocol, addr, seq: int):
+        """Future callback, on the writer thread once the scan's batch is done"""
+        error = future.exception()
+        if error is None:
+            self._complete(protocol, addr, "stored", ACK.pack(VERSION, STATUS_STORED, seq, future.result().id))
+        elif isinstance(error, DuplicateScan):
+            self._complete(protocol, addr, "duplicate", ACK.pack(VERSION, STATUS_DUPLICATE, seq, error.log.id))
+        else:
+            self._complete(protocol, addr, "error", ACK.pack(VERSION, STATUS_ERROR, seq, 0))
+
+    def _complete(self, protocol, addr, result: str, ack: bytes):
+        metrics.SCANS_TOTAL.inc(transport=protocol.transport_name, result=result)
+        self._acks.append((protocol, addr, ack))
+        # The loop clears the flag before draining, so an ack appended while it
+        # drains either makes that drain or schedules the next one
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            try:
+                self.loop.call_soon_threadsafe(self._send_acks)
+            except RuntimeError:
+                pass  # Loop stopped; the reader will retry
+
+    def _send_acks(self):
+        self._wakeup_pending = False
+        batches: Dict[Tuple[Any, Any], List[bytes]] = {}
+        acks = self._acks
+        while acks:
+            protocol, addr, ack = acks.popleft()
+            batches.setdefault((protocol, addr), []).append(ack)
+        for (protocol, addr), pending in batches.items():
+            try:
+                protocol.send_acks(pending, addr)
+            except Exception as e:
+                logger.warning(f"Failed to send acks: {str(e)}")
+
+
+def _send(args):
+    """Send one scan and print the ack, to try out a listener by hand"""
+    uid = bytes.fromhex(args.uid)
+    frame = encode_frame(args.reader_id, args.seq, uid, args.timestamp)
+    address = parse_address(args.address)
+    started = time.perf_counter()
+    if args.tcp:
+        with socket.create_connection(address, timeout=args.timeout) as sock:
+            sock.sendall(frame)
+            data = b""
+            while len(data) < ACK.size:
+                chunk = sock.recv(ACK.size - len(data))
+                if not chunk:
+                    raise SystemExit("Connection closed without an ack")
+                data += chunk
+    else:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(args.timeout)
+            sock.sendto(frame, address)
+            data = sock.recv(2048)
+    elapsed = (time.perf_counter() - started) * 1000
+    names = {STATUS_STORED: "stored", STATUS_DUPLICATE: "duplicate", STATUS_BUSY: "busy",
+             STATUS_ERROR: "error", STATUS_INVALID: "invalid"}
+    for status, seq, log_id in decode_acks(data):
+        print(f"seq {seq}: {names.get(status, status)}, log {log_id} ({elapsed:.1f} ms, {len(frame)}-byte frame)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a scan to a binary ingest listener")
+    parser.add_argument("uid", help="Card UID in hex, e.g. 71186E05")
+    parser.add_argument("--address", default="127.0.0.1:5005", help="Listener host:port")
+    parser.add_argument("--tcp", action="store_true", help="Use TCP instead of UDP")
+    parser.add_argument("--reader-id", default="reader-1")
+    parser.add_argument("--seq", type=int, default=int(time.time()) & 0x7FFFFFFF)
+    parser.add_argument("--timestamp", type=int, default=0, help="Epoch ms; 0 uses the server's clock")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds to wait for the ack")
+    _send(parser.parse_args())
@@ -0,0 +1,249 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+from flask import request
+from flask_socketio import SocketIO, join_room, leave_room
+
+from metrics import BROADCAST_DELAY_SECONDS, EMIT_SECONDS
+from runtime import offload
+
+logger = logging.getLogger(__name__)
+
+ALL_ROOM = "all"
+# Rooms a dashboard may subscribe to instead of the full stream
+ROOM_PREFIXES = ("dept:", "reader:")
+
+
+class Broadcaster:
+    """Coalesce committed logs into ``new_logs`` frames off the request path
+
+    ``publish`` only appends to a buffer. A background task flushes the
+    buffer every ``interval`` seconds as one frame per room (``all`` plus
+    any subscribed rooms such as ``dept:<name>`` or ``reader:<id>``), so a
+    burst of scans costs one emit per room rather than one per scan per client.
+
+    Clients acknowledge frames by ``seq``. A client more than ``max_unacked``
+    frames behind is skipped and sent a single ``resync`` event.
+
+    The last ``history_size`` published logs are kept for replay: a client
+    that (re)connects emits ``resume`` with the highest log id it has seen and
+    receives only the logs it missed, or is told to reload when they have
+    already left the buffer. Every frame carries the authoritative stats, so
+    client counters never drift.
+    """
+
+    def __init__(self, socketio: SocketIO, interval: float = 0.05, max_frame: int = 500,
+                 max_unacked: int = 20, history_size: int = 5000,
+                 stats_provider: Optional[Callable[[], Dict]] = None):
+        self.socketio = socketio
+        self.interval = interval
+        self.max_frame = max_frame
+        self.max_unacked = max_unacked
+        self.history_size = history_size
+        self.stats_provider = stats_provider
+        self._history: Deque[Tuple[int, Dict, Tuple[str, ...]]] = deque()
+        # Logs with ids at or below this are not in the history
+        self._floor_id = 0
+        self._pending: List[Tuple[Dict, Tuple[str, ...]]] = []
+        # When the oldest pending log was published, for the delivery delay metric
+        self._pending_since = 0.0
+        self._clients: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._running = False
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the last frame sent"""
+        return self._seq
+
+    def start(self, last_id: int = 0):
+        """Register the Socket.IO handlers and start the flush task (idempotent)
+
+        ``last_id`` is the newest log committed before publishing began; older
+        logs can only be fetched over HTTP.
+        """
+        if self._running:
+            return
+        self._running = True
+        self._floor_id = last_id
+        self._register_handlers()
+        self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        """Stop the flush task after its current cycle"""
+        self._running = False
+
+    def publish(self, log: Dict, rooms: Sequence[str] = ()):
+        """Queue a committed log for the next frame; never blocks on clients"""
+        rooms = tuple(rooms)
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.perf_counter()
+            self._pending.append((log, rooms))
+            self._history.append((log["id"], log, rooms))
+            if len(self._history) > self.history_size:
+                evicted_id = self._history.popleft()[0]
+                self._floor_id = max(self._floor_id, evicted_id)
+
+    def replay(self, last_id: int, rooms: Set[str]) -> Optional[List[Dict]]:
+        """Logs newer than ``last_id`` in ``rooms``, oldest first; None if some were evicted"""
+        with self._lock:
+            if last_id < self._floor_id:
+                return None
+            missed = [(log_id, log) for log_id, log, log_rooms in self._history
+                      if log_id > last_id and (ALL_ROOM in rooms or rooms.intersection(log_rooms))]
+        missed.sort(key=lambda entry: entry[0])
+        return [log for _, log in missed]
+
+    def client_count(self) -> int:
+        """Number of connected dashboards"""
+        with self._lock:
+            return len(self._clients)
+
+    def _register_handlers(self):
+        socketio = self.socketio
+
+        @socketio.on("connect")
+        def on_connect(auth=None):
+            join_room(ALL_ROOM)
+            with self._lock:
+                self._clients[request.sid] = {"rooms": {ALL_ROOM}, "unacked": deque(), "slow": False}
+
+        @socketio.on("disconnect")
+        def on_disconnect():
+            with self._lock:
+                self._clients.pop(request.sid, None)
+
+        @socketio.on("subscribe")
+        def on_subscribe(data):
+            rooms = {room for room in (data or {}).get("rooms", [])
+                     if isinstance(room, str) and room.startswith(ROOM_PREFIXES)}
+            self._set_rooms(request.sid, rooms or {ALL_ROOM})
+            return {"rooms": sorted(rooms or {ALL_ROOM})}
+
+        @socketio.on("unsubscribe")
+        def on_unsubscribe():
+            self._set_rooms(request.sid, {ALL_ROOM})
+            return {"rooms": [ALL_ROOM]}
+
+        @socketio.on("ack")
+        def on_ack(data):
+            seq = (data or {}).get("seq")
+            if not isinstance(seq, int):
+                return
+            with self._lock:
+                client = self._clients.get(request.sid)
+                if client is not None:
+                    unacked = client["unacked"]
+                    while unacked and unacked[0] <= seq:
+                        unacked.popleft()
+
+        @socketio.on("resume")
+        def on_resume(data):
+            data = data or {}
+            rooms = {room for room in data.get("rooms", [])
+                     if isinstance(room, str) and room.startswith(ROOM_PREFIXES)} or {ALL_ROOM}
+            self._set_rooms(request.sid, rooms)
+            with self._lock:
+                client = self._clients.get(request.sid)
+                if client is not None:
+                    client["unacked"].clear()
+                    client["slow"] = False
+                seq = self._seq
+
+            last_id = data.get("last_id")
+            logs = self.replay(last_id, rooms) if isinstance(last_id, int) else None
+            return {
+                "status": "ok" if logs is not None else "reload",
+                "logs": logs or [],
+                "seq": seq,
+                "rooms": sorted(rooms),
+                "stats": self._stats()
+            }
+
+        @socketio.on("resynced")
+        def on_resynced():
+            with self._lock:
+                client = self._clients.get(request.sid)
+                if client is not None:
+                    client["unacked"].clear()
+                    client["slow"] = False
+
+    def _set_rooms(self, sid: str, rooms: Set[str]):
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return
+            old_rooms = client["rooms"]
+            client["rooms"] = set(rooms)
+        for room in old_rooms - rooms:
+            leave_room(room)
+        for room in rooms - old_rooms:
+            join_room(room)
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Broadcast flush failed: {str(e)}")
+
+    def flush(self):
+        """Emit everything published since the last flush"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            pending_since = self._pending_since
+        if not batch:
+            return
+
+        stats = self._stats()
+        by_room: Dict[str, List[Dict]] = {ALL_ROOM: []}
+        for log, rooms in batch:
+            by_room[ALL_ROOM].append(log)
+            for room in rooms:
+                by_room.setdefault(room, []).append(log)
+
+        for room, logs in by_room.items():
+            for start in range(0, len(logs), self.max_frame):
+                seq, skip, lagging = self._track_frame(room)
+                if seq is None:
+                    break
+                frame = {"seq": seq, "room": room, "logs": logs[start:start + self.max_frame], "stats": stats}
+                for sid in lagging:
+                    self.socketio.emit("resync", {"seq": seq}, to=sid)
+                with EMIT_SECONDS.time():
+                    self.socketio.emit("new_logs", frame, to=room, skip_sid=skip or None)
+                BROADCAST_DELAY_SECONDS.observe(time.perf_counter() - pending_since)
+
+    def _stats(self) -> Optional[Dict]:
+        if self.stats_provider is None:
+            return None
+        try:
+            return offload(self.stats_provider)
+        except Exception as e:
+            logger.error(f"Failed to read stats for broadcast: {str(e)}")
+            return None
+
+    def _track_frame(self, room: str):
+        """Assign the next seq and work out which subscribers of ``room`` to skip"""
+        with self._lock:
+            receivers = [(sid, client) for sid, client in self._clients.items() if room in client["rooms"]]
+            if not receivers:
+                return None, [], []
+            self._seq += 1
+            skip, lagging = [], []
+            for sid, client in receivers:
+                if client["slow"]:
+                    skip.append(sid)
+                    continue
+                client["unacked"].append(self._seq)
+                if len(client["unacked"]) > self.max_unacked:
+                    client["slow"] = True
+                    skip.append(sid)
+                    lagging.append(sid)
+            return self._seq, skip, lagging
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict], None]
+
+
+class EventBus(ABC):
+    """Fan out JSON events to every process of a multi-worker deployment
+
+    ``publish`` delivers an event to the handler of every other process that
+    called ``start``; a process never receives its own events. Delivery is
+    at-most-once: a process only sees events published after it subscribed.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._handler: Optional[Handler] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @abstractmethod
+    def publish(self, event: Dict):
+        """Send ``event`` to the other processes"""
+
+    def start(self, handler: Handler):
+        """Subscribe and call ``handler(event)`` from a background thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._handler = handler
+        self._stop.clear()
+        self._subscribe()
+        self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop receiving events"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _subscribe(self):
+        """Start buffering events before ``start`` returns"""
+
+    @abstractmethod
+    def _run(self):
+        """Receive events until ``stop`` and pass them to ``_dispatch``"""
+
+    def _dispatch(self, origin: str, payload: str):
+        if origin == self.origin:
+            return
+        try:
+            self._handler(json.loads(payload))
+        except Exception as e:
+            logger.error(f"Event bus handler failed: {str(e)}")
+
+
+class SQLiteEventBus(EventBus):
+    """Event bus on a shared SQLite file, for single-host deployments without Redis
+
+    Events are rows in an append-only table that every subscriber polls by
+    id every ``poll_interval`` seconds. Rows older than ``retention``
+    seconds are pruned. The file is separate from the log database so bus
+    traffic never competes with the ingest writer for its lock.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.02, retention: float = 60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS bus_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+        self._cursor = 0
+        self._last_prune = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Events are transient; losing the last few on power failure is acceptable
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def publish(self, event: Dict):
+        payload = json.dumps(event, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT INTO bus_events (origin, payload, created) VALUES (?, ?, ?)',
+                               (self.origin, payload, now))
+            if now - self._last_prune > self.retention:
+                self._conn.execute('DELETE FROM bus_events WHERE created < ?', (now - self.retention,))
+                self._last_prune = now
+            self._conn.commit()
+
+    def _subscribe(self):
+        with self._lock:
+            self._cursor = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM bus_events').fetchone()[0]
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while not self._stop.is_set():
+                try:
+                    rows = conn.execute('SELECT id, origin, payload FROM bus_events WHERE id > ? ORDER BY id',
+                                        (self._cursor,)).fetchall()
+                except sqlite3.Error as e:
+                    logger.error(f"Event bus poll failed: {str(e)}")
+                    rows = []
+                for event_id, origin, payload in rows:
+                    self._cursor = event_id
+                    self._dispatch(origin, payload)
+                if not rows:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            conn.close()
+
+
+class RedisEventBus(EventBus):
+    """Event bus on a Redis pub/sub channel, for deployments spanning hosts
+
+    Requires ``pip install redis``.
+    """
+
+    def __init__(self, url: str, channel: str = "rfid-events"):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("EVENT_BUS_URL uses Redis but the 'redis' package is not installed")
+        self.channel = channel
+        self._redis = redis.Redis.from_url(url)
+        self._pubsub = None
+
+    def publish(self, event: Dict):
+        self._redis.publish(self.channel, f"{self.origin}:{json.dumps(event, separators=(',', ':'))}")
+
+    def _subscribe(self):
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                message = self._pubsub.get_message(timeout=1.0)
+            except Exception as e:
+                logger.error(f"Event bus receive failed: {str(e)}")
+                self._stop.wait(1.0)
+                continue
+            if message is None:
+                continue
+            origin, _, payload = message["data"].decode().partition(":")
+            self._dispatch(origin, payload)
+        self._pubsub.close()
+
+
+def create_bus(url: str) -> EventBus:
+    """Build the bus for ``sqlite:///path/to/bus.db`` or ``redis://host:port/db``"""
+    scheme = urlparse(url).scheme
+    if scheme == "sqlite":
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url[len("sqlite://"):]
+        return SQLiteEventBus(path)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisEventBus(url)
+    raise ValueError(f"Unsupported EVENT_BUS_URL scheme '{scheme}', expected sqlite:// or redis://")
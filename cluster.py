@@ -0,0 +1,92 @@
+"""Run the server as one writer process plus several web workers.
+
+The writer (``WORKER_ROLE=writer``) owns every database write and the
+scheduled maintenance jobs, and serves HTTP on ``--port``. Each web worker
+(``WORKER_ROLE=web``) serves HTTP and Socket.IO on ``--port + n``, forwards
+scans to the writer over ``WRITER_ADDRESS`` and learns about scans committed
+elsewhere from the event bus (``EVENT_BUS_URL``).
+
+Put a load balancer with sticky sessions (e.g. nginx ``ip_hash``) in front
+of the ports; Socket.IO long-polling needs every request of a session to
+reach the same worker.
+
+Usage:
+    python cluster.py --workers 4 --port 5000
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from config import Config
+from writer_service import connect, parse_address
+
+
+def spawn(role: str, port: int, mode: str) -> subprocess.Popen:
+    env = dict(os.environ, WORKER_ROLE=role, PORT=str(port), SERVER_MODE=mode)
+    return subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")],
+                            env=env)
+
+
+def wait_for_writer(writer: subprocess.Popen, timeout: float = 30.0):
+    """Block until the writer accepts RPC connections"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if writer.poll() is not None:
+            raise SystemExit(f"Writer exited with status {writer.returncode}")
+        try:
+            connect(parse_address(Config.WRITER_ADDRESS), Config.SECRET_KEY.encode(), timeout=1.0).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("Writer did not start listening in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='web workers besides the writer')
+    parser.add_argument('--port', type=int, default=Config.PORT, help='writer port; workers use the next ones')
+    parser.add_argument('--mode', default='eventlet' if Config.SERVER_MODE == 'threading' else Config.SERVER_MODE,
+                        help='SERVER_MODE of every process')
+    args = parser.parse_args()
+
+    writer = spawn('writer', args.port, args.mode)
+    wait_for_writer(writer)
+    processes: Dict[str, subprocess.Popen] = {'writer': writer}
+    for n in range(1, args.workers + 1):
+        processes[f'web-{n}'] = spawn('web', args.port + n, args.mode)
+    print(f"Cluster up: writer on port {args.port}, web workers on ports "
+          f"{args.port + 1}-{args.port + args.workers}")
+
+    def stop_all():
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def on_signal(signum, frame):
+        stop_all()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    # Any process dying takes the cluster down so a supervisor can restart it cleanly
+    while True:
+        exited: List[str] = [name for name, process in processes.items() if process.poll() is not None]
+        if exited:
+            print(f"{', '.join(exited)} exited; stopping the cluster")
+            stop_all()
+            sys.exit(1)
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,23 @@ class Config:
     HOST = os.environ.get('HOST', '0.0.0.0')
     PORT = int(os.environ.get('PORT', 5000))
     
+    # 'threading' runs the Werkzeug development server; 'eventlet' or 'gevent' serve production traffic
+    SERVER_MODE = os.environ.get('SERVER_MODE', 'threading').lower()
+    OFFLOAD_THREADS = int(os.environ.get('OFFLOAD_THREADS', 20))  # OS threads for blocking DB calls in green modes
+    
+    # Cluster settings: 'standalone' is a single process; 'writer' owns all DB writes and
+    # scheduled jobs for any number of 'web' workers (see cluster.py)
+    WORKER_ROLE = os.environ.get('WORKER_ROLE', 'standalone').lower()
+    WRITER_ADDRESS = os.environ.get('WRITER_ADDRESS', 'rfid_writer.sock')  # Unix socket path or host:port
+    EVENT_BUS_URL = os.environ.get('EVENT_BUS_URL', 'sqlite:///rfid_bus.db')  # or redis://host:6379/0
+    
     # SocketIO settings
-    SOCKETIO_ASYNC_MODE = 'threading'
+    SOCKETIO_ASYNC_MODE = SERVER_MODE
     SOCKETIO_CORS_ALLOWED_ORIGINS = "*"
+    BROADCAST_INTERVAL_MS = int(os.environ.get('BROADCAST_INTERVAL_MS', 50))  # frame coalescing window
+    BROADCAST_MAX_FRAME = int(os.environ.get('BROADCAST_MAX_FRAME', 500))  # logs per frame
+    BROADCAST_MAX_UNACKED = int(os.environ.get('BROADCAST_MAX_UNACKED', 20))  # frames before a client resyncs
+    BROADCAST_HISTORY_SIZE = int(os.environ.get('BROADCAST_HISTORY_SIZE', 5000))  # logs kept for resume replay
     
     # Application settings
     MAX_LOGS_DISPLAY = 50
@@ -24,7 +38,55 @@ class Config:
     DATABASE_PATH = os.environ.get('DATABASE_PATH', 'rfid_logs.db')
     DATABASE_BACKUP_ENABLED = os.environ.get('DATABASE_BACKUP_ENABLED', 'True').lower() == 'true'
     DATABASE_BACKUP_INTERVAL = int(os.environ.get('DATABASE_BACKUP_INTERVAL', 24))  # hours
-    DATABASE_CLEANUP_DAYS = int(os.environ.get('DATABASE_CLEANUP_DAYS', 90))
+    DATABASE_BACKUP_DIR = os.environ.get('DATABASE_BACKUP_DIR', 'database_backups')
+    DATABASE_BACKUP_FULL_EVERY = int(os.environ.get('DATABASE_BACKUP_FULL_EVERY', 7))  # runs per full backup
+    DATABASE_BACKUP_RETENTION_DAYS = int(os.environ.get('DATABASE_BACKUP_RETENTION_DAYS', 30))
+    DATABASE_CLEANUP_DAYS = int(os.environ.get('DATABASE_CLEANUP_DAYS', 90))  # 0 disables scheduled cleanup
+    DATABASE_CLEANUP_INTERVAL = int(os.environ.get('DATABASE_CLEANUP_INTERVAL', 24))  # hours
+    DATABASE_CLEANUP_BATCH_SIZE = int(os.environ.get('DATABASE_CLEANUP_BATCH_SIZE', 1000))  # rows per delete
+    DATABASE_CLEANUP_PAUSE_MS = int(os.environ.get('DATABASE_CLEANUP_PAUSE_MS', 50))  # pause between batches
+    DATABASE_ARCHIVE_ENABLED = os.environ.get('DATABASE_ARCHIVE_ENABLED', 'True').lower() == 'true'
+    DATABASE_ARCHIVE_DIR = os.environ.get('DATABASE_ARCHIVE_DIR', 'log_archives')
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 8))
+    # FULL is affordable because the ingest writer amortizes one fsync per batch
+    DATABASE_SYNCHRONOUS = os.environ.get('DATABASE_SYNCHRONOUS', 'FULL').upper()
+    DATABASE_CACHE_SIZE_KB = int(os.environ.get('DATABASE_CACHE_SIZE_KB', 16384))
+    DATABASE_MMAP_SIZE = int(os.environ.get('DATABASE_MMAP_SIZE', 256 * 1024 * 1024))
+    # Closed months are sealed into read-only files; 0 keeps every month in the main database
+    PARTITION_DIR = os.environ.get('PARTITION_DIR', 'partitions')
+    PARTITION_HOT_MONTHS = int(os.environ.get('PARTITION_HOT_MONTHS', 1))  # months kept in the main database
+    PARTITION_SEAL_INTERVAL = int(os.environ.get('PARTITION_SEAL_INTERVAL', 24))  # hours
+    
+    # Ingestion settings
+    INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 500))
+    INGEST_FLUSH_INTERVAL_MS = int(os.environ.get('INGEST_FLUSH_INTERVAL_MS', 2))
+    INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 10000))
+    INGEST_TIMEOUT = float(os.environ.get('INGEST_TIMEOUT', 10))  # seconds
+    INGEST_DEBOUNCE_MS = int(os.environ.get('INGEST_DEBOUNCE_MS', 2000))  # repeat reads of a card; 0 disables
+    # Binary frames from low-power readers (see binary_ingest.py), served by the
+    # process that owns the ingest writer; an empty host:port disables a transport
+    BINARY_INGEST_UDP = os.environ.get('BINARY_INGEST_UDP', '')  # e.g. 0.0.0.0:5005
+    BINARY_INGEST_TCP = os.environ.get('BINARY_INGEST_TCP', '')
+    BINARY_INGEST_MAX_PENDING = int(os.environ.get('BINARY_INGEST_MAX_PENDING', 1000))  # unacked scans per connection
+    
+    # Card registry settings
+    REGISTRY_CACHE_SIZE = int(os.environ.get('REGISTRY_CACHE_SIZE', 4096))  # cached UID lookups
+    
+    # Dashboard cache settings
+    RECENT_CACHE_SIZE = int(os.environ.get('RECENT_CACHE_SIZE', 1000))  # newest logs kept in memory
+    
+    # Reporting settings
+    ROLLUP_INTERVAL_SECONDS = float(os.environ.get('ROLLUP_INTERVAL_SECONDS', 5))  # report freshness
+    EXPORT_DIR = os.environ.get('EXPORT_DIR', 'exports')
+    EXPORT_RETENTION_HOURS = float(os.environ.get('EXPORT_RETENTION_HOURS', 24))  # finished files kept
+    
+    # Attendance session settings
+    SESSION_TIMEOUT_HOURS = float(os.environ.get('SESSION_TIMEOUT_HOURS', 16))  # open longer = missed check-out
+    SESSION_DEBOUNCE_SECONDS = float(os.environ.get('SESSION_DEBOUNCE_SECONDS', 30))  # repeated reads ignored
+    
+    # Monitoring settings
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'  # serve /metrics
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))  # log LogManager calls slower than this; 0 disables
     
     # Security settings
     MAX_LOG_LIMIT = 1000  # Maximum logs to return in single query
@@ -38,14 +100,55 @@ class Config:
             'DEBUG': cls.DEBUG,
             'HOST': cls.HOST,
             'PORT': cls.PORT,
+            'SERVER_MODE': cls.SERVER_MODE,
+            'OFFLOAD_THREADS': cls.OFFLOAD_THREADS,
+            'WORKER_ROLE': cls.WORKER_ROLE,
+            'WRITER_ADDRESS': cls.WRITER_ADDRESS,
+            'EVENT_BUS_URL': cls.EVENT_BUS_URL,
             'SOCKETIO_ASYNC_MODE': cls.SOCKETIO_ASYNC_MODE,
             'SOCKETIO_CORS_ALLOWED_ORIGINS': cls.SOCKETIO_CORS_ALLOWED_ORIGINS,
+            'BROADCAST_INTERVAL_MS': cls.BROADCAST_INTERVAL_MS,
+            'BROADCAST_MAX_FRAME': cls.BROADCAST_MAX_FRAME,
+            'BROADCAST_MAX_UNACKED': cls.BROADCAST_MAX_UNACKED,
+            'BROADCAST_HISTORY_SIZE': cls.BROADCAST_HISTORY_SIZE,
             'MAX_LOGS_DISPLAY': cls.MAX_LOGS_DISPLAY,
             'TOAST_DURATION': cls.TOAST_DURATION,
             'DATABASE_PATH': cls.DATABASE_PATH,
             'DATABASE_BACKUP_ENABLED': cls.DATABASE_BACKUP_ENABLED,
             'DATABASE_BACKUP_INTERVAL': cls.DATABASE_BACKUP_INTERVAL,
+            'DATABASE_BACKUP_DIR': cls.DATABASE_BACKUP_DIR,
+            'DATABASE_BACKUP_FULL_EVERY': cls.DATABASE_BACKUP_FULL_EVERY,
+            'DATABASE_BACKUP_RETENTION_DAYS': cls.DATABASE_BACKUP_RETENTION_DAYS,
             'DATABASE_CLEANUP_DAYS': cls.DATABASE_CLEANUP_DAYS,
+            'DATABASE_CLEANUP_INTERVAL': cls.DATABASE_CLEANUP_INTERVAL,
+            'DATABASE_CLEANUP_BATCH_SIZE': cls.DATABASE_CLEANUP_BATCH_SIZE,
+            'DATABASE_CLEANUP_PAUSE_MS': cls.DATABASE_CLEANUP_PAUSE_MS,
+            'DATABASE_ARCHIVE_ENABLED': cls.DATABASE_ARCHIVE_ENABLED,
+            'DATABASE_ARCHIVE_DIR': cls.DATABASE_ARCHIVE_DIR,
+            'DATABASE_POOL_SIZE': cls.DATABASE_POOL_SIZE,
+            'DATABASE_SYNCHRONOUS': cls.DATABASE_SYNCHRONOUS,
+            'DATABASE_CACHE_SIZE_KB': cls.DATABASE_CACHE_SIZE_KB,
+            'DATABASE_MMAP_SIZE': cls.DATABASE_MMAP_SIZE,
+            'PARTITION_DIR': cls.PARTITION_DIR,
+            'PARTITION_HOT_MONTHS': cls.PARTITION_HOT_MONTHS,
+            'PARTITION_SEAL_INTERVAL': cls.PARTITION_SEAL_INTERVAL,
+            'INGEST_BATCH_SIZE': cls.INGEST_BATCH_SIZE,
+            'INGEST_FLUSH_INTERVAL_MS': cls.INGEST_FLUSH_INTERVAL_MS,
+            'INGEST_QUEUE_SIZE': cls.INGEST_QUEUE_SIZE,
+            'INGEST_TIMEOUT': cls.INGEST_TIMEOUT,
+            'INGEST_DEBOUNCE_MS': cls.INGEST_DEBOUNCE_MS,
+            'BINARY_INGEST_UDP': cls.BINARY_INGEST_UDP,
+            'BINARY_INGEST_TCP': cls.BINARY_INGEST_TCP,
+            'BINARY_INGEST_MAX_PENDING': cls.BINARY_INGEST_MAX_PENDING,
+            'REGISTRY_CACHE_SIZE': cls.REGISTRY_CACHE_SIZE,
+            'RECENT_CACHE_SIZE': cls.RECENT_CACHE_SIZE,
+            'ROLLUP_INTERVAL_SECONDS': cls.ROLLUP_INTERVAL_SECONDS,
+            'EXPORT_DIR': cls.EXPORT_DIR,
+            'EXPORT_RETENTION_HOURS': cls.EXPORT_RETENTION_HOURS,
+            'SESSION_TIMEOUT_HOURS': cls.SESSION_TIMEOUT_HOURS,
+            'SESSION_DEBOUNCE_SECONDS': cls.SESSION_DEBOUNCE_SECONDS,
+            'METRICS_ENABLED': cls.METRICS_ENABLED,
+            'SLOW_QUERY_MS': cls.SLOW_QUERY_MS,
             'MAX_LOG_LIMIT': cls.MAX_LOG_LIMIT,
             'RATE_LIMIT_ENABLED': cls.RATE_LIMIT_ENABLED
         } 
\ No newline at end of file
@@ -1,58 +1,124 @@
-import sqlite3
-import shutil
 import os
+import shutil
+from contextlib import closing
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, List, Optional
 import logging
+from backup import BackupEngine, NAME_TIMESTAMP
+from models import DatabaseManager
+from partitions import PartitionManager
+from timeutils import from_epoch_ms
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BACKUP_EXTENSIONS = ('.db', '.db.gz', '.pages.gz')
+
+# Sealed partition files are mirrored once into this subdirectory of the backups
+PARTITION_BACKUP_DIR = 'partitions'
+
 class DatabaseUtils:
     """Utility class for database maintenance and backup operations"""
     
-    def __init__(self, db_path: str = "rfid_logs.db"):
-        self.db_path = db_path
-        self.backup_dir = "database_backups"
+    def __init__(self, db_path: str = "rfid_logs.db", db_manager: Optional[DatabaseManager] = None,
+                 backup_dir: str = "database_backups", partitions: Optional[PartitionManager] = None):
+        self.db_manager = db_manager or DatabaseManager(db_path)
+        self.db_path = self.db_manager.db_path
+        self.backup_dir = backup_dir
+        self.partitions = partitions
         
         # Create backup directory if it doesn't exist
         if not os.path.exists(self.backup_dir):
             os.makedirs(self.backup_dir)
+        
+        self.backup_engine = BackupEngine(self.db_manager, self.backup_dir)
+        self._backup_runs = 0
+        self._restore_listeners: List[Callable[[], None]] = []
     
-    def create_backup(self, backup_name: Optional[str] = None) -> str:
-        """Create a backup of the database"""
+    def add_restore_listener(self, callback: Callable[[], None]):
+        """Call ``callback()`` after every restore, to drop state cached from the old database"""
+        self._restore_listeners.append(callback)
+    
+    def create_backup(self, backup_name: Optional[str] = None, compress: Optional[bool] = None) -> str:
+        """Create a full online backup of the database"""
         try:
             if not os.path.exists(self.db_path):
                 raise FileNotFoundError(f"Database file not found: {self.db_path}")
             
-            if backup_name is None:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_name = f"rfid_logs_backup_{timestamp}.db"
-            
-            backup_path = os.path.join(self.backup_dir, backup_name)
+            backup_path = self.backup_engine.full_backup(backup_name, compress)
+            self.backup_partitions()
+            return backup_path
             
-            # Create backup
-            shutil.copy2(self.db_path, backup_path)
+        except Exception as e:
+            logger.error(f"Failed to create backup: {str(e)}")
+            raise
+    
+    def create_incremental_backup(self) -> str:
+        """Back up only the pages changed since the last backup"""
+        try:
+            if not os.path.exists(self.db_path):
+                raise FileNotFoundError(f"Database file not found: {self.db_path}")
             
-            logger.info(f"Database backup created: {backup_path}")
+            backup_path = self.backup_engine.incremental_backup()
+            self.backup_partitions()
             return backup_path
             
         except Exception as e:
-            logger.error(f"Failed to create backup: {str(e)}")
+            logger.error(f"Failed to create incremental backup: {str(e)}")
             raise
     
+    def backup_partitions(self) -> int:
+        """Copy sealed partition files not yet in the backup directory; returns files copied
+        
+        Sealed files never change, so each is copied once rather than with
+        every backup of the hot database.
+        """
+        if self.partitions is None:
+            return 0
+        target_dir = os.path.join(self.backup_dir, PARTITION_BACKUP_DIR)
+        os.makedirs(target_dir, exist_ok=True)
+        copied = 0
+        for partition in self.partitions.catalog():
+            source = self.partitions.path(partition)
+            target = os.path.join(target_dir, partition.file)
+            if os.path.exists(target) or not os.path.exists(source):
+                continue
+            shutil.copyfile(source, target + '.part')
+            os.replace(target + '.part', target)
+            copied += 1
+        if copied:
+            logger.info(f"Backed up {copied} partition files")
+        return copied
+    
+    def run_scheduled_backup(self, full_every: int = 7, days_to_keep: int = 30) -> str:
+        """Take the next scheduled backup, then prune old backup files
+        
+        Every ``full_every``-th run starts a new chain with a full backup;
+        the runs in between are incremental.
+        """
+        if self._backup_runs % max(full_every, 1) == 0:
+            backup_path = self.create_backup()
+        else:
+            backup_path = self.create_incremental_backup()
+        self._backup_runs += 1
+        self.cleanup_old_backups(days_to_keep)
+        return backup_path
+    
     def restore_backup(self, backup_path: str) -> bool:
-        """Restore database from backup"""
+        """Restore database from a full or incremental backup"""
         try:
             if not os.path.exists(backup_path):
                 raise FileNotFoundError(f"Backup file not found: {backup_path}")
             
             # Create a backup of current database before restore
-            current_backup = self.create_backup(f"pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+            current_backup = self.create_backup(f"pre_restore_{datetime.now().strftime(NAME_TIMESTAMP)}.db.gz")
             
-            # Restore from backup
-            shutil.copy2(backup_path, self.db_path)
+            # Restore through the backup API so open connections see the new pages
+            self.backup_engine.restore(backup_path)
+            self._restore_partitions()
+            for callback in self._restore_listeners:
+                callback()
             
             logger.info(f"Database restored from backup: {backup_path}")
             logger.info(f"Previous state backed up to: {current_backup}")
@@ -62,10 +128,43 @@ class DatabaseUtils:
             logger.error(f"Failed to restore backup: {str(e)}")
             raise
     
+    def _restore_partitions(self):
+        """Bring back partition files the restored catalog lists but the partition directory lacks"""
+        if self.partitions is None:
+            return
+        source_dir = os.path.join(self.backup_dir, PARTITION_BACKUP_DIR)
+        for partition in self.partitions.catalog():
+            path = self.partitions.path(partition)
+            source = os.path.join(source_dir, partition.file)
+            if os.path.exists(path):
+                continue
+            if not os.path.exists(source):
+                logger.error(f"Partition {partition.month} is missing and has no backup")
+                continue
+            os.makedirs(self.partitions.directory, exist_ok=True)
+            shutil.copyfile(source, path)
+            os.chmod(path, 0o444)
+            logger.info(f"Restored partition file {partition.file}")
+    
+    def list_backups(self) -> list:
+        """Get every backup file, oldest first"""
+        backup_files = []
+        if os.path.exists(self.backup_dir):
+            for file in sorted(os.listdir(self.backup_dir)):
+                if file.endswith(BACKUP_EXTENSIONS):
+                    file_path = os.path.join(self.backup_dir, file)
+                    backup_files.append({
+                        'name': file,
+                        'type': 'incremental' if file.endswith('.pages.gz') else 'full',
+                        'size': os.path.getsize(file_path),
+                        'modified': datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
+                    })
+        return backup_files
+    
     def get_database_info(self) -> dict:
         """Get database information and statistics"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db_manager.connection() as conn:
                 cursor = conn.cursor()
                 
                 # Get table info
@@ -77,52 +176,63 @@ class DatabaseUtils:
                 
                 # Get row counts
                 cursor.execute("SELECT COUNT(*) FROM card_logs")
-                total_logs = cursor.fetchone()[0]
+                hot_logs = cursor.fetchone()[0]
                 
                 # Get oldest and newest log dates
                 cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM card_logs")
                 date_range = cursor.fetchone()
-                oldest_date = date_range[0] if date_range[0] else None
-                newest_date = date_range[1] if date_range[1] else None
-                
-                # Get backup files info
-                backup_files = []
-                if os.path.exists(self.backup_dir):
-                    for file in os.listdir(self.backup_dir):
-                        if file.endswith('.db'):
-                            file_path = os.path.join(self.backup_dir, file)
-                            backup_files.append({
-                                'name': file,
-                                'size': os.path.getsize(file_path),
-                                'modified': datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
-                            })
-                
-                return {
-                    'database_path': self.db_path,
-                    'database_size_bytes': db_size,
-                    'database_size_mb': round(db_size / (1024 * 1024), 2),
-                    'tables': tables,
-                    'total_logs': total_logs,
-                    'oldest_log': oldest_date,
-                    'newest_log': newest_date,
-                    'backup_count': len(backup_files),
-                    'backup_files': backup_files,
-                    'last_backup': max([b['modified'] for b in backup_files]) if backup_files else None
-                }
-                
+            
+            partitions = self.partitions.catalog() if self.partitions else []
+            partition_info = self.partitions.info() if self.partitions else {}
+            oldest = date_range[0]
+            if partitions:
+                # The oldest partition holds the oldest log, unless a late scan in the hot table is older
+                with closing(self.partitions.open(partitions[0])) as sealed:
+                    first = sealed.execute("SELECT MIN(timestamp) FROM card_logs").fetchone()[0]
+                oldest = min(ts for ts in (oldest, first) if ts is not None)
+            total_logs = hot_logs + partition_info.get('partition_rows', 0)
+            oldest_date = from_epoch_ms(oldest).isoformat() if oldest else None
+            newest_date = from_epoch_ms(date_range[1]).isoformat() if date_range[1] else None
+            
+            # Get backup files info
+            backup_files = self.list_backups()
+            
+            return {
+                'database_path': self.db_path,
+                'database_size_bytes': db_size,
+                'database_size_mb': round(db_size / (1024 * 1024), 2),
+                'tables': tables,
+                'total_logs': total_logs,
+                'oldest_log': oldest_date,
+                'newest_log': newest_date,
+                'backup_count': len(backup_files),
+                'backup_files': backup_files,
+                'last_backup': max([b['modified'] for b in backup_files]) if backup_files else None,
+                'hot_logs': hot_logs,
+                **partition_info
+            }
+            
         except Exception as e:
             logger.error(f"Failed to get database info: {str(e)}")
             raise
     
     def optimize_database(self) -> dict:
-        """Optimize database performance"""
+        """Optimize database performance
+        
+        Only the hot database is analyzed, vacuumed and reindexed; sealed
+        partitions are written compact and indexed and never change.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db_manager.connection() as conn:
                 cursor = conn.cursor()
                 
                 # Get initial size
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
                 initial_size = os.path.getsize(self.db_path)
                 
+                # Merge the search index so deleted logs stop taking space
+                cursor.execute("INSERT INTO card_logs_fts (card_logs_fts) VALUES ('optimize')")
+                
                 # Analyze tables for better query planning
                 cursor.execute("ANALYZE")
                 
@@ -133,6 +243,7 @@ class DatabaseUtils:
                 cursor.execute("REINDEX")
                 
                 # Get final size
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
                 final_size = os.path.getsize(self.db_path)
                 
                 space_saved = initial_size - final_size
@@ -157,9 +268,23 @@ class DatabaseUtils:
             cutoff_date = datetime.now() - timedelta(days=days_to_keep)
             deleted_count = 0
             
+            # Files of the active incremental chain are needed for restores
+            keep = set(self.backup_engine.chain_files())
+            
+            # Mirrored partitions go once retention has dropped them and they are old enough
+            partition_dir = os.path.join(self.backup_dir, PARTITION_BACKUP_DIR)
+            if self.partitions is not None and os.path.isdir(partition_dir):
+                catalogued = {partition.file for partition in self.partitions.catalog()}
+                for file in os.listdir(partition_dir):
+                    file_path = os.path.join(partition_dir, file)
+                    if file not in catalogued and datetime.fromtimestamp(os.path.getmtime(file_path)) < cutoff_date:
+                        os.remove(file_path)
+                        deleted_count += 1
+                        logger.info(f"Deleted old partition backup: {file}")
+            
             if os.path.exists(self.backup_dir):
                 for file in os.listdir(self.backup_dir):
-                    if file.endswith('.db'):
+                    if file.endswith(BACKUP_EXTENSIONS + ('.hashes',)) and file not in keep:
                         file_path = os.path.join(self.backup_dir, file)
                         file_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
                         
@@ -0,0 +1,397 @@
+import argparse
+import importlib
+import logging
+import os
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from partitions import Window
+from registry import UNKNOWN_USER
+from timeutils import from_epoch_ms
+
+if TYPE_CHECKING:
+    from models import DatabaseManager
+    from partitions import PartitionManager
+    from retention import ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+REPORTS = ("logs", "daily", "totals")
+
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# One worksheet holds 1,048,576 rows including the header
+XLSX_MAX_ROWS = 1048575
+
+CSV_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Files being written are hidden until they are complete
+_PARTIAL_PREFIX = "."
+
+
+def _require(module: str, feature: str):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise RuntimeError(f"{feature} needs the '{module}' package: pip install {module}")
+
+
+def local_times(epoch_ms):
+    """Naive local datetimes for an array of epoch-ms timestamps
+
+    UTC offsets only change on quarter-hour boundaries, so ``time.localtime``
+    is consulted once per distinct quarter hour rather than per timestamp.
+    """
+    np = _require("numpy", "Export")
+    pd = _require("pandas", "Export")
+    epoch_ms = np.asarray(epoch_ms, dtype="int64")
+    quarters, index = np.unique(epoch_ms // 900000, return_inverse=True)
+    offsets = np.array([time.localtime(int(quarter) * 900).tm_gmtoff for quarter in quarters], dtype="int64")
+    offsets *= 1000
+    return pd.to_datetime(epoch_ms + offsets[index], unit="ms")
+
+
+def _xlsx_engine() -> str:
+    """xlsxwriter is markedly faster than openpyxl, so prefer it when installed"""
+    try:
+        _require("xlsxwriter", "XLSX export")
+        return "xlsxwriter"
+    except RuntimeError:
+        _require("openpyxl", "XLSX export")
+        return "openpyxl"
+
+
+def check_format(export_format: str):
+    """Raise ValueError for an unknown format, RuntimeError if its packages are missing"""
+    if export_format not in FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(FORMATS)}")
+    _require("pandas", "Export")
+    if export_format == "parquet":
+        _require("pyarrow", "Parquet export")
+    elif export_format == "xlsx":
+        _xlsx_engine()
+
+
+class ExportManager:
+    """Write report files from ``card_logs`` using columnar pandas operations
+
+    Logs are read in large keyset-paged chunks straight into DataFrames;
+    names, local times and the per-user daily first-in/last-out are derived
+    with vectorized operations rather than per-row ``CardLog`` objects.
+    Files are written under a temporary name and renamed when complete, and
+    files older than ``retention_hours`` are pruned. Ranges reaching into
+    sealed months read them window by window through ``partitions``.
+
+    Requires ``pip install pandas``, plus ``pyarrow`` for Parquet and
+    ``xlsxwriter`` (or ``openpyxl``) for XLSX. XLSX is written cell by cell
+    and is far slower than CSV or Parquet for large ranges.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", export_dir: str = "exports",
+                 chunk_size: int = 250000, retention_hours: float = 24,
+                 partitions: Optional["PartitionManager"] = None):
+        self.db_manager = db_manager
+        self.export_dir = export_dir
+        self.chunk_size = chunk_size
+        self.retention_hours = retention_hours
+        self.partitions = partitions
+
+    def export(self, progress: Optional["ProgressCallback"], report: str, export_format: str,
+               start_ms: int, end_ms: int, user: Optional[str] = None, uid: Optional[str] = None) -> Dict:
+        """Write one report file for logs in ``[start_ms, end_ms)``; returns its metadata"""
+        if report not in REPORTS:
+            raise ValueError(f"Report must be one of: {', '.join(REPORTS)}")
+        check_format(export_format)
+        started = time.perf_counter()
+        os.makedirs(self.export_dir, exist_ok=True)
+        self.prune()
+
+        name = "{}_{}_{}_{}.{}".format(report, from_epoch_ms(start_ms).strftime("%Y%m%d"),
+                                       from_epoch_ms(end_ms - 1).strftime("%Y%m%d"), uuid.uuid4().hex[:8],
+                                       export_format)
+        path = os.path.join(self.export_dir, name)
+        partial = os.path.join(self.export_dir, _PARTIAL_PREFIX + name)
+        try:
+            with self.db_manager.connection() as conn:
+                conditions, params = self._filters(conn, start_ms, end_ms, user, uid)
+                if self.partitions is None:
+                    windows = [Window((), True, None, None)]
+                else:
+                    windows = self.partitions.windows(conn, start_ms, end_ms)
+                total = 0
+                for window in windows:
+                    with self._attach(conn, window) as source:
+                        total += conn.execute(f'SELECT COUNT(*) FROM {source} l WHERE {" AND ".join(conditions)}',
+                                              params).fetchall()[0][0]
+            if progress:
+                progress(0, total)
+            if report == "logs":
+                if export_format == "xlsx" and total > XLSX_MAX_ROWS:
+                    raise ValueError(f"{total} logs exceed the {XLSX_MAX_ROWS} rows of a worksheet; "
+                                     "use csv or parquet")
+                rows = self._write_logs(partial, export_format, windows, conditions, params, progress, total)
+            else:
+                daily = self._daily(windows, conditions, params, progress, total)
+                frame = daily if report == "daily" else self._totals(daily)
+                rows = len(frame)
+                self._write_frame(partial, export_format, frame, report)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Exported {report} report of {total} logs to {name} in {elapsed:.1f}s")
+        return {"file": name, "report": report, "format": export_format, "logs": total, "rows": rows,
+                "size": os.path.getsize(path), "seconds": round(elapsed, 3)}
+
+    def list_files(self) -> List[Dict]:
+        """Finished export files, newest first"""
+        self.prune()
+        if not os.path.isdir(self.export_dir):
+            return []
+        files = []
+        for entry in os.scandir(self.export_dir):
+            if entry.is_file() and not entry.name.startswith(_PARTIAL_PREFIX):
+                stat = entry.stat()
+                files.append({"file": entry.name, "size": stat.st_size,
+                              "created": datetime.fromtimestamp(stat.st_mtime).isoformat()})
+        return sorted(files, key=lambda f: f["created"], reverse=True)
+
+    def prune(self) -> int:
+        """Delete export files older than the retention window; returns files removed"""
+        if not self.retention_hours or not os.path.isdir(self.export_dir):
+            return 0
+        cutoff = time.time() - self.retention_hours * 3600
+        removed = 0
+        for entry in os.scandir(self.export_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Failed to remove expired export {entry.name}: {str(e)}")
+        return removed
+
+    @staticmethod
+    def _filters(conn, start_ms: int, end_ms: int, user: Optional[str],
+                 uid: Optional[str]) -> Tuple[List[str], List]:
+        conditions = ['l.timestamp >= ?', 'l.timestamp < ?']
+        params: List = [start_ms, end_ms]
+        if user is not None:
+            if user.isdigit():
+                user_id = int(user)
+            else:
+                row = conn.execute('SELECT id FROM users WHERE name = ?', (user,)).fetchone()
+                user_id = row[0] if row else -1
+            conditions.append('l.user_id = ?')
+            params.append(user_id)
+        if uid is not None:
+            conditions.append('l.uid = ?')
+            params.append(uid)
+        return conditions, params
+
+    def _attach(self, conn, window: Window):
+        return self.partitions.attach(conn, window) if self.partitions else nullcontext("card_logs")
+
+    def _chunks(self, windows: List[Window], conditions: List[str], params: List,
+                progress: Optional["ProgressCallback"], total: int, ordered: bool = True) -> Iterator:
+        """DataFrames of ``id, timestamp, uid, user_id, reader_id`` plus local ``time``
+
+        Ordered chunks follow ``(timestamp, id)`` through the timestamp
+        index. Aggregates do not need an order and read id ranges instead,
+        which scans the table sequentially rather than looking up each row.
+        Each chunk is its own short read so an export never pins an old WAL
+        snapshot. Partition windows are read one after the other.
+        """
+        pd = _require("pandas", "Export")
+        where = " AND ".join(conditions)
+        select = 'SELECT l.id, l.timestamp, l.uid, COALESCE(l.user_id, 0), l.reader_id FROM {} l'
+        done = 0
+        for window in windows:
+            if ordered:
+                pages = self._ordered_pages(window, select, where, params)
+            else:
+                pages = self._id_range_pages(window, select, where, params)
+            for rows in pages:
+                frame = pd.DataFrame.from_records(rows, columns=["id", "timestamp", "uid", "user_id", "reader_id"])
+                frame["time"] = local_times(frame["timestamp"].to_numpy())
+                yield frame
+                done += len(rows)
+                if progress:
+                    progress(done, total)
+
+    def _ordered_pages(self, window: Window, select: str, where: str, params: List) -> Iterator[List[Tuple]]:
+        last: List = []
+        while True:
+            keyset = ' AND (l.timestamp, l.id) > (?, ?)' if last else ''
+            with self.db_manager.connection() as conn, self._attach(conn, window) as source:
+                query = f'{select.format(source)} WHERE {where}{keyset} ORDER BY l.timestamp, l.id LIMIT ?'
+                rows = conn.execute(query, params + last + [self.chunk_size]).fetchall()
+            if rows:
+                yield rows
+            if len(rows) < self.chunk_size:
+                return
+            last = [rows[-1][1], rows[-1][0]]
+
+    def _id_range_pages(self, window: Window, select: str, where: str, params: List) -> Iterator[List[Tuple]]:
+        with self.db_manager.connection() as conn, self._attach(conn, window) as source:
+            first_id, last_id = conn.execute(f'SELECT MIN(l.id), MAX(l.id) FROM {source} l WHERE {where}',
+                                             params).fetchall()[0]
+        if first_id is None:
+            return
+        after_id = first_id - 1
+        while after_id < last_id:
+            upto_id = after_id + self.chunk_size
+            with self.db_manager.connection() as conn, self._attach(conn, window) as source:
+                rows = conn.execute(f'{select.format(source)} WHERE {where} AND l.id > ? AND l.id <= ?',
+                                    params + [after_id, upto_id]).fetchall()
+            if rows:
+                yield rows
+            after_id = upto_id
+
+    def _users(self):
+        """Registered users indexed by id"""
+        pd = _require("pandas", "Export")
+        with self.db_manager.connection() as conn:
+            rows = conn.execute('SELECT id, name, department FROM users').fetchall()
+        return pd.DataFrame(rows, columns=["user_id", "user", "department"]).set_index("user_id")
+
+    @staticmethod
+    def _add_users(frame, users):
+        frame["user"] = frame["user_id"].map(users["user"]).fillna(UNKNOWN_USER)
+        frame["department"] = frame["user_id"].map(users["department"])
+        return frame
+
+    def _write_logs(self, path: str, export_format: str, windows: List[Window], conditions: List[str],
+                    params: List, progress: Optional["ProgressCallback"], total: int) -> int:
+        columns = ["id", "time", "uid", "user", "department", "reader_id"]
+        users = self._users()
+        chunks = (self._add_users(chunk, users)
+                  for chunk in self._chunks(windows, conditions, params, progress, total))
+        if export_format == "xlsx":
+            pd = _require("pandas", "Export")
+            frames = [chunk[columns] for chunk in chunks]
+            frame = pd.concat(frames) if frames else pd.DataFrame(columns=columns)
+            self._write_frame(path, export_format, frame, "logs")
+            return len(frame)
+
+        rows = 0
+        if export_format == "parquet":
+            pa = _require("pyarrow", "Parquet export")
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([("id", pa.int64()), ("time", pa.timestamp("ms")), ("uid", pa.string()),
+                                ("user", pa.string()), ("department", pa.string()), ("reader_id", pa.string())])
+            with pq.ParquetWriter(path, schema) as writer:
+                for chunk in chunks:
+                    writer.write_table(pa.Table.from_pandas(chunk[columns], schema=schema, preserve_index=False))
+                    rows += len(chunk)
+            return rows
+
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            for chunk in chunks:
+                chunk[columns].to_csv(f, header=rows == 0, index=False, date_format=CSV_TIME_FORMAT)
+                rows += len(chunk)
+            if rows == 0:
+                f.write(",".join(columns) + "\n")
+        return rows
+
+    def _daily(self, windows: List[Window], conditions: List[str], params: List,
+               progress: Optional["ProgressCallback"], total: int):
+        """First-in, last-out and scan count per user and local day
+
+        Scans of registered users are combined across their cards; unknown
+        cards are reported one per UID.
+        """
+        pd = _require("pandas", "Export")
+        keys = ["date", "user_id", "card"]
+        partials = []
+        for chunk in self._chunks(windows, conditions, params, progress, total, ordered=False):
+            chunk["date"] = chunk["time"].dt.normalize()
+            chunk["card"] = chunk["uid"].where(chunk["user_id"] == 0, "")
+            partials.append(chunk.groupby(keys, sort=False).agg(
+                first_in=("time", "min"), last_out=("time", "max"), scans=("id", "size")))
+        if not partials:
+            return pd.DataFrame(columns=["date", "user_id", "user", "department", "uid",
+                                         "first_in", "last_out", "scans", "hours"])
+
+        # A day split across chunks is merged here
+        daily = pd.concat(partials).groupby(level=keys, sort=True).agg(
+            first_in=("first_in", "min"), last_out=("last_out", "max"), scans=("scans", "sum")).reset_index()
+        daily = self._add_users(daily, self._users())
+        daily["hours"] = ((daily["last_out"] - daily["first_in"]).dt.total_seconds() / 3600).round(2)
+        daily["first_in"] = daily["first_in"].dt.floor("s")
+        daily["last_out"] = daily["last_out"].dt.floor("s")
+        daily["date"] = daily["date"].dt.strftime("%Y-%m-%d")
+        daily = daily.rename(columns={"card": "uid"})
+        return daily[["date", "user_id", "user", "department", "uid", "first_in", "last_out", "scans", "hours"]]
+
+    @staticmethod
+    def _totals(daily):
+        """Per-user days present, scans, hours and average first-in/last-out times"""
+        pd = _require("pandas", "Export")
+        if daily.empty:
+            return pd.DataFrame(columns=["user_id", "user", "department", "uid", "days", "scans", "hours",
+                                         "avg_hours", "avg_first_in", "avg_last_out", "first_scan", "last_scan"])
+        first_in = daily["first_in"] - daily["first_in"].dt.normalize()
+        last_out = daily["last_out"] - daily["last_out"].dt.normalize()
+        daily = daily.assign(first_in_of_day=first_in, last_out_of_day=last_out)
+        totals = daily.groupby(["user_id", "uid"], sort=False).agg(
+            user=("user", "first"), department=("department", "first"), days=("date", "size"),
+            scans=("scans", "sum"), hours=("hours", "sum"),
+            avg_first_in=("first_in_of_day", "mean"), avg_last_out=("last_out_of_day", "mean"),
+            first_scan=("first_in", "min"), last_scan=("last_out", "max")).reset_index()
+        totals["hours"] = totals["hours"].round(2)
+        totals["avg_hours"] = (totals["hours"] / totals["days"]).round(2)
+        for column in ("avg_first_in", "avg_last_out"):
+            seconds = totals[column].dt.total_seconds().round().astype("int64")
+            totals[column] = ((seconds // 3600).map("{:02d}".format) + ":"
+                              + (seconds % 3600 // 60).map("{:02d}".format))
+        totals = totals.sort_values(["hours", "user"], ascending=[False, True])
+        return totals[["user_id", "user", "department", "uid", "days", "scans", "hours", "avg_hours",
+                       "avg_first_in", "avg_last_out", "first_scan", "last_scan"]]
+
+    @staticmethod
+    def _write_frame(path: str, export_format: str, frame, sheet: str):
+        if export_format == "csv":
+            frame.to_csv(path, index=False, date_format=CSV_TIME_FORMAT)
+        elif export_format == "parquet":
+            frame.to_parquet(path, index=False, engine="pyarrow")
+        else:
+            pd = _require("pandas", "Export")
+            with pd.ExcelWriter(path, engine=_xlsx_engine()) as writer:
+                frame.to_excel(writer, sheet_name=sheet, index=False)
+
+
+if __name__ == "__main__":
+    from config import Config
+    from models import DatabaseManager
+    from partitions import PartitionManager
+    from timeutils import parse_time_param, to_epoch_ms
+
+    parser = argparse.ArgumentParser(description="Export logs and attendance reports")
+    parser.add_argument("report", choices=REPORTS)
+    parser.add_argument("--format", default="csv", choices=list(FORMATS))
+    parser.add_argument("--from", dest="start", help="Epoch ms, ISO datetime or YYYY-MM-DD (default: 30 days ago)")
+    parser.add_argument("--to", dest="end", help="Epoch ms, ISO datetime or YYYY-MM-DD (default: now)")
+    parser.add_argument("--user", help="User id or exact name")
+    parser.add_argument("--uid", help="Card UID")
+    parser.add_argument("--db", default=Config.DATABASE_PATH, help="Database file path")
+    parser.add_argument("--out-dir", default=Config.EXPORT_DIR, help="Directory for the export file")
+    args = parser.parse_args()
+
+    end = parse_time_param(args.end, end_of_day=True) or to_epoch_ms(datetime.now())
+    start = parse_time_param(args.start) or end - 30 * 24 * 3600 * 1000
+    db_manager = DatabaseManager(args.db)
+    exports = ExportManager(db_manager, args.out_dir, retention_hours=0,
+                            partitions=PartitionManager(db_manager, Config.PARTITION_DIR))
+    print(exports.export(None, args.report, args.format, start, end, args.user,
+                         args.uid.strip().upper() if args.uid else None))
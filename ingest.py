@@ -0,0 +1,229 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from metrics import INGEST_BATCH_SIZE
+from models import CardLog, LogManager
+from registry import Registry
+from timeutils import to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# ``(uid, timestamp, reader_id, seq)`` as queued by ``submit``
+Entry = Tuple[str, datetime, Optional[str], Optional[int]]
+
+# Largest reader sequence number; the binary protocol carries it in 4 bytes
+MAX_SEQ = 2 ** 32 - 1
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept more scans"""
+
+
+class DuplicateScan(Exception):
+    """Raised instead of inserting a repeat of an accepted scan
+
+    ``reason`` is ``"debounced"`` for a re-read of the same card within the
+    debounce window and ``"retry"`` for a reader resending a ``(reader_id,
+    seq)`` it already delivered. ``log`` is the scan that was kept.
+    """
+
+    def __init__(self, log: CardLog, reason: str):
+        super().__init__(f"Duplicate scan ({reason}) of log {log.id}")
+        self.log = log
+        self.reason = reason
+
+
+class BatchWriter:
+    """Background writer that group-commits queued card scans
+
+    Request handlers submit scans and wait on a future; a single writer
+    thread drains the queue and commits everything that arrived within
+    ``flush_interval`` seconds (or ``max_batch`` scans) in one transaction.
+
+    Repeats are dropped before they reach the database, so they cost no
+    insert, broadcast or statistics update: a card seen again within
+    ``debounce_ms`` of its last sighting (a card held at the antenna is one
+    scan), and a ``(reader_id, seq)`` key that was already stored (a reader
+    retrying after a timeout). Their futures fail with ``DuplicateScan``
+    carrying the scan that was kept. Only the writer thread touches the
+    recent-UID map, so it needs no lock.
+    """
+
+    def __init__(self, log_manager: LogManager, max_batch: int = 500,
+                 flush_interval: float = 0.002, max_queue: int = 10000,
+                 debounce_ms: int = 0, recent_keys: int = 10000):
+        self.log_manager = log_manager
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.debounce_ms = debounce_ms
+        self.recent_keys = recent_keys
+        self._queue: "queue.Queue[Tuple[Entry, Future]]" = queue.Queue(maxsize=max_queue)
+        # uid -> (last time the card was seen, the scan that was kept), in epoch ms
+        self._last_seen: Dict[str, Tuple[int, CardLog]] = {}
+        self._last_sweep = 0
+        self._keys: "OrderedDict[Tuple[str, int], CardLog]" = OrderedDict()
+        self._forget = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the writer thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush pending scans and stop the writer thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def invalidate(self):
+        """Forget the recent UIDs and keys before the next batch, e.g. after a restore"""
+        self._forget.set()
+
+    def qsize(self) -> int:
+        """Number of scans waiting to be committed"""
+        return self._queue.qsize()
+
+    def submit(self, uid: str, timestamp: Optional[datetime] = None, reader_id: Optional[str] = None,
+               seq: Optional[int] = None) -> Future:
+        """Queue a scan; the future resolves to its CardLog once committed"""
+        if seq is not None and not (isinstance(seq, int) and 0 <= seq <= MAX_SEQ):
+            raise ValueError(f"seq must be an integer from 0 to {MAX_SEQ}")
+        future: Future = Future()
+        try:
+            self._queue.put_nowait(((uid, timestamp or datetime.now(), reader_id, seq), future))
+        except queue.Full:
+            raise IngestQueueFull("Ingestion queue is full")
+        return future
+
+    def add_log(self, uid: str, timeout: Optional[float] = None, timestamp: Optional[datetime] = None,
+                reader_id: Optional[str] = None, seq: Optional[int] = None) -> CardLog:
+        """Queue a scan and block until its batch is durable; raises DuplicateScan for repeats"""
+        return self.submit(uid, timestamp, reader_id, seq).result(timeout)
+
+    def _collect(self) -> List[Tuple[Entry, Future]]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if not batch:
+                continue
+            INGEST_BATCH_SIZE.observe(len(batch))
+            if self._forget.is_set():
+                self._forget.clear()
+                self._last_seen, self._keys = {}, OrderedDict()
+
+            try:
+                self._commit(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    logger.error(f"Failed to commit scan: {str(e)}")
+                    batch[0][1].set_exception(e)
+                    continue
+                # One bad scan must not fail everyone else's: retry them one by one
+                logger.warning(f"Failed to commit batch of {len(batch)} scans, retrying singly: {str(e)}")
+                for item in batch:
+                    try:
+                        self._commit([item])
+                    except Exception as error:
+                        logger.error(f"Failed to commit scan: {str(error)}")
+                        item[1].set_exception(error)
+
+    def _commit(self, batch: List[Tuple[Entry, Future]]):
+        """Insert a batch in one transaction and resolve its futures; raises without touching them"""
+        accepted, repeats, seen = self._deduplicate(batch)
+        entries = [entry for entry, _ in accepted]
+        logs = self.log_manager.add_logs_bulk(entries, chunk_size=len(entries)) if entries else []
+
+        for (_, future), log in zip(accepted, logs):
+            future.set_result(log)
+            if log.reader_id is not None and log.seq is not None:
+                self._remember_key((log.reader_id, log.seq), log)
+        for uid, (seen_ms, kept) in seen.items():
+            self._last_seen[uid] = (seen_ms, logs[kept] if isinstance(kept, int) else kept)
+        for future, reason, kept in repeats:
+            future.set_exception(DuplicateScan(logs[kept] if isinstance(kept, int) else kept, reason))
+
+    def _deduplicate(self, batch: List[Tuple[Entry, Future]]):
+        """Split a batch into scans to insert and repeats of scans already kept
+
+        Repeats refer to the kept scan either as a CardLog or, when it is in
+        this same batch, by its index among the accepted scans. ``seen`` holds
+        the recent-UID map updates to apply once the batch is committed.
+        """
+        accepted: List[Tuple[Entry, Future]] = []
+        repeats: List[Tuple[Future, str, Union[int, CardLog]]] = []
+        seen: Dict[str, Tuple[int, Union[int, CardLog]]] = {}
+        batch_keys: Dict[Tuple[str, int], int] = {}
+
+        keys = [(reader_id, seq) for (_, _, reader_id, seq), _ in batch
+                if reader_id is not None and seq is not None]
+        stored = self.log_manager.find_keyed([key for key in keys if key not in self._keys]) if keys else {}
+
+        for entry, future in batch:
+            uid, timestamp, reader_id, seq = entry
+            key = (reader_id, seq) if reader_id is not None and seq is not None else None
+            if key is not None:
+                kept = batch_keys.get(key)
+                if kept is None:
+                    kept = self._keys.get(key) or stored.get(key)
+                if kept is not None:
+                    repeats.append((future, "retry", kept))
+                    continue
+
+            uid = Registry.normalize_uid(uid)
+            timestamp_ms = to_epoch_ms(timestamp)
+            if self.debounce_ms > 0:
+                last = seen.get(uid) or self._last_seen.get(uid)
+                if last is not None and abs(timestamp_ms - last[0]) < self.debounce_ms:
+                    # Sliding window: a card left at the reader keeps being ignored
+                    seen[uid] = (max(timestamp_ms, last[0]), last[1])
+                    repeats.append((future, "debounced", last[1]))
+                    continue
+                seen[uid] = (timestamp_ms, len(accepted))
+            if key is not None:
+                batch_keys[key] = len(accepted)
+            accepted.append((entry, future))
+
+        self._sweep()
+        return accepted, repeats, seen
+
+    def _remember_key(self, key: Tuple[str, int], log: CardLog):
+        self._keys[key] = log
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.recent_keys:
+            self._keys.popitem(last=False)
+
+    def _sweep(self):
+        """Expire recent-UID entries outside the debounce window, at most once per window"""
+        now_ms = to_epoch_ms(datetime.now())
+        if self.debounce_ms <= 0 or now_ms - self._last_sweep < self.debounce_ms:
+            return
+        self._last_seen = {uid: last for uid, last in self._last_seen.items()
+                           if now_ms - last[0] < self.debounce_ms}
+        self._last_sweep = now_ms
@@ -0,0 +1,88 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobManager:
+    """Run long maintenance operations in the background and track their progress
+
+    Jobs run one at a time on a single worker thread, so two cleanups never
+    compete for the write lock. The job function receives a
+    ``progress(done, total)`` callback as its first argument.
+    """
+
+    def __init__(self, max_history: int = 100):
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job")
+
+    def submit(self, kind: str, func: Callable, *args, **kwargs) -> str:
+        """Queue ``func(progress, *args, **kwargs)`` and return its job id"""
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "done": 0,
+            "total": None,
+            "result": None,
+            "error": None,
+            "created": datetime.now().isoformat(),
+            "started": None,
+            "finished": None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.max_history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest["status"] in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get a snapshot of one job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self) -> List[Dict]:
+        """Get snapshots of every tracked job, newest first"""
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs, optionally waiting for queued ones"""
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Dict, func: Callable, args, kwargs):
+        def progress(done: int, total: Optional[int] = None):
+            with self._lock:
+                job["done"] = done
+                job["total"] = total
+
+        with self._lock:
+            job["status"] = "running"
+            job["started"] = datetime.now().isoformat()
+        try:
+            result = func(progress, *args, **kwargs)
+            with self._lock:
+                job["status"] = "completed"
+                job["result"] = result
+        except Exception as e:
+            logger.error(f"Job {job['kind']} ({job['id']}) failed: {str(e)}")
+            with self._lock:
+                job["status"] = "failed"
+                job["error"] = str(e)
+        finally:
+            with self._lock:
+                job["finished"] = datetime.now().isoformat()
@@ -0,0 +1,704 @@
+"""Load-test a running server with concurrent dashboards and scanning readers.
+
+Three scenarios:
+
+``saturate`` (default) connects ``--clients`` Socket.IO dashboards, then has
+``--readers`` threads POST scans to ``/log`` back to back for ``--seconds``.
+Reports sustained scans/sec, ``/log`` latency percentiles, how many
+dashboards stayed connected and the delay between a scan being accepted and
+each dashboard receiving it.
+
+``fleet`` simulates a site: ``--readers`` readers tap the registered cards
+at ``--rate`` scans/sec on average, following a compressed working day
+(``--profile shift``: quiet, shift-start rush, lunch, shift-end rush), each
+numbering its scans with ``reader_id``/``seq`` and waiting for one reply at
+a time like the firmware. Meanwhile ``--clients`` dashboards stay connected
+over Socket.IO and each polls ``/api/logs``, ``/api/stats`` and
+``/api/search`` every ``--poll-interval`` seconds. Scan latency is measured
+from the moment a scan was due, so a server that falls behind shows up in
+the percentiles instead of slowing the readers down. Results are reported
+overall and per phase of the day. Seed the server's database with
+``seed_data.py`` first.
+
+``binary`` has ``--readers`` readers send frames to the server's binary
+listener (``BINARY_INGEST_UDP``/``BINARY_INGEST_TCP``, see binary_ingest.py)
+at ``--binary-address`` over ``--transport udp`` or ``tcp``, each keeping
+``--window`` scans in flight and sending the next as soon as one is
+acknowledged. Reports acknowledged scans/sec, ack latency and dashboard
+delivery like ``saturate``.
+
+Every run prints its results as JSON; ``--output`` saves them and
+``--baseline`` compares the run against saved results. ``--compare OLD NEW``
+compares two saved runs without running anything.
+
+``--url`` takes a comma-separated list to spread dashboards and readers
+round-robin over the workers started by ``cluster.py``.
+
+Requires the Socket.IO client extras: ``pip install "python-socketio[client]"``.
+
+Usage:
+    SERVER_MODE=eventlet python server.py &
+    python loadtest.py --url http://localhost:5000 --clients 500 --readers 16 --seconds 30
+    python loadtest.py --url http://localhost:5001,http://localhost:5002 --clients 500
+    python loadtest.py --scenario fleet --readers 40 --rate 200 --clients 50 --seconds 120 --output after.json
+    python loadtest.py --scenario binary --transport tcp --readers 50 --window 100 --clients 10
+    python loadtest.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+import socketio
+
+from binary_ingest import ACK, STATUS_BUSY, STATUS_DUPLICATE, STATUS_STORED, decode_acks, encode_frame
+from writer_service import parse_address
+
+# (name, share of the run, relative scan rate) of a working day compressed into one run
+PROFILES = {
+    "shift": (
+        ("quiet", 0.10, 0.2),
+        ("shift start", 0.15, 3.0),
+        ("morning", 0.20, 0.5),
+        ("lunch", 0.15, 2.0),
+        ("afternoon", 0.20, 0.5),
+        ("shift end", 0.15, 3.0),
+        ("evening", 0.05, 0.2),
+    ),
+    "flat": (
+        ("steady", 1.0, 1.0),
+    ),
+}
+
+# Server-side means read from ``/metrics`` around a fleet run: (name, histogram, labels)
+SERVER_SERIES = (
+    ("log_ms", "rfid_http_request_duration_seconds", 'method="POST",route="/log",status="200"'),
+    ("api_logs_ms", "rfid_http_request_duration_seconds", 'method="GET",route="/api/logs",status="200"'),
+    ("api_stats_ms", "rfid_http_request_duration_seconds", 'method="GET",route="/api/stats",status="200"'),
+    ("api_search_ms", "rfid_http_request_duration_seconds", 'method="GET",route="/api/search",status="200"'),
+    ("insert_commit_ms", "rfid_log_manager_duration_seconds", 'method="insert_commit"'),
+    ("broadcast_delay_ms", "rfid_broadcast_delay_seconds", ''),
+    ("batch_size", "rfid_ingest_batch_size", ''),
+)
+
+# How ``compare`` judges a change, by words in the metric path; anything else is neutral
+LOWER_IS_BETTER = ("latency", "lag", "_ms", "failures", "duplicates", "busy", "unacked", "connect_seconds")
+HIGHER_IS_BETTER = ("per_sec", "stored", "connected", "with_every_scan")
+# Arguments that do not change what a run measures
+RUN_ONLY_ARGS = ("output", "baseline", "compare")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_ms(values: List[float]) -> Dict[str, float]:
+    """p50/p99/max of durations in seconds, as milliseconds"""
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p99": round(percentile(values, 99) * 1000, 2),
+        "max": round(max(values, default=0) * 1000, 2)
+    }
+
+
+class Dashboard:
+    """A websocket client that acks frames like the browser dashboard does"""
+
+    def __init__(self, url: str, accepted_at: Dict[int, float]):
+        self.accepted_at = accepted_at
+        self.received = 0
+        self.lags: List[float] = []
+        self.client = socketio.Client(reconnection=False)
+        self.client.on("new_logs", self._on_frame)
+        self.client.on("resync", self._on_resync)
+        self.client.connect(url, transports=["websocket"], wait_timeout=10)
+        self.client.emit("resume", {"last_id": None, "rooms": []})
+
+    def _on_frame(self, frame):
+        now = time.perf_counter()
+        for log in frame["logs"]:
+            accepted = self.accepted_at.get(log["id"])
+            if accepted is not None:
+                self.lags.append(now - accepted)
+        self.received += len(frame["logs"])
+        self.client.emit("ack", {"seq": frame["seq"]})
+
+    def _on_resync(self, data):
+        self.client.emit("resume", {"last_id": None, "rooms": []})
+
+    @property
+    def connected(self) -> bool:
+        return self.client.connected
+
+    def close(self):
+        if self.client.connected:
+            self.client.disconnect()
+
+
+def connect_dashboards(urls: List[str], clients: int, connect_concurrency: int,
+                       accepted_at: Dict[int, float]) -> Tuple[List[Dashboard], int, float]:
+    """Open dashboards in parallel waves; returns them, the failure count and the time taken"""
+    dashboards: List[Dashboard] = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def connect_some(first: int, count: int):
+        for n in range(first, first + count):
+            try:
+                dashboard = Dashboard(urls[n % len(urls)], accepted_at)
+                with lock:
+                    dashboards.append(dashboard)
+            except Exception:
+                with lock:
+                    failures[0] += 1
+
+    started = time.perf_counter()
+    concurrency = max(1, connect_concurrency)
+    per_thread = [clients // concurrency + (1 if i < clients % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=connect_some, args=(sum(per_thread[:i]), n))
+               for i, n in enumerate(per_thread) if n]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dashboards, failures[0], time.perf_counter() - started
+
+
+def dashboard_summary(dashboards: List[Dashboard], expected: int) -> Dict:
+    """Connection and delivery results; closes the dashboards"""
+    lags = [lag for dashboard in dashboards for lag in dashboard.lags]
+    connected = sum(1 for dashboard in dashboards if dashboard.connected)
+    complete = sum(1 for dashboard in dashboards if dashboard.received >= expected)
+    for dashboard in dashboards:
+        dashboard.close()
+    return {"connected": connected, "with_every_scan": complete, "lags": lags}
+
+
+def run(urls: List[str], clients: int, readers: int, seconds: float, connect_concurrency: int) -> dict:
+    accepted_at: Dict[int, float] = {}
+    failures = {"log": 0}
+    lock = threading.Lock()
+
+    dashboards, connect_failures, connect_seconds = connect_dashboards(urls, clients, connect_concurrency,
+                                                                       accepted_at)
+
+    latencies: List[float] = []
+    stop = threading.Event()
+
+    def reader(reader_id: int):
+        url = urls[reader_id % len(urls)]
+        session = requests.Session()
+        count = 0
+        while not stop.is_set():
+            count += 1
+            sent = time.perf_counter()
+            try:
+                response = session.post(f"{url}/log", data={"uid": f"LT{reader_id:03d}{count:07d}"}, timeout=30)
+                done = time.perf_counter()
+                if response.status_code == 200:
+                    accepted_at[response.json()["log"]["id"]] = done
+                    with lock:
+                        latencies.append(done - sent)
+                else:
+                    with lock:
+                        failures["log"] += 1
+            except requests.RequestException:
+                with lock:
+                    failures["log"] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Give in-flight frames a moment to arrive
+    time.sleep(1.0)
+    expected = len(latencies)
+    delivery = dashboard_summary(dashboards, expected)
+
+    return {
+        "workers": len(urls),
+        "clients_requested": clients,
+        "clients_connected": delivery["connected"],
+        "clients_with_every_scan": delivery["with_every_scan"],
+        "connect_failures": connect_failures,
+        "connect_seconds": round(connect_seconds, 2),
+        "readers": readers,
+        "seconds": round(elapsed, 2),
+        "scans": expected,
+        "scan_failures": failures["log"],
+        "scans_per_sec": round(expected / elapsed, 1),
+        "log_latency_ms": latency_ms(latencies),
+        "delivery_lag_ms": {
+            "p50": round(percentile(delivery["lags"], 50) * 1000, 2),
+            "p99": round(percentile(delivery["lags"], 99) * 1000, 2)
+        }
+    }
+
+
+def load_cards(url: str) -> List[Dict]:
+    """Registered cards of the seeded database, so scans resolve to real users"""
+    try:
+        response = requests.get(f"{url}/api/cards", timeout=60)
+        response.raise_for_status()
+        return response.json()["cards"]
+    except (requests.RequestException, ValueError, KeyError):
+        return []
+
+
+def scrape_metrics(urls: List[str]) -> Dict[str, float]:
+    """``_sum``/``_count`` samples of every worker's ``/metrics``, added up across workers"""
+    totals: Dict[str, float] = {}
+    for url in urls:
+        try:
+            response = requests.get(f"{url}/metrics", timeout=10)
+        except requests.RequestException:
+            continue
+        if response.status_code != 200:
+            continue
+        for line in response.text.splitlines():
+            series, _, value = line.rpartition(" ")
+            if not line.startswith("#") and ("_sum" in series or "_count" in series):
+                totals[series] = totals.get(series, 0.0) + float(value)
+    return totals
+
+
+def server_means(before: Dict[str, float], after: Dict[str, float]) -> Optional[Dict[str, float]]:
+    """Mean of each ``SERVER_SERIES`` over the run, as the server measured it; None without metrics"""
+    if not after:
+        return None
+    means = {}
+    for name, metric, labels in SERVER_SERIES:
+        suffix = f"{{{labels}}}" if labels else ""
+        count = after.get(f"{metric}_count{suffix}", 0) - before.get(f"{metric}_count{suffix}", 0)
+        total = after.get(f"{metric}_sum{suffix}", 0) - before.get(f"{metric}_sum{suffix}", 0)
+        scale = 1000 if name.endswith("_ms") else 1
+        means[name] = round(total / count * scale, 2) if count else None
+    return means
+
+
+def run_fleet(urls: List[str], clients: int, readers: int, rate: float, seconds: float, profile: str,
+              poll_interval: float, pollers: int, connect_concurrency: int, seed: int) -> dict:
+    phases = PROFILES[profile]
+    # Scale the profile so ``rate`` is the average over the whole run
+    mean_weight = sum(share * weight for _, share, weight in phases)
+    bounds = []
+    position = 0.0
+    for _, share, _ in phases:
+        position += share
+        bounds.append(position * seconds)
+
+    def phase_at(offset: float) -> int:
+        for index, bound in enumerate(bounds):
+            if offset < bound:
+                return index
+        return len(phases) - 1
+
+    cards = load_cards(urls[0])
+    uids = [card["uid"] for card in cards] or [f"LT{n:06d}" for n in range(1000)]
+    # Prefixes of card UIDs and owner names, the way people search the dashboard
+    terms = ([card["uid"][:4] for card in cards[:200]] + [card["user"].split()[0] for card in cards[:200]]
+             or ["LT00"])
+    # Fresh reader ids per run; reusing a (reader_id, seq) key would be answered as a duplicate
+    run_id = uuid.uuid4().hex[:6]
+    # Cards come round in a shuffled cycle: a card tapped again within seconds is debounced as a duplicate
+    deck = uids[:]
+    random.Random(seed).shuffle(deck)
+    dealt = [0]
+
+    accepted_at: Dict[int, float] = {}
+    lock = threading.Lock()
+
+    def next_card() -> str:
+        with lock:
+            dealt[0] += 1
+            return deck[dealt[0] % len(deck)]
+    scans: List[Tuple[int, float]] = []
+    outcomes = {"stored": 0, "duplicates": 0, "failures": 0}
+    endpoint_latencies: Dict[str, List[float]] = {"logs": [], "stats": [], "search": []}
+    endpoint_failures = {name: 0 for name in endpoint_latencies}
+
+    dashboards, connect_failures, connect_seconds = connect_dashboards(urls, clients, connect_concurrency,
+                                                                       accepted_at)
+    metrics_before = scrape_metrics(urls)
+    started = time.perf_counter() + 0.5
+
+    def reader(n: int):
+        rng = random.Random(seed * 100003 + n)
+        url = urls[n % len(urls)]
+        session = requests.Session()
+        reader_id = f"lt-{run_id}-{n:03d}"
+        per_reader = rate / mean_weight / readers
+        seq = 0
+        due = started
+        while True:
+            due += rng.expovariate(per_reader * phases[phase_at(due - started)][2])
+            if due - started >= seconds:
+                return
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            seq += 1
+            try:
+                response = session.post(f"{url}/log", data={"uid": next_card(), "reader_id": reader_id,
+                                                             "seq": seq}, timeout=30)
+                done = time.perf_counter()
+                body = response.json() if response.status_code == 200 else None
+            except (requests.RequestException, ValueError):
+                done, body = time.perf_counter(), None
+            with lock:
+                if body is None:
+                    outcomes["failures"] += 1
+                    continue
+                scans.append((phase_at(due - started), done - due))
+                if body.get("duplicate"):
+                    outcomes["duplicates"] += 1
+                else:
+                    outcomes["stored"] += 1
+                    accepted_at[body["log"]["id"]] = done
+
+    def poller(n: int, share: int):
+        rng = random.Random(seed * 100019 + n)
+        url = urls[n % len(urls)]
+        session = requests.Session()
+        # ``share`` dashboards polling every ``poll_interval`` seconds each
+        interval = poll_interval / share
+        due = started + rng.uniform(0, interval)
+        while due - started < seconds:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for name, path in (("logs", "/api/logs?limit=50"), ("stats", "/api/stats"),
+                               ("search", f"/api/search?q={rng.choice(terms)}&limit=50")):
+                sent = time.perf_counter()
+                try:
+                    ok = session.get(f"{url}{path}", timeout=30).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                with lock:
+                    if ok:
+                        endpoint_latencies[name].append(time.perf_counter() - sent)
+                    else:
+                        endpoint_failures[name] += 1
+            due += interval
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    if clients:
+        pollers = max(1, min(pollers, clients))
+        threads += [threading.Thread(target=poller, args=(n, clients // pollers + (1 if n < clients % pollers else 0)))
+                    for n in range(pollers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Give in-flight frames a moment to arrive
+    time.sleep(1.0)
+    delivery = dashboard_summary(dashboards, outcomes["stored"])
+    server = server_means(metrics_before, scrape_metrics(urls))
+
+    phase_results = []
+    for index, (name, share, weight) in enumerate(phases):
+        latencies = [latency for phase, latency in scans if phase == index]
+        phase_results.append({
+            "phase": name,
+            "target_per_sec": round(rate * weight / mean_weight, 1),
+            "scans_per_sec": round(len(latencies) / (share * seconds), 1),
+            "log_latency_ms": latency_ms(latencies)
+        })
+
+    return {
+        "workers": len(urls),
+        "readers": readers,
+        "rate": rate,
+        "profile": profile,
+        "seconds": round(elapsed, 2),
+        "cards": len(cards),
+        "scans": {
+            "sent": len(scans) + outcomes["failures"],
+            **outcomes,
+            "per_sec": round(len(scans) / elapsed, 1),
+            "log_latency_ms": latency_ms([latency for _, latency in scans])
+        },
+        "phases": phase_results,
+        "endpoints": {
+            name: {
+                "requests": len(latencies),
+                "failures": endpoint_failures[name],
+                "per_sec": round(len(latencies) / elapsed, 1),
+                "latency_ms": latency_ms(latencies)
+            } for name, latencies in endpoint_latencies.items()
+        },
+        "dashboards": {
+            "requested": clients,
+            "connected": delivery["connected"],
+            "with_every_scan": delivery["with_every_scan"],
+            "connect_failures": connect_failures,
+            "connect_seconds": round(connect_seconds, 2)
+        },
+        "delivery_lag_ms": latency_ms(delivery["lags"]),
+        # Compare with the client-side numbers to tell server time from load-generator contention
+        "server": server
+    }
+
+
+def run_binary(urls: List[str], address: str, transport: str, clients: int, readers: int, window: int,
+               seconds: float, connect_concurrency: int) -> dict:
+    accepted_at: Dict[int, float] = {}
+    dashboards, connect_failures, connect_seconds = connect_dashboards(urls, clients, connect_concurrency,
+                                                                       accepted_at)
+    metrics_before = scrape_metrics(urls)
+
+    host, port = parse_address(address)
+    run_id = uuid.uuid4().hex[:6]
+    latencies: List[float] = []
+    outcomes = {"stored": 0, "duplicates": 0, "busy": 0, "failures": 0}
+    outcome_of = {STATUS_STORED: "stored", STATUS_DUPLICATE: "duplicates", STATUS_BUSY: "busy"}
+    deadline = time.perf_counter() + seconds
+
+    class Reader(asyncio.Protocol):
+        """One reader over a UDP or TCP transport, refilling its window as acks come back"""
+
+        def __init__(self, n: int):
+            self.n = n
+            self.reader_id = f"lt-{run_id}-{n:03d}"
+            self.seq = 0
+            self.sent: Dict[int, float] = {}
+            self.buffer = b""
+            self.transport = None
+
+        def connection_made(self, transport):
+            self.transport = transport
+            self.send(window)
+
+        def send(self, count: int):
+            now = time.perf_counter()
+            frames = []
+            for _ in range(count):
+                self.seq += 1
+                self.sent[self.seq] = now
+                # Unique UIDs, so no scan is debounced
+                frames.append(encode_frame(self.reader_id, self.seq, struct.pack(">HI", self.n, self.seq)))
+            if transport == "udp":
+                self.transport.sendto(b"".join(frames))
+            else:
+                self.transport.write(b"".join(frames))
+
+        def data_received(self, data: bytes):
+            data = self.buffer + data
+            usable = len(data) - len(data) % ACK.size
+            self.buffer = data[usable:]
+            self.acknowledged(data[:usable])
+
+        def datagram_received(self, data: bytes, addr):
+            self.acknowledged(data)
+
+        def error_received(self, exc):
+            pass
+
+        def acknowledged(self, data: bytes):
+            now = time.perf_counter()
+            acks = decode_acks(data)
+            for status, seq, log_id in acks:
+                sent = self.sent.pop(seq, None)
+                if sent is None:
+                    continue
+                latencies.append(now - sent)
+                outcomes[outcome_of.get(status, "failures")] += 1
+                if status == STATUS_STORED:
+                    accepted_at[log_id] = now
+            if acks and now < deadline:
+                self.send(len(acks))
+
+    async def drive() -> Tuple[int, int]:
+        loop = asyncio.get_running_loop()
+        fleet: List[Reader] = []
+        for n in range(readers):
+            if transport == "udp":
+                _, reader = await loop.create_datagram_endpoint(lambda n=n: Reader(n), remote_addr=(host, port))
+            else:
+                _, reader = await loop.create_connection(lambda n=n: Reader(n), host, port)
+            fleet.append(reader)
+        await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+        # Scans in flight at the deadline still count once acknowledged
+        for _ in range(100):
+            if not any(reader.sent for reader in fleet):
+                break
+            await asyncio.sleep(0.05)
+        for reader in fleet:
+            reader.transport.close()
+        return sum(reader.seq for reader in fleet), sum(len(reader.sent) for reader in fleet)
+
+    started = time.perf_counter()
+    sent, unacked = asyncio.run(drive())
+    elapsed = time.perf_counter() - started
+
+    # Give in-flight frames a moment to arrive
+    time.sleep(1.0)
+    delivery = dashboard_summary(dashboards, outcomes["stored"])
+    server = server_means(metrics_before, scrape_metrics(urls))
+
+    return {
+        "workers": len(urls),
+        "transport": transport,
+        "readers": readers,
+        "window": window,
+        "seconds": round(elapsed, 2),
+        "scans": {
+            "sent": sent,
+            **outcomes,
+            "unacked": unacked,
+            "per_sec": round(len(latencies) / elapsed, 1),
+            "ack_latency_ms": latency_ms(latencies)
+        },
+        "dashboards": {
+            "requested": clients,
+            "connected": delivery["connected"],
+            "with_every_scan": delivery["with_every_scan"],
+            "connect_failures": connect_failures,
+            "connect_seconds": round(connect_seconds, 2)
+        },
+        "delivery_lag_ms": latency_ms(delivery["lags"]),
+        "server": server
+    }
+
+
+def flatten(results, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves keyed by dotted path; list items are keyed by their ``phase`` name"""
+    flat: Dict[str, float] = {}
+    if isinstance(results, dict):
+        items = results.items()
+    elif isinstance(results, list):
+        items = ((item.get("phase", str(index)) if isinstance(item, dict) else str(index), item)
+                 for index, item in enumerate(results))
+    else:
+        if isinstance(results, (int, float)) and not isinstance(results, bool):
+            flat[prefix] = results
+        return flat
+    for key, value in items:
+        flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def compare(baseline: Dict, current: Dict) -> Dict[str, Dict]:
+    """Per-metric change from ``baseline`` to ``current`` (saved run files or their ``results``)"""
+    old = flatten(baseline.get("results", baseline))
+    new = flatten(current.get("results", current))
+    changes = {}
+    for key in old.keys() & new.keys():
+        before, after = old[key], new[key]
+        change = round((after - before) / before * 100, 1) if before else None
+        better = None
+        if change and "target" not in key:
+            if any(word in key for word in LOWER_IS_BETTER):
+                better = change < 0
+            elif any(word in key for word in HIGHER_IS_BETTER):
+                better = change > 0
+        changes[key] = {"baseline": before, "current": after, "change_pct": change, "improved": better}
+    return dict(sorted(changes.items()))
+
+
+def changed_args(baseline: Dict, current: Dict) -> Dict[str, Tuple]:
+    """Settings that differ between two saved runs, which makes their numbers not comparable"""
+    old, new = baseline.get("args", {}), current.get("args", {})
+    return {key: (old.get(key), new.get(key)) for key in sorted(old.keys() | new.keys())
+            if key not in RUN_ONLY_ARGS and old.get(key) != new.get(key)}
+
+
+def print_comparison(changes: Dict[str, Dict], differences: Optional[Dict[str, Tuple]] = None):
+    for key, (before, after) in (differences or {}).items():
+        print(f"warning: runs differ in {key}: {before} -> {after}", file=sys.stderr)
+    width = max((len(key) for key in changes), default=10)
+    print(f"{'metric':<{width}} {'baseline':>12} {'current':>12} {'change':>9}", file=sys.stderr)
+    for key, change in changes.items():
+        pct = "" if change["change_pct"] is None else f"{change['change_pct']:+.1f}%"
+        mark = {True: " better", False: " worse", None: ""}[change["improved"]]
+        print(f"{key:<{width}} {change['baseline']:>12} {change['current']:>12} {pct:>9}{mark}", file=sys.stderr)
+
+
+def git_revision() -> Optional[str]:
+    """Commit of the code under test, when run from a checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--scenario', choices=['saturate', 'fleet', 'binary'], default='saturate')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--connect-concurrency', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=100, help='fleet: average scans/sec over the run')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='shift', help='fleet: scan rate over time')
+    parser.add_argument('--poll-interval', type=float, default=5, help='fleet: seconds between polls per dashboard')
+    parser.add_argument('--pollers', type=int, default=16, help='fleet: threads issuing the dashboard polls')
+    parser.add_argument('--seed', type=int, default=1, help='fleet: random seed for scan timing and cards')
+    parser.add_argument('--binary-address', default='127.0.0.1:5005', help='binary: listener host:port')
+    parser.add_argument('--transport', choices=['udp', 'tcp'], default='udp', help='binary: protocol to send frames over')
+    parser.add_argument('--window', type=int, default=1, help='binary: unacknowledged scans per reader')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results with a saved run')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved runs and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            baseline, current = json.load(old), json.load(new)
+        changes = compare(baseline, current)
+        print_comparison(changes, changed_args(baseline, current))
+        print(json.dumps(changes, indent=2))
+        return
+
+    urls = args.url.split(',')
+    if args.scenario == 'fleet':
+        results = run_fleet(urls, args.clients, args.readers, args.rate, args.seconds, args.profile,
+                            args.poll_interval, args.pollers, args.connect_concurrency, args.seed)
+    elif args.scenario == 'binary':
+        results = run_binary(urls, args.binary_address, args.transport, args.clients, args.readers, args.window,
+                             args.seconds, args.connect_concurrency)
+    else:
+        results = run(urls, args.clients, args.readers, args.seconds, args.connect_concurrency)
+
+    report = {
+        "scenario": args.scenario,
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "args": vars(args),
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print_comparison(compare(baseline, report), changed_args(baseline, report))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
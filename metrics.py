@@ -0,0 +1,298 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Every process keeps its own registry and serves it on ``/metrics``; in a
+cluster, scrape each worker's port (the writer reports the ingest and
+database-write series). Recording a sample is a dict lookup and a few
+additions under a lock, cheap enough to leave on in production.
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Flask, g, request
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("slow_query")
+
+# Latency buckets in seconds, from cache hits to long exports
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """A named family of samples, one per combination of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Exposition lines for this family, HELP and TYPE first"""
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"]
+
+
+class Counter(Metric):
+    """Monotonically increasing total"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down, usually set by a collector at scrape time"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf) followed by the sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall-clock duration of the ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key: Tuple[str, ...], value: List[float]) -> List[str]:
+        names = self.labelnames + ("le",)
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), value[:-1]):
+            total += count
+            lines.append(f"{self.name}_bucket{_labels(names, key + (_number(float(bound)),))} {total}")
+        labels = _labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(value[-1])}")
+        lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metric families of this process plus collectors that refresh gauges on scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Call ``collector()`` before every scrape, e.g. to set gauges from live state"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Run the collectors and format every family"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                # One broken source must not take the whole scrape down
+                logger.error(f"Metrics collector failed: {str(e)}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rfid_http_request_duration_seconds", "HTTP request latency until the response is returned, by route",
+    ("method", "route", "status"))
+JSON_ENCODE_SECONDS = REGISTRY.histogram(
+    "rfid_json_encode_seconds", "Time spent encoding JSON response bodies")
+LOG_MANAGER_SECONDS = REGISTRY.histogram(
+    "rfid_log_manager_duration_seconds", "LogManager call latency by method", ("method",))
+SCANS_TOTAL = REGISTRY.counter(
+    "rfid_scans_total", "Scans received by transport (http, udp, tcp) and outcome "
+    "(stored, duplicate, busy, error, invalid)", ("transport", "result"))
+INGEST_BATCH_SIZE = REGISTRY.histogram(
+    "rfid_ingest_batch_size", "Scans drained from the ingest queue per group commit", buckets=SIZE_BUCKETS)
+INGEST_QUEUE_DEPTH = REGISTRY.gauge(
+    "rfid_ingest_queue_depth", "Scans waiting to be committed")
+EMIT_SECONDS = REGISTRY.histogram(
+    "rfid_broadcast_emit_seconds", "Time spent in one Socket.IO emit of a new_logs frame")
+BROADCAST_DELAY_SECONDS = REGISTRY.histogram(
+    "rfid_broadcast_delay_seconds", "Time from the oldest published log of a flush to its emit")
+SOCKETIO_CLIENTS = REGISTRY.gauge(
+    "rfid_socketio_clients", "Connected dashboard clients")
+DB_SIZE_BYTES = REGISTRY.gauge(
+    "rfid_db_size_bytes", "On-disk size of the database files", ("file",))
+WORKER_INFO = REGISTRY.gauge(
+    "rfid_worker_info", "Always 1; labels identify the process", ("role", "pid"))
+
+
+class QueryTimer:
+    """Decorator recording a method's latency, and logging calls slower than ``threshold`` seconds
+
+    ``threshold`` of 0 turns the slow-query log off; timings are always recorded.
+    Use ``time(name)`` for a block inside a method.
+    """
+
+    def __init__(self, histogram: Histogram, threshold: float = 0.0):
+        self.histogram = histogram
+        self.threshold = threshold
+
+    def __call__(self, func: Callable) -> Callable:
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._record(name, time.perf_counter() - start, args[1:], kwargs)
+
+        return wrapper
+
+    @contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def _record(self, name: str, elapsed: float, args: Sequence = (), kwargs: Optional[Dict] = None):
+        self.histogram.observe(elapsed, method=name)
+        if self.threshold and elapsed >= self.threshold:
+            slow_query_logger.warning(f"Slow query: {name} took {elapsed * 1000:.1f} ms"
+                                      f"{_describe_call(args, kwargs or {})}")
+
+
+def _describe_call(args: Sequence, kwargs: Dict) -> str:
+    """Short argument summary; long sequences (bulk inserts) are shown by length only"""
+    def short(value):
+        if isinstance(value, (list, tuple, set, dict)) and len(value) > 5:
+            return f"<{type(value).__name__} of {len(value)}>"
+        text = repr(value)
+        return text if len(text) <= 80 else text[:77] + "..."
+
+    parts = [short(value) for value in args] + [f"{key}={short(value)}" for key, value in kwargs.items()]
+    return f" ({', '.join(parts)})" if parts else ""
+
+
+# LogManager methods are wrapped with this; the server sets ``threshold`` from SLOW_QUERY_MS
+db_query = QueryTimer(LOG_MANAGER_SECONDS)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, recording how long each response body takes to encode"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            JSON_ENCODE_SECONDS.observe(time.perf_counter() - start)
+
+
+def instrument_app(app: Flask):
+    """Time every request by route template and JSON encoding of the responses
+
+    Streamed responses are measured up to the first byte.
+    """
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route,
+                                    status=response.status_code)
+        return response
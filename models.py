@@ -1,29 +1,137 @@
 import sqlite3
+import logging
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 import os
+from metrics import db_query
+from recent_cache import RecentLogCache
+from partitions import PartitionManager
+from registry import LOG_ROW_COLUMNS, LOG_ROW_FROM, LOG_ROW_JOIN, Registry
+from retention import ProgressCallback, RetentionEngine
+from rollups import RollupManager
+from search import SearchIndex
+from stats import StatsManager
+from timeutils import day_bounds, from_epoch_ms, to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever init_database() gains a migration step
+SCHEMA_VERSION = 3
+
+# ``(uid, user_id, user, timestamp, reader_id, seq)`` as queued for insert
+LogRow = Tuple[str, Optional[int], str, datetime, Optional[str], Optional[int]]
 
 class DatabaseManager:
-    """SQLite database manager for RFID logs"""
+    """SQLite database manager for RFID logs
+    
+    Keeps a pool of persistent WAL-mode connections shared across threads so
+    readers never block the writer and statements stay prepared between calls.
+    """
     
-    def __init__(self, db_path: str = "rfid_logs.db"):
+    def __init__(self, db_path: str = "rfid_logs.db", pool_size: int = 8,
+                 synchronous: str = "NORMAL", cache_size_kb: int = 16384,
+                 mmap_size: int = 256 * 1024 * 1024, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 128):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._closed = False
         self.init_database()
     
+    def connect(self) -> sqlite3.Connection:
+        """Open a new connection configured with the pool pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+    
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            # Pool exhausted: open an overflow connection rather than block
+            return self.connect()
+    
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed:
+                try:
+                    self._pool.put_nowait(conn)
+                    return
+                except queue.Full:
+                    pass
+        conn.close()
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection; commits on success, rolls back on error"""
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._release(conn)
+    
     def init_database(self):
         """Initialize database and create tables if they don't exist"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
+            
+            # Registry of known people and the cards assigned to them
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    department TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cards (
+                    uid TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # user_id is NULL for cards that are not in the registry
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS card_logs (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     uid TEXT NOT NULL,
-                    user TEXT NOT NULL,
-                    timestamp DATETIME NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    user_id INTEGER REFERENCES users(id),
+                    timestamp INTEGER NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    reader_id TEXT,
+                    seq INTEGER
                 )
             ''')
             
+            self._migrate(cursor)
+            
             # Create index for better performance
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_timestamp 
@@ -31,22 +139,124 @@ class DatabaseManager:
             ''')
             
             cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_user 
-                ON card_logs(user)
+                CREATE INDEX IF NOT EXISTS idx_user_id 
+                ON card_logs(user_id)
+            ''')
+            # A user's logs within a time range, read in time order
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_timestamp
+                ON card_logs(user_id, timestamp)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cards_user_id 
+                ON cards(user_id)
+            ''')
+            
+            # Idempotency key of readers that number their scans; a retried
+            # request can never insert the same scan twice
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_reader_seq
+                ON card_logs(reader_id, seq) WHERE reader_id IS NOT NULL AND seq IS NOT NULL
             ''')
             
             conn.commit()
     
+    def _migrate(self, cursor: sqlite3.Cursor):
+        """Upgrade an existing database file to SCHEMA_VERSION"""
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        
+        if version < 1:
+            # ISO text timestamps (local time) -> integer epoch milliseconds
+            cursor.execute('''
+                UPDATE card_logs
+                SET timestamp = CAST(ROUND((julianday(timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER)
+                WHERE typeof(timestamp) = 'text'
+            ''')
+        
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(card_logs)')]
+        if version < 2 and 'user' in columns:
+            # Free-text user names -> registry rows referenced by id
+            cursor.execute('''
+                INSERT OR IGNORE INTO users (name)
+                SELECT DISTINCT user FROM card_logs WHERE user <> 'Unknown'
+            ''')
+            cursor.execute('''
+                INSERT OR IGNORE INTO cards (uid, user_id)
+                SELECT l.uid, u.id
+                FROM card_logs l
+                JOIN users u ON u.name = l.user
+                WHERE l.id IN (SELECT MAX(id) FROM card_logs WHERE user <> 'Unknown' GROUP BY uid)
+            ''')
+            cursor.execute('ALTER TABLE card_logs ADD COLUMN user_id INTEGER REFERENCES users(id)')
+            cursor.execute('''
+                UPDATE card_logs
+                SET user_id = (SELECT id FROM users WHERE users.name = card_logs.user)
+            ''')
+            
+            # Drop everything that still refers to the old column; the search
+            # index and statistics rebuild themselves on next start
+            for trigger in ('card_logs_fts_ai', 'card_logs_fts_ad', 'card_logs_fts_au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute('DROP TABLE IF EXISTS card_logs_fts')
+            cursor.execute('DROP TABLE IF EXISTS stats_users')
+            cursor.execute('DROP TABLE IF EXISTS stats_counters')
+            cursor.execute('DROP INDEX IF EXISTS idx_user')
+            
+            # Rebuild without the column rather than ALTER TABLE ... DROP COLUMN,
+            # which needs SQLite 3.35+
+            sequence = cursor.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'card_logs'").fetchone()
+            cursor.execute('''
+                CREATE TABLE card_logs_rebuild (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    uid TEXT NOT NULL,
+                    user_id INTEGER REFERENCES users(id),
+                    timestamp INTEGER NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO card_logs_rebuild (id, uid, user_id, timestamp, created_at)
+                SELECT id, uid, user_id, timestamp, created_at FROM card_logs
+            ''')
+            cursor.execute('DROP TABLE card_logs')
+            cursor.execute('ALTER TABLE card_logs_rebuild RENAME TO card_logs')
+            if sequence is not None:
+                # Keep ids of purged logs from ever being reused
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'card_logs'",
+                               (sequence[0],))
+        
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(card_logs)')]
+        if version < 3 and 'reader_id' not in columns:
+            # Optional reader identity and per-reader sequence number
+            cursor.execute('ALTER TABLE card_logs ADD COLUMN reader_id TEXT')
+            cursor.execute('ALTER TABLE card_logs ADD COLUMN seq INTEGER')
+        
+        if version < SCHEMA_VERSION:
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    
     def close(self):
-        """Close database connection"""
-        pass  # SQLite handles connections automatically
+        """Close all pooled connections"""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
 
 class CardLog:
-    def __init__(self, uid: str, user: str, timestamp: Optional[datetime] = None, log_id: Optional[int] = None):
+    def __init__(self, uid: str, user: str, timestamp: Optional[datetime] = None, log_id: Optional[int] = None,
+                 user_id: Optional[int] = None, reader_id: Optional[str] = None, seq: Optional[int] = None):
         self.id = log_id
         self.uid = uid
         self.user = user
+        self.user_id = user_id
         self.timestamp = timestamp or datetime.now()
+        self.reader_id = reader_id
+        self.seq = seq
     
     def to_dict(self) -> Dict:
         return {
@@ -62,117 +272,325 @@ class CardLog:
         return cls(data["uid"], data["user"], timestamp, data.get("id"))
 
 class LogManager:
-    def __init__(self, db_path: str = "rfid_logs.db"):
-        self.db_manager = DatabaseManager(db_path)
+    def __init__(self, db_path: str = "rfid_logs.db", db_manager: Optional[DatabaseManager] = None,
+                 registry_cache_size: int = 4096, archive_dir: Optional[str] = "log_archives",
+                 cleanup_batch_size: int = 1000, cleanup_pause: float = 0.05,
+                 recent_cache_size: int = 1000, partition_dir: str = "partitions",
+                 partition_hot_months: int = 1):
+        self.db_manager = db_manager or DatabaseManager(db_path)
+        self.registry = Registry(self.db_manager, registry_cache_size)
+        self.partitions = PartitionManager(self.db_manager, partition_dir, partition_hot_months,
+                                           pause=cleanup_pause)
+        self.stats = StatsManager(self.db_manager, self.partitions)
+        self.rollups = RollupManager(self.db_manager)
+        self.search = SearchIndex(self.db_manager, self.partitions)
+        self.retention = RetentionEngine(self.db_manager, self.stats, archive_dir,
+                                         cleanup_batch_size, cleanup_pause, self.partitions)
+        self.recent = RecentLogCache(self._load_recent, recent_cache_size, lambda: self.registry.generation)
+        self._listeners: List[Callable[[List[CardLog]], None]] = []
+        self.add_listener(lambda logs: self.recent.add(
+            [((to_epoch_ms(log.timestamp), log.id), log.to_dict()) for log in logs]))
+    
+    def add_listener(self, callback: Callable[[List["CardLog"]], None]):
+        """Call ``callback(logs)`` with every chunk of logs once it is committed"""
+        self._listeners.append(callback)
     
-    def add_log(self, uid: str, user: str) -> CardLog:
+    def add_log(self, uid: str) -> CardLog:
         """Add a new log entry to database"""
-        timestamp = datetime.now()
+        return self.add_logs_bulk([(uid, datetime.now())])[0]
+    
+    @db_query
+    def add_logs_bulk(self, entries: Iterable[Sequence], chunk_size: int = 5000) -> List[CardLog]:
+        """Insert many ``(uid[, timestamp[, reader_id, seq]])`` entries with one commit per chunk
         
-        with sqlite3.connect(self.db_manager.db_path) as conn:
+        Each UID is resolved to its registered user through the registry
+        cache; the cards a chunk misses are looked up in a single query.
+        """
+        logs: List[CardLog] = []
+        chunk: List[tuple] = []
+        for entry in entries:
+            uid = Registry.normalize_uid(entry[0])
+            timestamp = entry[1] if len(entry) > 1 and entry[1] is not None else datetime.now()
+            reader_id, seq = (entry[2], entry[3]) if len(entry) > 3 else (None, None)
+            chunk.append((uid, timestamp, reader_id, seq))
+            if len(chunk) >= chunk_size:
+                logs.extend(self._insert_chunk(chunk))
+                chunk = []
+        if chunk:
+            logs.extend(self._insert_chunk(chunk))
+        return logs
+    
+    def _insert_chunk(self, entries: List[tuple]) -> List[CardLog]:
+        users = self.registry.resolve_many(entry[0] for entry in entries)
+        rows: List[LogRow] = [(uid, *users[uid], timestamp, reader_id, seq)
+                              for uid, timestamp, reader_id, seq in entries]
+        # Timed apart from the listeners below, which fan the logs out
+        with db_query.time("insert_commit"), self.db_manager.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO card_logs (uid, user, timestamp)
-                VALUES (?, ?, ?)
-            ''', (uid, user, timestamp))
+            cursor.executemany('''
+                INSERT INTO card_logs (uid, user_id, timestamp, reader_id, seq)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(uid, user_id, to_epoch_ms(timestamp), reader_id, seq)
+                  for uid, user_id, _, timestamp, reader_id, seq in rows])
             
-            log_id = cursor.lastrowid
+            # Rows inserted in one transaction get consecutive AUTOINCREMENT ids
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            self.stats.record_inserts(conn, [(row[1], row[3]) for row in rows])
             conn.commit()
-            
-            return CardLog(uid, user, timestamp, log_id)
+        
+        first_id = last_id - len(rows) + 1
+        logs = [CardLog(uid, user, timestamp, first_id + i, user_id, reader_id, seq)
+                for i, (uid, user_id, user, timestamp, reader_id, seq) in enumerate(rows)]
+        self.notify_committed(logs)
+        return logs
     
-    def get_recent_logs(self, limit: int = 50) -> List[Dict]:
-        """Get recent logs from database"""
-        with sqlite3.connect(self.db_manager.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, uid, user, timestamp
-                FROM card_logs
-                ORDER BY timestamp DESC
+    @db_query
+    def notify_committed(self, logs: List[CardLog]):
+        """Run the listeners for logs committed here or, in a cluster, by the writer process"""
+        for listener in self._listeners:
+            try:
+                listener(logs)
+            except Exception as e:
+                # The rows are committed; a failing listener must not fail the write
+                logger.error(f"Log listener failed: {str(e)}")
+    
+    @db_query
+    def get_recent_logs(self, limit: int = 50, before_id: Optional[int] = None,
+                        after_id: Optional[int] = None, departments: Sequence[str] = (),
+                        readers: Sequence[str] = ()) -> List[Dict]:
+        """Get recent logs, newest first, optionally paged by cursor
+        
+        ``departments``/``readers`` keep only the logs of those broadcast
+        rooms. The first unfiltered page is served from the in-memory recent
+        cache when it fits.
+        """
+        conditions, params = self._room_conditions(departments, readers)
+        if before_id is None and after_id is None and not conditions:
+            logs = self.recent.get(limit)
+            if logs is not None:
+                return logs
+        return self._query_logs(conditions, params, limit, before_id, after_id)
+    
+    @db_query
+    def find_keyed(self, keys: Iterable[Tuple[str, int]], query_chunk: int = 500) -> Dict[Tuple[str, int], CardLog]:
+        """Logs already stored under any of the ``(reader_id, seq)`` idempotency keys
+        
+        One indexed ``seq IN (...)`` query per reader and ``query_chunk`` keys.
+        """
+        seqs_by_reader: Dict[str, List[int]] = {}
+        for reader_id, seq in keys:
+            seqs_by_reader.setdefault(reader_id, []).append(seq)
+        found: Dict[Tuple[str, int], CardLog] = {}
+        with self.db_manager.connection() as conn:
+            for reader_id, seqs in seqs_by_reader.items():
+                for start in range(0, len(seqs), query_chunk):
+                    batch = seqs[start:start + query_chunk]
+                    for row in conn.execute(f'''
+                        SELECT {LOG_ROW_COLUMNS}, l.user_id, l.seq
+                        FROM {LOG_ROW_FROM}
+                        WHERE l.reader_id = ? AND l.seq IN ({", ".join("?" * len(batch))})
+                    ''', (reader_id, *batch)):
+                        found[(reader_id, row[5])] = CardLog(row[1], row[2], from_epoch_ms(row[3]), row[0],
+                                                             row[4], reader_id, row[5])
+        return found
+    
+    @db_query
+    def get_logs_since(self, since_id: int, limit: int = 1000, departments: Sequence[str] = (),
+                       readers: Sequence[str] = ()) -> List[Dict]:
+        """Get logs committed after ``since_id``, oldest first, for delta sync"""
+        conditions, params = self._room_conditions(departments, readers)
+        extra = "".join(f" AND {condition}" for condition in conditions)
+        with self.db_manager.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {LOG_ROW_COLUMNS}
+                FROM {LOG_ROW_FROM}
+                WHERE l.id > ?{extra}
+                ORDER BY l.id
                 LIMIT ?
-            ''', (limit,))
-            
-            logs = []
-            for row in cursor.fetchall():
-                log = CardLog(row[1], row[2], datetime.fromisoformat(row[3]), row[0])
-                logs.append(log.to_dict())
-            
-            return logs
+            ''', (since_id, *params, limit)).fetchall()
+        return self._to_dicts(rows)
     
-    def get_stats(self) -> Dict:
-        """Get statistics from database"""
-        with sqlite3.connect(self.db_manager.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Total scans
-            cursor.execute('SELECT COUNT(*) FROM card_logs')
-            total_scans = cursor.fetchone()[0]
-            
-            # Unique users
-            cursor.execute('SELECT COUNT(DISTINCT user) FROM card_logs')
-            unique_users = cursor.fetchone()[0]
-            
-            # Today's scans
-            today = datetime.now().date()
-            cursor.execute('''
-                SELECT COUNT(*) FROM card_logs 
-                WHERE DATE(timestamp) = DATE(?)
-            ''', (today,))
-            today_scans = cursor.fetchone()[0]
-            
-            return {
-                "total_scans": total_scans,
-                "unique_users": unique_users,
-                "today_scans": today_scans
-            }
-    
-    def search_logs(self, search_term: str, limit: int = 50) -> List[Dict]:
-        """Search logs by UID or user name"""
-        with sqlite3.connect(self.db_manager.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, uid, user, timestamp
+    @db_query
+    def get_last_id(self) -> int:
+        """Id of the newest committed log, or 0 when there are none"""
+        with self.db_manager.connection() as conn:
+            # The AUTOINCREMENT sequence remembers it even when every log has been sealed
+            return conn.execute('''
+                SELECT COALESCE(MAX(id), (SELECT seq FROM sqlite_sequence WHERE name = 'card_logs'), 0)
                 FROM card_logs
-                WHERE uid LIKE ? OR user LIKE ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-            ''', (f'%{search_term}%', f'%{search_term}%', limit))
-            
-            logs = []
-            for row in cursor.fetchall():
-                log = CardLog(row[1], row[2], datetime.fromisoformat(row[3]), row[0])
-                logs.append(log.to_dict())
-            
-            return logs
+            ''').fetchone()[0]
     
-    def get_logs_by_date(self, date: str, limit: int = 50) -> List[Dict]:
+    def _load_recent(self, limit: int) -> List[Tuple[Tuple[int, int], Dict]]:
+        """Fill the recent cache: ``((timestamp, id), log_dict)`` oldest first"""
+        rows = self._select_rows([], [], limit)
+        rows.reverse()
+        return [((row[3], row[0]), log) for row, log in zip(rows, self._to_dicts(rows))]
+    
+    def _select_rows(self, conditions: List[str], params: List, limit: int, descending: bool = True,
+                     start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> List[Tuple[int, str, str, int]]:
+        """Run a keyset-ordered ``(id, uid, user, timestamp)`` query
+        
+        ``start_ms``/``end_ms`` bound the time range the conditions can
+        match, so only the sealed partitions overlapping it are attached.
+        Partition windows are read in order until the page is full.
+        """
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "DESC" if descending else "ASC"
+        rows: List[Tuple[int, str, str, int]] = []
+        with self.db_manager.connection() as conn:
+            for window in self.partitions.windows(conn, start_ms, end_ms, descending):
+                with self.partitions.attach(conn, window) as source:
+                    rows.extend(conn.execute(f'''
+                        SELECT {LOG_ROW_COLUMNS}
+                        FROM {source} l {LOG_ROW_JOIN}
+                        {where}
+                        ORDER BY l.timestamp {order}, l.id {order}
+                        LIMIT ?
+                    ''', (*params, limit - len(rows))).fetchall())
+                if len(rows) >= limit:
+                    break
+        return rows
+    
+    def _query_logs(self, conditions: List[str], params: List, limit: int,
+                    before_id: Optional[int] = None, after_id: Optional[int] = None,
+                    start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> List[Dict]:
+        """Page through logs on the ``(timestamp, id)`` ordering
+        
+        ``before_id`` returns the page older than that log, ``after_id`` the
+        page newer than it; either way results are returned newest first.
+        """
+        conditions = list(conditions)
+        params = list(params)
+        for cursor_id, operator in ((before_id, '<'), (after_id, '>')):
+            if cursor_id is None:
+                continue
+            position = self._log_position(cursor_id)
+            if position is None:
+                return []
+            conditions.append(f'(l.timestamp, l.id) {operator} (?, ?)')
+            params.extend(position)
+            if operator == '<':
+                end_ms = position[0] + 1 if end_ms is None else min(end_ms, position[0] + 1)
+            else:
+                start_ms = position[0] if start_ms is None else max(start_ms, position[0])
+        
+        # Walk upwards from the cursor when paging forwards, then flip
+        descending = after_id is None or before_id is not None
+        rows = self._select_rows(conditions, params, limit, descending, start_ms, end_ms)
+        if not descending:
+            rows.reverse()
+        return self._to_dicts(rows)
+    
+    def _log_position(self, log_id: int) -> Optional[Tuple[int, int]]:
+        """``(timestamp, id)`` of a log, looked up in the hot table first, then the partitions"""
+        with self.db_manager.connection() as conn:
+            row = conn.execute('SELECT timestamp, id FROM card_logs WHERE id = ?', (log_id,)).fetchall()
+            if row:
+                return row[0]
+            for window in self.partitions.windows(conn, descending=True, include_hot=False):
+                with self.partitions.attach(conn, window) as source:
+                    row = conn.execute(f'SELECT timestamp, id FROM {source} WHERE id = ?', (log_id,)).fetchall()
+                if row:
+                    return row[0]
+        return None
+    
+    @staticmethod
+    def _to_dicts(rows: List[Tuple[int, str, str, int]]) -> List[Dict]:
+        """Convert ``(id, uid, user, timestamp)`` rows into log dicts"""
+        return [CardLog(row[1], row[2], from_epoch_ms(row[3]), row[0]).to_dict() for row in rows]
+    
+    def iter_log_rows(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                      chunk_size: int = 1000) -> Iterator[Tuple[int, str, str, int]]:
+        """Yield raw ``(id, uid, user, timestamp)`` rows oldest first
+        
+        Rows are read in keyset-paged chunks, each in its own short read, so
+        exports use constant memory and never pin an old WAL snapshot.
+        """
+        conditions, params = self._range_conditions(start_ms, end_ms)
+        last: Optional[Tuple[int, int]] = None
+        while True:
+            page_conditions = list(conditions)
+            page_params = list(params)
+            page_start = start_ms
+            if last is not None:
+                page_conditions.append('(l.timestamp, l.id) > (?, ?)')
+                page_params.extend(last)
+                page_start = last[0]
+            rows = self._select_rows(page_conditions, page_params, chunk_size, False, page_start, end_ms)
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            last = (rows[-1][3], rows[-1][0])
+    
+    @staticmethod
+    def _room_conditions(departments: Sequence[str], readers: Sequence[str]) -> Tuple[List[str], List]:
+        """Match the logs broadcast to any of the ``dept:``/``reader:`` rooms"""
+        alternatives: List[str] = []
+        params: List = []
+        if departments:
+            alternatives.append(f"u.department IN ({', '.join('?' * len(departments))})")
+            params.extend(departments)
+        if readers:
+            alternatives.append(f"l.reader_id IN ({', '.join('?' * len(readers))})")
+            params.extend(readers)
+        if not alternatives:
+            return [], []
+        return [f"({' OR '.join(alternatives)})"], params
+    
+    @staticmethod
+    def _range_conditions(start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[List[str], List]:
+        conditions: List[str] = []
+        params: List = []
+        if start_ms is not None:
+            conditions.append('l.timestamp >= ?')
+            params.append(start_ms)
+        if end_ms is not None:
+            conditions.append('l.timestamp < ?')
+            params.append(end_ms)
+        return conditions, params
+    
+    @db_query
+    def get_stats(self) -> Dict:
+        """Get statistics from the incrementally maintained counters"""
+        return self.stats.get_stats()
+    
+    @db_query
+    def search_logs(self, search_term: str, limit: int = 50, before_id: Optional[int] = None,
+                    after_id: Optional[int] = None, start_ms: Optional[int] = None,
+                    end_ms: Optional[int] = None) -> List[Dict]:
+        """Search logs by UID or user name prefix, newest logged first, paged on the log id"""
+        rows = self.search.search_rows(search_term, limit, before_id, after_id, start_ms, end_ms)
+        return self._to_dicts(rows)
+    
+    def get_logs_by_date(self, date: str, limit: int = 50, before_id: Optional[int] = None,
+                         after_id: Optional[int] = None) -> List[Dict]:
         """Get logs for a specific date (YYYY-MM-DD format)"""
-        with sqlite3.connect(self.db_manager.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, uid, user, timestamp
-                FROM card_logs
-                WHERE DATE(timestamp) = ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-            ''', (date, limit))
-            
-            logs = []
-            for row in cursor.fetchall():
-                log = CardLog(row[1], row[2], datetime.fromisoformat(row[3]), row[0])
-                logs.append(log.to_dict())
-            
-            return logs
+        start_ms, end_ms = day_bounds(date)
+        return self.get_logs_in_range(start_ms, end_ms, limit, before_id, after_id)
     
-    def cleanup_old_logs(self, days_to_keep: int = 90):
-        """Remove logs older than specified days"""
-        with sqlite3.connect(self.db_manager.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                DELETE FROM card_logs
-                WHERE timestamp < datetime('now', '-{} days')
-            '''.format(days_to_keep))
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-            return deleted_count 
\ No newline at end of file
+    @db_query
+    def get_logs_in_range(self, start_ms: Optional[int], end_ms: Optional[int], limit: int = 50,
+                          before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """Get logs with ``start_ms <= timestamp < end_ms`` (epoch milliseconds)"""
+        conditions, params = self._range_conditions(start_ms, end_ms)
+        return self._query_logs(conditions, params, limit, before_id, after_id, start_ms, end_ms)
+    
+    @db_query
+    def cleanup_old_logs(self, days_to_keep: int = 90, progress: Optional[ProgressCallback] = None) -> int:
+        """Archive and remove logs older than specified days, in small batches"""
+        # Reports outlive the raw rows, so fold them in before they go
+        self.rollups.catch_up()
+        try:
+            return self.retention.purge(days_to_keep, progress)
+        finally:
+            self.recent.invalidate()
+    
+    @db_query
+    def seal_partitions(self, progress: Optional[ProgressCallback] = None) -> Dict:
+        """Move closed months out of the hot table into sealed partition files"""
+        # Rollups are folded from card_logs, so fold the rows in before they move
+        self.rollups.catch_up()
+        result = self.partitions.seal(progress)
+        if result["count"]:
+            self.search.optimize()
+        return result
\ No newline at end of file
@@ -0,0 +1,457 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from timeutils import to_epoch_ms
+
+if TYPE_CHECKING:
+    from models import DatabaseManager
+    from retention import ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+SEALING = "sealing"
+SEALED = "sealed"
+
+# Explicit column list: migrated databases store card_logs columns in a different order
+LOG_COLUMNS = "id, uid, user_id, timestamp, created_at, reader_id, seq"
+
+# Temporary view unioning the hot table with the partitions attached for a query
+HISTORY_VIEW = "card_logs_history"
+
+# SQLite's default SQLITE_MAX_ATTACHED; longer histories are read in several windows
+MAX_ATTACHED = 10
+
+
+class Partition(NamedTuple):
+    month: str
+    file: str
+    start_ms: int
+    end_ms: int
+    upto_id: int
+    rows: int
+    state: str
+    sealed_at: Optional[int]
+
+    def to_dict(self) -> Dict:
+        return self._asdict()
+
+
+class Window(NamedTuple):
+    """Partitions attached together for one query, plus the hot table's share of the time axis
+
+    Consecutive windows tile the time axis, so reading them in order and
+    concatenating the results keeps ``(timestamp, id)`` order.
+    """
+    partitions: Tuple[Partition, ...]
+    include_hot: bool
+    lower: Optional[int]
+    upper: Optional[int]
+
+
+def month_key(timestamp_ms: int) -> str:
+    """Local calendar month (YYYY-MM) of an epoch-ms timestamp"""
+    return time.strftime("%Y-%m", time.localtime(timestamp_ms // 1000))
+
+
+def month_bounds(month: str) -> Tuple[int, int]:
+    """Return the ``[start, end)`` epoch-ms range of a YYYY-MM local month"""
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return to_epoch_ms(start), to_epoch_ms(end)
+
+
+def hot_filter(partitions: Iterable[Partition], lower: Optional[int] = None, upper: Optional[int] = None) -> str:
+    """``WHERE`` clause limiting ``card_logs`` to rows no partition holds, within ``[lower, upper)``"""
+    # Integers only, so they are safe to inline into a view definition
+    conditions = []
+    if lower is not None:
+        conditions.append(f"timestamp >= {int(lower)}")
+    if upper is not None:
+        conditions.append(f"timestamp < {int(upper)}")
+    for partition in partitions:
+        if partition.state == SEALING:
+            # Copied already but not yet deleted from the hot table
+            conditions.append(f"NOT (timestamp >= {int(partition.start_ms)} AND timestamp < "
+                              f"{int(partition.end_ms)} AND id <= {int(partition.upto_id)})")
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _read_only_uri(path: str) -> str:
+    # Sealed files never change, so SQLite can skip locking and change detection
+    return f"file:{quote(os.path.abspath(path))}?mode=ro&immutable=1"
+
+
+def sealed_until(cursor: sqlite3.Cursor) -> Optional[int]:
+    """End of the newest sealed month; ``card_logs`` holds every log from there on"""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'log_partitions'")
+    if exists.fetchone() is None:
+        return None
+    return cursor.execute('SELECT MAX(end_ts) FROM log_partitions').fetchone()[0]
+
+
+class PartitionManager:
+    """Monthly partitioned storage for ``card_logs``
+
+    The main database only keeps the recent months ("hot" data). Once a
+    month is ``hot_months`` old, ``seal`` copies its logs into a read-only
+    ``card_logs_<YYYY-MM>.db`` file and deletes them from ``card_logs`` in
+    small batches, so ``VACUUM``, ``ANALYZE`` and backups of the main file
+    only ever touch the hot months.
+
+    Historical queries ``attach`` the sealed files they need to the pooled
+    connection and read a temporary ``card_logs_history`` view that unions
+    them with ``card_logs``; both are dropped again before the connection
+    goes back to the pool. SQLite limits how many files one connection can
+    attach, so ``windows`` splits long histories into consecutive groups.
+
+    A scan dated in an already sealed month (a reader uploading a very old
+    buffer) stays in ``card_logs`` and is found through the hot table.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", directory: str = "partitions", hot_months: int = 1,
+                 batch_size: int = 5000, pause: float = 0.05):
+        self.db_manager = db_manager
+        self.directory = directory
+        self.hot_months = hot_months
+        self.batch_size = batch_size
+        self.pause = pause
+        # Serializes sealing and dropping within this process
+        self._lock = threading.Lock()
+        self._uri: Optional[bool] = None
+        self.init_schema()
+
+    def init_schema(self):
+        """Create the partition catalog"""
+        with self.db_manager.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS log_partitions (
+                    month TEXT PRIMARY KEY,
+                    file TEXT NOT NULL,
+                    start_ts INTEGER NOT NULL,
+                    end_ts INTEGER NOT NULL,
+                    upto_id INTEGER NOT NULL,
+                    rows INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    sealed_at INTEGER
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+
+    def path(self, partition: Partition) -> str:
+        return os.path.join(self.directory, partition.file)
+
+    def catalog(self, conn: Optional[sqlite3.Connection] = None) -> List[Partition]:
+        """Every partition, oldest month first"""
+        if conn is None:
+            with self.db_manager.connection() as conn:
+                return self.catalog(conn)
+        rows = conn.execute('''
+            SELECT month, file, start_ts, end_ts, upto_id, rows, state, sealed_at
+            FROM log_partitions ORDER BY month
+        ''').fetchall()
+        return [Partition(*row) for row in rows]
+
+    def list_partitions(self) -> List[Dict]:
+        """Catalog entries with their file sizes, for the API"""
+        result = []
+        for partition in self.catalog():
+            path = self.path(partition)
+            item = partition.to_dict()
+            item["size_bytes"] = os.path.getsize(path) if os.path.exists(path) else None
+            result.append(item)
+        return result
+
+    def windows(self, conn: sqlite3.Connection, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                descending: bool = False, include_hot: bool = True) -> List[Window]:
+        """Split a ``[start_ms, end_ms)`` query into windows of at most ``MAX_ATTACHED`` partitions
+
+        A range that no partition overlaps is a single window without
+        partitions, read straight from ``card_logs``. Otherwise the logs
+        from the end of the newest sealed month on get a window of their
+        own without partitions, so a newest-first page that it fills never
+        attaches a file.
+        """
+        catalog = self.catalog(conn)
+        partitions = [p for p in catalog
+                      if (start_ms is None or p.end_ms > start_ms) and (end_ms is None or p.start_ms < end_ms)]
+        if not partitions:
+            return [Window((), True, None, None)] if include_hot else []
+
+        # card_logs holds every log from here on
+        boundary = max(p.end_ms for p in catalog)
+        tail = include_hot and (end_ms is None or end_ms > boundary)
+        groups = [partitions[i:i + MAX_ATTACHED] for i in range(0, len(partitions), MAX_ATTACHED)]
+        windows = []
+        for i, group in enumerate(groups):
+            lower = group[0].start_ms if i > 0 else None
+            upper = groups[i + 1][0].start_ms if i + 1 < len(groups) else (boundary if tail else None)
+            windows.append(Window(tuple(group), include_hot, lower, upper))
+        if tail:
+            windows.append(Window((), True, boundary, None))
+        if descending:
+            windows.reverse()
+        return windows
+
+    @contextmanager
+    def attach(self, conn: sqlite3.Connection, window: Window) -> Iterator[str]:
+        """Attach a window's partitions and yield the table or view to read it from
+
+        Statements on the yielded source must be fully fetched before the
+        block ends, since the files are detached on the way out.
+        """
+        if not window.partitions:
+            if window.lower is None and window.upper is None:
+                yield "card_logs"
+            else:
+                # A plain subquery is flattened, so the card_logs indexes still apply
+                yield f"(SELECT {LOG_COLUMNS} FROM main.card_logs{hot_filter((), window.lower, window.upper)})"
+            return
+
+        aliases: List[str] = []
+        try:
+            arms = []
+            if window.include_hot:
+                arms.append(f"SELECT {LOG_COLUMNS} FROM main.card_logs"
+                            f"{hot_filter(window.partitions, window.lower, window.upper)}")
+            for partition in window.partitions:
+                path = self.path(partition)
+                if not os.path.exists(path):
+                    # Dropped by retention since the catalog was read
+                    continue
+                alias = f"part_{partition.month.replace('-', '_')}"
+                conn.execute(f"ATTACH DATABASE ? AS {alias}", (self._attach_name(conn, path),))
+                aliases.append(alias)
+                arms.append(f"SELECT {LOG_COLUMNS} FROM {alias}.card_logs")
+            if not arms:
+                arms.append(f"SELECT {LOG_COLUMNS} FROM main.card_logs WHERE 0")
+            conn.execute(f"CREATE TEMP VIEW {HISTORY_VIEW} AS {' UNION ALL '.join(arms)}")
+            yield HISTORY_VIEW
+        finally:
+            conn.execute(f"DROP VIEW IF EXISTS temp.{HISTORY_VIEW}")
+            for alias in aliases:
+                conn.execute(f"DETACH DATABASE {alias}")
+
+    def _attach_name(self, conn: sqlite3.Connection, path: str) -> str:
+        if self._uri is None:
+            options = {row[0] for row in conn.execute("PRAGMA compile_options").fetchall()}
+            self._uri = "USE_URI=1" in options
+        return _read_only_uri(path) if self._uri else path
+
+    def open(self, partition: Partition) -> sqlite3.Connection:
+        """A separate read-only connection to one sealed file"""
+        return sqlite3.connect(_read_only_uri(self.path(partition)), uri=True, check_same_thread=False)
+
+    def seal(self, progress: Optional["ProgressCallback"] = None) -> Dict:
+        """Seal every closed month older than ``hot_months``; returns what was sealed"""
+        with self._lock:
+            self._resume()
+            months = self._closed_months()
+            total = sum(rows for _, rows in months)
+            sealed: List[Dict] = []
+            done = 0
+            for month, rows in months:
+                partition = self._seal_month(month)
+                if partition is not None:
+                    sealed.append(partition.to_dict())
+                done += rows
+                if progress:
+                    progress(done, total)
+
+        if sealed:
+            logger.info(f"Sealed {len(sealed)} partitions: {', '.join(item['month'] for item in sealed)}")
+        return {"sealed": sealed, "count": len(sealed)}
+
+    def _closed_months(self) -> List[Tuple[str, int]]:
+        """Unsealed months ending at least ``hot_months`` calendar months ago, with their row counts"""
+        if self.hot_months <= 0:
+            return []
+        now = datetime.now()
+        index = now.year * 12 + now.month - 1 - (self.hot_months - 1)
+        boundary, _ = month_bounds(f"{index // 12:04d}-{index % 12 + 1:02d}")
+
+        with self.db_manager.connection() as conn:
+            catalogued = {partition.month for partition in self.catalog(conn)}
+            oldest = conn.execute('SELECT MIN(timestamp) FROM card_logs WHERE timestamp < ?',
+                                  (boundary,)).fetchone()[0]
+            months = []
+            while oldest is not None:
+                month = month_key(oldest)
+                start_ms, end_ms = month_bounds(month)
+                if month not in catalogued:
+                    count = conn.execute('SELECT COUNT(*) FROM card_logs WHERE timestamp >= ? AND timestamp < ?',
+                                         (start_ms, end_ms)).fetchone()[0]
+                    months.append((month, count))
+                oldest = conn.execute('SELECT MIN(timestamp) FROM card_logs WHERE timestamp >= ? AND timestamp < ?',
+                                      (end_ms, boundary)).fetchone()[0]
+        return months
+
+    def _seal_month(self, month: str) -> Optional[Partition]:
+        """Copy one month into its sealed file, register it, then drop it from the hot table"""
+        os.makedirs(self.directory, exist_ok=True)
+        start_ms, end_ms = month_bounds(month)
+        file = f"card_logs_{month}.db"
+        path = os.path.join(self.directory, file)
+        part_path = os.path.join(self.directory, f".{file}.part")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+        # A dedicated connection, so the pool never sees the writable attachment
+        conn = self.db_manager.connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS seal", (part_path,))
+            conn.execute("PRAGMA seal.journal_mode = OFF")
+            conn.execute("PRAGMA seal.synchronous = OFF")
+            # Same declared types as the hot table: SQLite only merges the sorted arms
+            # of the union view, rather than sorting all of it, when column affinities match
+            types = {row[1]: row[2] for row in conn.execute('PRAGMA main.table_info(card_logs)').fetchall()}
+            columns = ", ".join(f"{name} {types[name]}" for name in LOG_COLUMNS.split(", ")[1:])
+            conn.execute(f'CREATE TABLE seal.card_logs (id INTEGER PRIMARY KEY, {columns})')
+            # The copy and upto_id come from one snapshot, so later inserts stay hot
+            conn.execute("BEGIN")
+            upto_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM main.card_logs').fetchone()[0]
+            rows = conn.execute(f'''
+                INSERT INTO seal.card_logs ({LOG_COLUMNS})
+                SELECT {LOG_COLUMNS} FROM main.card_logs
+                WHERE timestamp >= ? AND timestamp < ? AND id <= ?
+                ORDER BY id
+            ''', (start_ms, end_ms, upto_id)).rowcount
+            conn.commit()
+            if not rows:
+                conn.execute("DETACH DATABASE seal")
+                os.remove(part_path)
+                return None
+            conn.execute('CREATE INDEX seal.idx_timestamp ON card_logs(timestamp)')
+            conn.execute('CREATE INDEX seal.idx_user_id ON card_logs(user_id)')
+            conn.execute('CREATE INDEX seal.idx_user_timestamp ON card_logs(user_id, timestamp)')
+            conn.execute('CREATE INDEX seal.idx_uid ON card_logs(uid)')
+            conn.execute("ANALYZE seal")
+            conn.commit()
+            conn.execute("DETACH DATABASE seal")
+        finally:
+            conn.close()
+
+        with open(part_path, "rb") as sealed_file:
+            os.fsync(sealed_file.fileno())
+        os.chmod(part_path, 0o444)
+        os.replace(part_path, path)
+
+        partition = Partition(month, file, start_ms, end_ms, upto_id, rows, SEALING, None)
+        with self.db_manager.connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO log_partitions
+                    (month, file, start_ts, end_ts, upto_id, rows, state, sealed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, NULL)
+            ''', partition[:7])
+            conn.commit()
+        return self._finish(partition)
+
+    def _finish(self, partition: Partition) -> Partition:
+        """Delete a registered partition's rows from the hot table in small batches"""
+        while True:
+            with self.db_manager.connection() as conn:
+                deleted = conn.execute('''
+                    DELETE FROM card_logs WHERE id IN (
+                        SELECT id FROM card_logs
+                        WHERE timestamp >= ? AND timestamp < ? AND id <= ?
+                        LIMIT ?
+                    )
+                ''', (partition.start_ms, partition.end_ms, partition.upto_id, self.batch_size)).rowcount
+                if deleted < self.batch_size:
+                    sealed_at = to_epoch_ms(datetime.now())
+                    conn.execute('UPDATE log_partitions SET state = ?, sealed_at = ? WHERE month = ?',
+                                 (SEALED, sealed_at, partition.month))
+                    conn.commit()
+                    return partition._replace(state=SEALED, sealed_at=sealed_at)
+                conn.commit()
+            time.sleep(self.pause)
+
+    def _resume(self):
+        """Finish seals interrupted by a crash and remove their leftovers"""
+        for partition in self.catalog():
+            if partition.state != SEALING:
+                continue
+            if os.path.exists(self.path(partition)):
+                self._finish(partition)
+            else:
+                logger.error(f"Partition file {self.path(partition)} is missing; unregistering {partition.month}")
+                self.unregister(partition)
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith(".") and name.endswith(".db.part"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def finish_pending(self):
+        """Complete any interrupted seal before other maintenance reads the hot table"""
+        with self._lock:
+            self._resume()
+
+    def expired(self, cutoff_ms: int) -> List[Partition]:
+        """Sealed partitions whose whole month is older than ``cutoff_ms``"""
+        return [p for p in self.catalog() if p.state == SEALED and p.end_ms <= cutoff_ms]
+
+    def unregister(self, partition: Partition, conn: Optional[sqlite3.Connection] = None):
+        """Remove a partition from the catalog; inside the caller's transaction when ``conn`` is given"""
+        if conn is None:
+            with self.db_manager.connection() as conn:
+                self.unregister(partition, conn)
+                conn.commit()
+            return
+        conn.execute('DELETE FROM log_partitions WHERE month = ?', (partition.month,))
+
+    def remove_file(self, partition: Partition):
+        """Delete an unregistered partition's file"""
+        path = self.path(partition)
+        if os.path.exists(path):
+            os.chmod(path, 0o644)
+            os.remove(path)
+
+    def info(self) -> Dict:
+        """Partition count, sealed rows and bytes on disk"""
+        partitions = self.catalog()
+        size = sum(os.path.getsize(self.path(p)) for p in partitions if os.path.exists(self.path(p)))
+        return {
+            "partitions": len(partitions),
+            "partition_rows": sum(p.rows for p in partitions),
+            "partition_size_bytes": size,
+            "sealed_until": max((p.end_ms for p in partitions), default=None)
+        }
+
+
+if __name__ == "__main__":
+    from config import Config
+    from models import DatabaseManager, LogManager
+    from sessions import SessionEngine
+
+    parser = argparse.ArgumentParser(description="Monthly log partitions")
+    parser.add_argument("command", choices=["list", "seal", "migrate"])
+    parser.add_argument("--db", default=Config.DATABASE_PATH, help="Database file path")
+    parser.add_argument("--dir", default=Config.PARTITION_DIR, help="Partition directory")
+    parser.add_argument("--hot-months", type=int, default=Config.PARTITION_HOT_MONTHS,
+                        help="Months kept in the main database")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    log_manager = LogManager(db_manager=db_manager, partition_dir=args.dir,
+                             partition_hot_months=max(args.hot_months, 1))
+    if args.command == "list":
+        for item in log_manager.partitions.list_partitions():
+            print(item)
+    else:
+        if args.command == "migrate":
+            # Sessions are paired from card_logs; pair everything before it moves out
+            SessionEngine(db_manager, Config.SESSION_TIMEOUT_HOURS * 3600 * 1000,
+                          Config.SESSION_DEBOUNCE_SECONDS * 1000).catch_up()
+        print(log_manager.seal_partitions())
+        if args.command == "migrate":
+            # Give the space of the moved rows back to the file system
+            with db_manager.connection() as conn:
+                conn.execute("VACUUM")
+            print(log_manager.partitions.info())
@@ -0,0 +1,144 @@
+import bisect
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Sort key matching the ``ORDER BY timestamp, id`` of the log queries
+LogKey = Tuple[int, int]
+Loader = Callable[[int], List[Tuple[LogKey, Dict]]]
+
+
+class RecentLogCache:
+    """The newest ``capacity`` serialized logs, kept in memory
+
+    Committed logs are pushed in as they are written, so dashboard loads of
+    the latest page are served without touching SQLite. Encoded response
+    bodies are memoized per page size until the next write.
+
+    The buffer is filled from the database on first use and refilled after
+    ``invalidate()`` (deletes) or a registry change, since either can alter
+    rows it already holds.
+    """
+
+    def __init__(self, loader: Loader, capacity: int = 1000,
+                 generation: Optional[Callable[[], int]] = None):
+        self.loader = loader
+        self.capacity = capacity
+        self.generation = generation or (lambda: 0)
+        self._keys: List[LogKey] = []
+        self._logs: List[Dict] = []
+        self._encoded: Dict[Tuple, bytes] = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded_generation: Optional[int] = None
+        self._version = 0
+        # Logs committed while a load is reading the database
+        self._pending: Optional[List[Tuple[LogKey, Dict]]] = None
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, entries: List[Tuple[LogKey, Dict]]):
+        """Record newly committed ``(key, log_dict)`` entries"""
+        with self._lock:
+            self._version += 1
+            self._encoded.clear()
+            if self._pending is not None:
+                self._pending.extend(entries)
+            if self._loaded_generation is None:
+                return
+            for key, log in entries:
+                self._insert(key, log)
+
+    def invalidate(self):
+        """Forget everything; the next read reloads from the database"""
+        with self._lock:
+            self._version += 1
+            self._loaded_generation = None
+            self._pending = None
+            self._keys, self._logs = [], []
+            self._encoded.clear()
+
+    def get(self, limit: int) -> Optional[List[Dict]]:
+        """The newest ``limit`` logs, newest first, or None when ``limit`` exceeds the buffer"""
+        if limit > self.capacity:
+            return None
+        self._ensure_loaded()
+        with self._lock:
+            if self._loaded_generation is None:
+                return None
+            self.hits += 1
+            return self._logs[:-limit - 1:-1] if limit > 0 else []
+
+    def get_encoded(self, limit: int, build: Callable[[List[Dict]], Dict],
+                    variant: str = "") -> Optional[bytes]:
+        """A JSON body for the newest ``limit`` logs, built once per write
+
+        ``build`` turns the logs into the response payload; ``variant``
+        distinguishes payload shapes sharing the same page size.
+        """
+        key = (limit, variant)
+        with self._lock:
+            body = self._encoded.get(key)
+            version = self._version
+        if body is not None and self._loaded_generation == self.generation():
+            self.hits += 1
+            return body
+
+        logs = self.get(limit)
+        if logs is None:
+            return None
+        body = json.dumps(build(logs), separators=(",", ":")).encode()
+        with self._lock:
+            # Only memoize if no write landed while encoding
+            if version == self._version:
+                self._encoded[key] = body
+        return body
+
+    def _ensure_loaded(self):
+        if self._loaded_generation == self.generation():
+            return
+        with self._load_lock:
+            while True:
+                generation = self.generation()
+                with self._lock:
+                    if self._loaded_generation == generation:
+                        return
+                    self.misses += 1
+                    self._pending = []
+
+                entries = self.loader(self.capacity)
+
+                with self._lock:
+                    if self._pending is None:
+                        # Invalidated while loading; read again
+                        continue
+                    merged: Dict[int, Tuple[LogKey, Dict]] = {key[1]: (key, log) for key, log in entries}
+                    merged.update((key[1], (key, log)) for key, log in self._pending)
+                    self._pending = None
+                    ordered = sorted(merged.values(), key=lambda entry: entry[0])
+                    self._keys = [key for key, _ in ordered]
+                    self._logs = [log for _, log in ordered]
+                    self._trim()
+                    self._loaded_generation = generation
+                    self._encoded.clear()
+                    return
+
+    def _insert(self, key: LogKey, log: Dict):
+        if self._keys and key < self._keys[0] and len(self._keys) >= self.capacity:
+            return
+        if not self._keys or key > self._keys[-1]:
+            self._keys.append(key)
+            self._logs.append(log)
+        else:
+            index = bisect.bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                return
+            self._keys.insert(index, key)
+            self._logs.insert(index, log)
+        self._trim()
+
+    def _trim(self):
+        excess = len(self._keys) - self.capacity
+        if excess > 0:
+            del self._keys[:excess]
+            del self._logs[:excess]
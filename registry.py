@@ -0,0 +1,260 @@
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from models import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_USER = "Unknown"
+
+# Select list and join producing the ``(id, uid, user, timestamp)`` rows served by the API
+LOG_ROW_COLUMNS = f"l.id, l.uid, COALESCE(u.name, '{UNKNOWN_USER}'), l.timestamp"
+LOG_ROW_JOIN = "LEFT JOIN users u ON u.id = l.user_id"
+LOG_ROW_FROM = f"card_logs l {LOG_ROW_JOIN}"
+
+
+class Registry:
+    """CRUD access to the ``users``/``cards`` registry plus a UID lookup cache
+
+    Every scan resolves its UID to a user; a bounded LRU cache keeps that off
+    the database for active cards and is cleared whenever the registry
+    changes, so edits take effect on the very next scan.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", cache_size: int = 4096):
+        self.db_manager = db_manager
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[Optional[int], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._departments: Optional[Dict[int, Optional[str]]] = None
+        self._listeners: List[Callable[[], None]] = []
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, uid: str) -> Tuple[Optional[int], str]:
+        """Return ``(user_id, name)`` for a card; unknown cards map to ``(None, 'Unknown')``"""
+        return self.resolve_many((uid,))[uid]
+
+    def resolve_many(self, uids: Iterable[str], query_chunk: int = 500) -> Dict[str, Tuple[Optional[int], str]]:
+        """``resolve`` for a batch of scans, with one query per ``query_chunk`` cache misses"""
+        resolved: Dict[str, Tuple[Optional[int], str]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for uid in dict.fromkeys(uids):
+                cached = self._cache.get(uid)
+                if cached is not None:
+                    self._cache.move_to_end(uid)
+                    self.hits += 1
+                    resolved[uid] = cached
+                else:
+                    missing.append(uid)
+            self.misses += len(missing)
+            generation = self._generation
+        if not missing:
+            return resolved
+
+        found: Dict[str, Tuple[Optional[int], str]] = {}
+        with self.db_manager.connection() as conn:
+            for start in range(0, len(missing), query_chunk):
+                batch = missing[start:start + query_chunk]
+                found.update((row[0], (row[1], row[2])) for row in conn.execute(f'''
+                    SELECT c.uid, u.id, u.name
+                    FROM cards c
+                    JOIN users u ON u.id = c.user_id
+                    WHERE c.uid IN ({", ".join("?" * len(batch))})
+                ''', batch))
+
+        with self._lock:
+            # Skip caching lookups that raced with a registry change
+            cache = generation == self._generation
+            for uid in missing:
+                resolved[uid] = found.get(uid, (None, UNKNOWN_USER))
+                if cache:
+                    self._cache[uid] = resolved[uid]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return resolved
+
+    @property
+    def generation(self) -> int:
+        """Bumped on every registry change; caches of resolved names compare against it"""
+        return self._generation
+
+    def invalidate(self):
+        """Drop every cached UID resolution"""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+            self._departments = None
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call ``callback()`` after every change made through this registry"""
+        self._listeners.append(callback)
+
+    def _changed(self):
+        self.invalidate()
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                # The change is committed; a failing listener must not fail it
+                logger.error(f"Registry listener failed: {str(e)}")
+
+    def department_of(self, user_id: Optional[int]) -> Optional[str]:
+        """Department of a registered user, from a map cached until the next registry change"""
+        if user_id is None:
+            return None
+        departments = self._departments
+        if departments is None:
+            with self._lock:
+                generation = self._generation
+            with self.db_manager.connection() as conn:
+                departments = dict(conn.execute('SELECT id, department FROM users'))
+            with self._lock:
+                if generation == self._generation:
+                    self._departments = departments
+        return departments.get(user_id)
+
+    def list_users(self) -> List[Dict]:
+        """Get every registered user with their assigned cards"""
+        with self.db_manager.connection() as conn:
+            users = [self._user_dict(row) for row in conn.execute(
+                'SELECT id, name, department FROM users ORDER BY name')]
+            cards: Dict[int, List[str]] = {}
+            for uid, user_id in conn.execute('SELECT uid, user_id FROM cards ORDER BY uid'):
+                cards.setdefault(user_id, []).append(uid)
+        for user in users:
+            user["cards"] = cards.get(user["id"], [])
+        return users
+
+    def get_user(self, user_id: int) -> Optional[Dict]:
+        """Get one user with their assigned cards"""
+        with self.db_manager.connection() as conn:
+            row = conn.execute('SELECT id, name, department FROM users WHERE id = ?', (user_id,)).fetchone()
+            if row is None:
+                return None
+            user = self._user_dict(row)
+            user["cards"] = [r[0] for r in conn.execute(
+                'SELECT uid FROM cards WHERE user_id = ? ORDER BY uid', (user_id,))]
+        return user
+
+    def create_user(self, name: str, department: Optional[str] = None) -> Dict:
+        """Register a new user; raises ValueError on a blank or duplicate name"""
+        name = self._clean_name(name)
+        try:
+            with self.db_manager.connection() as conn:
+                cursor = conn.execute('INSERT INTO users (name, department) VALUES (?, ?)', (name, department))
+                user_id = cursor.lastrowid
+                conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError(f"User already exists: {name}")
+        self._changed()
+        return {"id": user_id, "name": name, "department": department, "cards": []}
+
+    def update_user(self, user_id: int, name: Optional[str] = None,
+                    department: Optional[str] = None) -> Optional[Dict]:
+        """Rename a user or change their department"""
+        updates, params = [], []
+        if name is not None:
+            updates.append('name = ?')
+            params.append(self._clean_name(name))
+        if department is not None:
+            updates.append('department = ?')
+            params.append(department or None)
+        if updates:
+            try:
+                with self.db_manager.connection() as conn:
+                    cursor = conn.execute(f"UPDATE users SET {', '.join(updates)} WHERE id = ?", (*params, user_id))
+                    if cursor.rowcount == 0:
+                        return None
+                    conn.commit()
+            except sqlite3.IntegrityError:
+                raise ValueError(f"User already exists: {name}")
+            self._changed()
+        return self.get_user(user_id)
+
+    def delete_user(self, user_id: int) -> bool:
+        """Delete a user and their cards; refused while scans still reference them"""
+        try:
+            with self.db_manager.connection() as conn:
+                cursor = conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+                deleted = cursor.rowcount > 0
+                conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError("User has scan history; unassign their cards instead")
+        self._changed()
+        return deleted
+
+    def list_cards(self) -> List[Dict]:
+        """Get every registered card with its owner"""
+        with self.db_manager.connection() as conn:
+            return [self._card_dict(row) for row in conn.execute('''
+                SELECT c.uid, c.user_id, u.name
+                FROM cards c
+                JOIN users u ON u.id = c.user_id
+                ORDER BY c.uid
+            ''')]
+
+    def get_card(self, uid: str) -> Optional[Dict]:
+        """Get one card with its owner"""
+        with self.db_manager.connection() as conn:
+            row = conn.execute('''
+                SELECT c.uid, c.user_id, u.name
+                FROM cards c
+                JOIN users u ON u.id = c.user_id
+                WHERE c.uid = ?
+            ''', (self.normalize_uid(uid),)).fetchone()
+        return self._card_dict(row) if row else None
+
+    def assign_card(self, uid: str, user_id: int) -> Dict:
+        """Register a card, or move it to another user"""
+        uid = self.normalize_uid(uid)
+        if not uid:
+            raise ValueError("UID is required")
+        try:
+            with self.db_manager.connection() as conn:
+                conn.execute('''
+                    INSERT INTO cards (uid, user_id) VALUES (?, ?)
+                    ON CONFLICT(uid) DO UPDATE SET user_id = excluded.user_id
+                ''', (uid, user_id))
+                conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Unknown user id: {user_id}")
+        self._changed()
+        return self.get_card(uid)
+
+    def delete_card(self, uid: str) -> bool:
+        """Unregister a card; later scans of it are logged as Unknown"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.execute('DELETE FROM cards WHERE uid = ?', (self.normalize_uid(uid),))
+            deleted = cursor.rowcount > 0
+            conn.commit()
+        self._changed()
+        return deleted
+
+    @staticmethod
+    def normalize_uid(uid: str) -> str:
+        """Card UIDs are stored as upper-case hex, as the reader firmware sends them"""
+        return (uid or "").strip().upper()
+
+    @staticmethod
+    def _clean_name(name: Optional[str]) -> str:
+        name = (name or "").strip()
+        if not name:
+            raise ValueError("Name is required")
+        if name == UNKNOWN_USER:
+            raise ValueError(f"'{UNKNOWN_USER}' is reserved for unregistered cards")
+        return name
+
+    @staticmethod
+    def _user_dict(row) -> Dict:
+        return {"id": row[0], "name": row[1], "department": row[2]}
+
+    @staticmethod
+    def _card_dict(row) -> Dict:
+        return {"uid": row[0], "user_id": row[1], "user": row[2]}
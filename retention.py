@@ -0,0 +1,173 @@
+import gzip
+import json
+import logging
+import os
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from registry import UNKNOWN_USER
+from timeutils import to_epoch_ms
+
+if TYPE_CHECKING:
+    from models import DatabaseManager
+    from partitions import Partition, PartitionManager
+    from stats import StatsManager
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class RetentionEngine:
+    """Delete expired scans in small id-range batches, archiving them first
+
+    Each batch is archived to ``card_logs_<YYYY-MM>.ndjson.gz`` (appended and
+    fsynced), then deleted in its own short transaction together with the
+    matching statistics update, and the engine sleeps before the next batch
+    so queued scans get the write lock in between. A crash between archiving
+    and deleting a batch can leave its rows archived twice; archive lines
+    carry the log id so duplicates are easy to drop.
+
+    Sealed partitions expire as a whole: once every log of the month is
+    past the cutoff, its rows are archived the same way and the file is
+    removed, with one catalog and statistics update. A month that is only
+    partly expired stays until the next cleanup after it fully is.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", stats: "StatsManager",
+                 archive_dir: Optional[str] = "log_archives", batch_size: int = 1000,
+                 pause: float = 0.05, partitions: Optional["PartitionManager"] = None):
+        self.db_manager = db_manager
+        self.stats = stats
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.pause = pause
+        self.partitions = partitions
+
+    def purge(self, days_to_keep: int, progress: Optional[ProgressCallback] = None) -> int:
+        """Archive and delete logs older than ``days_to_keep`` days; returns rows deleted"""
+        cutoff = to_epoch_ms(datetime.now() - timedelta(days=days_to_keep))
+
+        expired: List["Partition"] = []
+        if self.partitions is not None:
+            # Rows of an interrupted seal are in both places until it finishes
+            self.partitions.finish_pending()
+            expired = self.partitions.expired(cutoff)
+
+        with self.db_manager.connection() as conn:
+            first_id, last_id, hot_total = conn.execute(
+                'SELECT MIN(id), MAX(id), COUNT(*) FROM card_logs WHERE timestamp < ?', (cutoff,)
+            ).fetchone()
+        total = hot_total + sum(partition.rows for partition in expired)
+        if not total:
+            if progress:
+                progress(0, 0)
+            return 0
+
+        deleted = 0
+        for partition in expired:
+            deleted += self._drop_partition(partition)
+            if progress:
+                progress(deleted, total)
+
+        cursor_id = (first_id or 0) - 1
+        while hot_total and cursor_id < last_id:
+            batch = self._delete_batch(cursor_id, last_id, cutoff)
+            if not batch:
+                break
+            cursor_id = batch[-1][0]
+            deleted += len(batch)
+            if progress:
+                progress(deleted, total)
+            time.sleep(self.pause)
+
+        logger.info(f"Retention cleanup removed {deleted} logs older than {days_to_keep} days")
+        return deleted
+
+    def _delete_batch(self, after_id: int, last_id: int, cutoff: int) -> List[Tuple]:
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT l.id, l.uid, l.user_id, COALESCE(u.name, ?), l.timestamp
+                FROM card_logs l
+                LEFT JOIN users u ON u.id = l.user_id
+                WHERE l.id > ? AND l.id <= ? AND l.timestamp < ?
+                ORDER BY l.id
+                LIMIT ?
+            ''', (UNKNOWN_USER, after_id, last_id, cutoff, self.batch_size))
+            batch = cursor.fetchall()
+            if not batch:
+                return batch
+
+            if self.archive_dir:
+                self._archive(batch)
+
+            # Every expired row in [first, last] is in the batch, so the range delete matches it exactly
+            cursor.execute('''
+                DELETE FROM card_logs
+                WHERE id BETWEEN ? AND ? AND timestamp < ?
+            ''', (batch[0][0], batch[-1][0], cutoff))
+
+            per_user: Dict[int, int] = {}
+            per_day: Dict[str, int] = {}
+            self._tally(batch, per_user, per_day)
+            self.stats.record_deletes(conn, per_user, per_day)
+            conn.commit()
+        return batch
+
+    def _drop_partition(self, partition: "Partition") -> int:
+        """Archive a sealed partition's rows, unregister it and remove its file"""
+        per_user: Dict[int, int] = {}
+        per_day: Dict[str, int] = {}
+        with self.db_manager.connection() as conn:
+            users = dict(conn.execute('SELECT id, name FROM users').fetchall())
+        with closing(self.partitions.open(partition)) as sealed:
+            after_id = 0
+            while True:
+                rows = sealed.execute('''
+                    SELECT id, uid, user_id, timestamp FROM card_logs WHERE id > ? ORDER BY id LIMIT ?
+                ''', (after_id, self.batch_size)).fetchall()
+                if not rows:
+                    break
+                batch = [(log_id, uid, user_id, users.get(user_id, UNKNOWN_USER), timestamp)
+                         for log_id, uid, user_id, timestamp in rows]
+                if self.archive_dir:
+                    self._archive(batch)
+                self._tally(batch, per_user, per_day)
+                after_id = rows[-1][0]
+
+        with self.db_manager.connection() as conn:
+            self.partitions.unregister(partition, conn)
+            self.stats.record_deletes(conn, per_user, per_day)
+            conn.commit()
+        self.partitions.remove_file(partition)
+        logger.info(f"Retention cleanup dropped partition {partition.month} ({partition.rows} logs)")
+        return sum(per_user.values())
+
+    @staticmethod
+    def _tally(batch: List[Tuple], per_user: Dict[int, int], per_day: Dict[str, int]):
+        for _, _, user_id, _, timestamp in batch:
+            key = user_id or 0
+            per_user[key] = per_user.get(key, 0) + 1
+            day = time.strftime("%Y-%m-%d", time.localtime(timestamp // 1000))
+            per_day[day] = per_day.get(day, 0) + 1
+
+    def _archive(self, batch: List[Tuple]):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        by_month: Dict[str, List[str]] = {}
+        for log_id, uid, user_id, user, timestamp in batch:
+            month = time.strftime("%Y-%m", time.localtime(timestamp // 1000))
+            by_month.setdefault(month, []).append(json.dumps({
+                "id": log_id, "uid": uid, "user_id": user_id, "user": user, "timestamp": timestamp
+            }))
+
+        for month, lines in by_month.items():
+            path = os.path.join(self.archive_dir, f"card_logs_{month}.ndjson.gz")
+            # Appending adds a gzip member; readers see one continuous stream
+            with open(path, "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+                    archive.write(("\n".join(lines) + "\n").encode())
+                raw.flush()
+                os.fsync(raw.fileno())
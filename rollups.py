@@ -0,0 +1,348 @@
+import argparse
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from partitions import sealed_until
+from registry import UNKNOWN_USER
+from timeutils import from_epoch_ms
+
+if TYPE_CHECKING:
+    from models import DatabaseManager
+    from retention import ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+# Local-time bucket keys, matching the YYYY-MM-DD days of the statistics tables
+HOUR_SQL = "strftime('%Y-%m-%d %H', timestamp / 1000, 'unixepoch', 'localtime')"
+DAY_SQL = "DATE(timestamp / 1000, 'unixepoch', 'localtime')"
+
+# ``(table suffix, bucket column, key columns)`` of every rollup table
+ROLLUP_TABLES = (
+    ("hourly", "hour", "hour, user_id, uid"),
+    ("hourly_totals", "hour", "hour"),
+    ("daily", "day", "day, user_id, uid"),
+)
+
+
+def hour_key(timestamp_ms: int) -> str:
+    """Local ``YYYY-MM-DD HH`` bucket of an epoch-ms timestamp"""
+    return from_epoch_ms(timestamp_ms).strftime("%Y-%m-%d %H")
+
+
+def day_key(timestamp_ms: int) -> str:
+    """Local ``YYYY-MM-DD`` bucket of an epoch-ms timestamp"""
+    return from_epoch_ms(timestamp_ms).strftime("%Y-%m-%d")
+
+
+class RollupManager:
+    """Hourly and daily scan counts per user and card, for reporting
+
+    The rollup tables are folded forward from ``card_logs`` past a
+    checkpoint (the last log id aggregated) with set-based upserts, so
+    catching up costs one GROUP BY over the new rows however often it runs.
+    Retention cleanup never touches them: reports keep covering history
+    whose raw rows are gone. Unknown cards are counted under user id 0.
+
+    Attendance cards are tapped a few times a day, so per-card hourly rows
+    hardly compress the logs; fleet-wide hourly reports read a separate
+    table with one row per hour instead.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", chunk_size: int = 50000):
+        self.db_manager = db_manager
+        self.chunk_size = chunk_size
+        # One catch-up or rebuild at a time
+        self._lock = threading.Lock()
+        self.init_schema()
+
+    def init_schema(self):
+        """Create the rollup tables and their checkpoint"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_hourly (
+                    hour TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    uid TEXT NOT NULL,
+                    scans INTEGER NOT NULL,
+                    PRIMARY KEY (hour, user_id, uid)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_daily (
+                    day TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    uid TEXT NOT NULL,
+                    scans INTEGER NOT NULL,
+                    first_scan INTEGER NOT NULL,
+                    last_scan INTEGER NOT NULL,
+                    PRIMARY KEY (day, user_id, uid)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_hourly_totals (
+                    hour TEXT PRIMARY KEY,
+                    scans INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_hourly_user ON rollup_hourly(user_id, hour)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_daily_user ON rollup_daily(user_id, day)')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+
+    def checkpoint(self) -> int:
+        """Id of the last log folded into the rollups"""
+        with self.db_manager.connection() as conn:
+            return self._read_checkpoint(conn.cursor())
+
+    @staticmethod
+    def _read_checkpoint(cursor) -> int:
+        row = cursor.execute("SELECT value FROM rollup_state WHERE name = 'last_log_id'").fetchone()
+        return row[0] if row else 0
+
+    def catch_up(self, progress: Optional["ProgressCallback"] = None) -> int:
+        """Fold every log committed since the checkpoint into the rollups
+
+        Each chunk reads the checkpoint and folds under ``BEGIN IMMEDIATE``,
+        so another process catching up at the same time (a cluster worker,
+        the CLI) waits for the write lock and then sees the moved
+        checkpoint instead of folding the same logs again.
+        """
+        processed = 0
+        last_id = None
+        with self._lock:
+            while True:
+                with self.db_manager.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('BEGIN IMMEDIATE')
+                    if last_id is None:
+                        last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM card_logs').fetchone()[0]
+                    start = self._read_checkpoint(cursor)
+                    if start >= last_id:
+                        conn.commit()
+                        break
+                    end = min(start + self.chunk_size, last_id)
+                    processed += self._fold(cursor, 'rollup_', start, end)
+                    self._set_checkpoint(cursor, end)
+                    conn.commit()
+                if progress:
+                    progress(processed, None)
+        return processed
+
+    @staticmethod
+    def _fold(cursor, prefix: str, after_id: int, upto_id: int) -> int:
+        """Add the logs with ids in ``(after_id, upto_id]`` to the ``<prefix>*`` tables"""
+        cursor.execute(f'''
+            INSERT INTO {prefix}hourly_totals (hour, scans)
+            SELECT {HOUR_SQL}, COUNT(*)
+            FROM card_logs
+            WHERE id > ? AND id <= ?
+            GROUP BY 1
+            ON CONFLICT(hour) DO UPDATE SET scans = scans + excluded.scans
+        ''', (after_id, upto_id))
+        cursor.execute(f'''
+            INSERT INTO {prefix}hourly (hour, user_id, uid, scans)
+            SELECT {HOUR_SQL}, COALESCE(user_id, 0), uid, COUNT(*)
+            FROM card_logs
+            WHERE id > ? AND id <= ?
+            GROUP BY 1, 2, 3
+            ON CONFLICT(hour, user_id, uid) DO UPDATE SET scans = scans + excluded.scans
+        ''', (after_id, upto_id))
+        cursor.execute(f'''
+            INSERT INTO {prefix}daily (day, user_id, uid, scans, first_scan, last_scan)
+            SELECT {DAY_SQL}, COALESCE(user_id, 0), uid, COUNT(*), MIN(timestamp), MAX(timestamp)
+            FROM card_logs
+            WHERE id > ? AND id <= ?
+            GROUP BY 1, 2, 3
+            ON CONFLICT(day, user_id, uid) DO UPDATE SET
+                scans = scans + excluded.scans,
+                first_scan = MIN(first_scan, excluded.first_scan),
+                last_scan = MAX(last_scan, excluded.last_scan)
+        ''', (after_id, upto_id))
+        return cursor.execute('SELECT COUNT(*) FROM card_logs WHERE id > ? AND id <= ?',
+                              (after_id, upto_id)).fetchone()[0]
+
+    @staticmethod
+    def _set_checkpoint(cursor, last_id: int):
+        cursor.execute('''
+            INSERT INTO rollup_state (name, value) VALUES ('last_log_id', ?)
+            ON CONFLICT(name) DO UPDATE SET value = excluded.value
+        ''', (last_id,))
+
+    def rebuild(self, progress: Optional["ProgressCallback"] = None) -> Dict:
+        """Recompute the rollups from the logs still in ``card_logs``
+
+        Buckets are aggregated into temporary tables first, so the write
+        lock is only held for the final swap. Buckets before the one holding
+        the oldest retained log are kept as they are, and that bucket only
+        gains missing rows, since retention cleanup may have removed some of
+        its logs. Sealed partitions count as removed: their months keep the
+        buckets folded before they were sealed.
+        """
+        with self._lock:
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                oldest, last_id = cursor.execute('SELECT MIN(timestamp), MAX(id) FROM card_logs').fetchone()
+                if oldest is None:
+                    return {"logs_processed": 0, "hours": 0, "days": 0}
+                first_id = cursor.execute('SELECT MIN(id) FROM card_logs').fetchone()[0]
+                # Late scans dated in sealed months are folded, but cannot rebuild those months
+                oldest = max(oldest, sealed_until(cursor) or oldest)
+
+                for name, _, key in ROLLUP_TABLES:
+                    cursor.execute(f'DROP TABLE IF EXISTS temp.rebuild_{name}')
+                    cursor.execute(f'CREATE TEMP TABLE rebuild_{name} AS SELECT * FROM rollup_{name} WHERE 0')
+                    cursor.execute(f'CREATE UNIQUE INDEX temp.rebuild_{name}_key ON rebuild_{name}({key})')
+                conn.commit()
+
+                processed = 0
+                start = first_id - 1
+                while start < last_id:
+                    end = min(start + self.chunk_size, last_id)
+                    processed += self._fold(cursor, 'temp.rebuild_', start, end)
+                    conn.commit()
+                    start = end
+                    if progress:
+                        progress(processed, None)
+
+                # Swap and move the checkpoint in one transaction; the lock keeps catch-up out
+                oldest_bucket = {"hour": hour_key(oldest), "day": day_key(oldest)}
+                for name, bucket, _ in ROLLUP_TABLES:
+                    cutoff = oldest_bucket[bucket]
+                    cursor.execute(f'DELETE FROM rollup_{name} WHERE {bucket} > ?', (cutoff,))
+                    cursor.execute(f'INSERT INTO rollup_{name} SELECT * FROM temp.rebuild_{name} WHERE {bucket} > ?',
+                                   (cutoff,))
+                    # The partly pruned oldest bucket only gains rows it is missing
+                    cursor.execute(f'''
+                        INSERT OR IGNORE INTO rollup_{name}
+                        SELECT * FROM temp.rebuild_{name} WHERE {bucket} = ?
+                    ''', (cutoff,))
+                self._set_checkpoint(cursor, last_id)
+                conn.commit()
+                for name, _, _ in ROLLUP_TABLES:
+                    cursor.execute(f'DROP TABLE temp.rebuild_{name}')
+                hours = cursor.execute('SELECT COUNT(*) FROM rollup_hourly_totals').fetchone()[0]
+                days = cursor.execute('SELECT COUNT(DISTINCT day) FROM rollup_daily').fetchone()[0]
+
+        logger.info(f"Rollups rebuilt from {processed} logs: {hours} hours, {days} days")
+        return {"logs_processed": processed, "hours": hours, "days": days}
+
+    def _filters(self, conn, user: Optional[str], uid: Optional[str]) -> Tuple[List[str], List]:
+        """Conditions for a user (id or exact name) and/or card filter"""
+        conditions: List[str] = []
+        params: List = []
+        if user is not None:
+            if user.isdigit():
+                user_id = int(user)
+            else:
+                row = conn.execute('SELECT id FROM users WHERE name = ?', (user,)).fetchone()
+                user_id = row[0] if row else -1
+            conditions.append('r.user_id = ?')
+            params.append(user_id)
+        if uid is not None:
+            conditions.append('r.uid = ?')
+            params.append(uid)
+        return conditions, params
+
+    def _hourly(self, select: str, group: str, start_ms: int, end_ms: int, user: Optional[str],
+                uid: Optional[str], order: str = "1", limit: int = -1) -> List[Tuple]:
+        with self.db_manager.connection() as conn:
+            conditions, params = self._filters(conn, user, uid)
+            table = 'rollup_hourly' if conditions else 'rollup_hourly_totals'
+            return conn.execute(f'''
+                SELECT {select}
+                FROM {table} r
+                WHERE r.hour >= ? AND r.hour <= ? {''.join(' AND ' + c for c in conditions)}
+                GROUP BY {group}
+                ORDER BY {order}
+                LIMIT ?
+            ''', (hour_key(start_ms), hour_key(end_ms - 1), *params, limit)).fetchall()
+
+    def heatmap(self, start_ms: int, end_ms: int, user: Optional[str] = None,
+                uid: Optional[str] = None) -> List[List[int]]:
+        """Scans by local weekday (0 = Sunday) and hour of day, as a 7x24 matrix"""
+        matrix = [[0] * 24 for _ in range(7)]
+        rows = self._hourly("CAST(strftime('%w', r.hour || ':00') AS INTEGER), "
+                            "CAST(substr(r.hour, 12, 2) AS INTEGER), SUM(r.scans)",
+                            "1, 2", start_ms, end_ms, user, uid)
+        for weekday, hour, scans in rows:
+            matrix[weekday][hour] = scans
+        return matrix
+
+    def hourly(self, start_ms: int, end_ms: int, user: Optional[str] = None,
+               uid: Optional[str] = None) -> List[Dict]:
+        """Scans per local hour bucket, oldest first"""
+        rows = self._hourly("r.hour, SUM(r.scans)", "r.hour", start_ms, end_ms, user, uid)
+        return [{"hour": hour, "scans": scans} for hour, scans in rows]
+
+    def busiest_hours(self, start_ms: int, end_ms: int, limit: int = 10, user: Optional[str] = None,
+                      uid: Optional[str] = None) -> Dict:
+        """Hours of the day ranked by scans, plus the busiest individual hour buckets"""
+        by_hour = self._hourly("CAST(substr(r.hour, 12, 2) AS INTEGER), SUM(r.scans)", "1",
+                               start_ms, end_ms, user, uid, order="2 DESC, 1")
+        peaks = self._hourly("r.hour, SUM(r.scans)", "r.hour", start_ms, end_ms, user, uid,
+                             order="2 DESC, 1", limit=limit)
+        return {
+            "hours_of_day": [{"hour": hour, "scans": scans} for hour, scans in by_hour],
+            "peaks": [{"hour": hour, "scans": scans} for hour, scans in peaks]
+        }
+
+    def daily(self, start_ms: int, end_ms: int, user: Optional[str] = None,
+              uid: Optional[str] = None) -> List[Dict]:
+        """Scans and distinct users per local day, oldest first"""
+        with self.db_manager.connection() as conn:
+            conditions, params = self._filters(conn, user, uid)
+            rows = conn.execute(f'''
+                SELECT r.day, SUM(r.scans), COUNT(DISTINCT r.user_id)
+                FROM rollup_daily r
+                WHERE r.day >= ? AND r.day <= ? {''.join(' AND ' + c for c in conditions)}
+                GROUP BY r.day
+                ORDER BY r.day
+            ''', (day_key(start_ms), day_key(end_ms - 1), *params)).fetchall()
+        return [{"day": day, "scans": scans, "users": users} for day, scans, users in rows]
+
+    def user_totals(self, start_ms: int, end_ms: int, limit: int = 100, user: Optional[str] = None,
+                    uid: Optional[str] = None) -> List[Dict]:
+        """Scans, active days and first/last scan per user, busiest first"""
+        with self.db_manager.connection() as conn:
+            conditions, params = self._filters(conn, user, uid)
+            rows = conn.execute(f'''
+                SELECT r.user_id, COALESCE(u.name, '{UNKNOWN_USER}'), SUM(r.scans), COUNT(DISTINCT r.day),
+                       MIN(r.first_scan), MAX(r.last_scan)
+                FROM rollup_daily r
+                LEFT JOIN users u ON u.id = r.user_id
+                WHERE r.day >= ? AND r.day <= ? {''.join(' AND ' + c for c in conditions)}
+                GROUP BY r.user_id
+                ORDER BY 3 DESC, 1
+                LIMIT ?
+            ''', (day_key(start_ms), day_key(end_ms - 1), *params, limit)).fetchall()
+        return [{
+            "user_id": user_id or None,
+            "user": name,
+            "scans": scans,
+            "active_days": days,
+            "first_scan": from_epoch_ms(first).strftime("%Y-%m-%d %H:%M:%S"),
+            "last_scan": from_epoch_ms(last).strftime("%Y-%m-%d %H:%M:%S")
+        } for user_id, name, scans, days, first, last in rows]
+
+
+if __name__ == "__main__":
+    from config import Config
+    from models import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Reporting rollup maintenance")
+    parser.add_argument("command", choices=["catch-up", "rebuild"])
+    parser.add_argument("--db", default=Config.DATABASE_PATH, help="Database file path")
+    args = parser.parse_args()
+
+    rollups = RollupManager(DatabaseManager(args.db))
+    if args.command == "rebuild":
+        print(rollups.rebuild())
+    else:
+        print({"logs_processed": rollups.catch_up()})
@@ -1,51 +1,350 @@
-from flask import Blueprint, render_template, request, jsonify
+import itertools
+import os
+from flask import Blueprint, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 from flask_socketio import emit
-from models import LogManager
+from config import Config
+from models import DatabaseManager, LogManager
+from ingest import MAX_SEQ, BatchWriter, DuplicateScan, IngestQueueFull
+from database_utils import DatabaseUtils
+from scheduler import PeriodicTask
+from runtime import offload, offload_iter
+from jobs import JobManager
+from broadcast import Broadcaster
+from bus import create_bus
+from sessions import SessionEngine
+from export import FORMATS, REPORTS, ExportManager, check_format
+from writer_service import RemoteWriter, WriterService, log_from_event, log_to_event
+from binary_ingest import BinaryIngestServer
+import metrics
+from streaming import stream_csv, stream_ndjson
+from timeutils import parse_time_param, to_epoch_ms
 from datetime import datetime
 
 # Create blueprint
 api = Blueprint('api', __name__)
 
-# Initialize log manager
-log_manager = LogManager()
+# LogManager calls slower than this are logged with their arguments
+metrics.db_query.threshold = Config.SLOW_QUERY_MS / 1000
+
+# Initialize shared connection pool and log manager
+db_manager = DatabaseManager(
+    Config.DATABASE_PATH,
+    pool_size=Config.DATABASE_POOL_SIZE,
+    synchronous=Config.DATABASE_SYNCHRONOUS,
+    cache_size_kb=Config.DATABASE_CACHE_SIZE_KB,
+    mmap_size=Config.DATABASE_MMAP_SIZE
+)
+log_manager = LogManager(
+    db_manager=db_manager,
+    registry_cache_size=Config.REGISTRY_CACHE_SIZE,
+    archive_dir=Config.DATABASE_ARCHIVE_DIR if Config.DATABASE_ARCHIVE_ENABLED else None,
+    cleanup_batch_size=Config.DATABASE_CLEANUP_BATCH_SIZE,
+    cleanup_pause=Config.DATABASE_CLEANUP_PAUSE_MS / 1000,
+    recent_cache_size=Config.RECENT_CACHE_SIZE,
+    partition_dir=Config.PARTITION_DIR,
+    partition_hot_months=Config.PARTITION_HOT_MONTHS
+)
+registry = log_manager.registry
+
+# Group-commit writer shared by all /log requests; web workers of a
+# cluster forward their scans to the single writer process instead
+if Config.WORKER_ROLE == 'web':
+    ingest_writer = RemoteWriter(Config.WRITER_ADDRESS, Config.SECRET_KEY.encode())
+else:
+    ingest_writer = BatchWriter(
+        log_manager,
+        max_batch=Config.INGEST_BATCH_SIZE,
+        flush_interval=Config.INGEST_FLUSH_INTERVAL_MS / 1000,
+        max_queue=Config.INGEST_QUEUE_SIZE,
+        debounce_ms=Config.INGEST_DEBOUNCE_MS
+    )
+
+# Attendance sessions paired from committed taps; web workers of a cluster
+# only read the sessions the writer process maintains
+session_engine = SessionEngine(
+    db_manager,
+    timeout_ms=int(Config.SESSION_TIMEOUT_HOURS * 3600 * 1000),
+    debounce_ms=int(Config.SESSION_DEBOUNCE_SECONDS * 1000),
+    maintain=Config.WORKER_ROLE != 'web'
+)
+log_manager.add_listener(session_engine.submit)
+
+# Cross-process fan-out of committed logs and cache invalidations
+event_bus = create_bus(Config.EVENT_BUS_URL) if Config.WORKER_ROLE != 'standalone' else None
+
+# Online backups, taken on a schedule when enabled
+db_utils = DatabaseUtils(db_manager=db_manager, backup_dir=Config.DATABASE_BACKUP_DIR,
+                         partitions=log_manager.partitions)
+backup_task = PeriodicTask(
+    "database-backup",
+    Config.DATABASE_BACKUP_INTERVAL * 3600,
+    lambda: db_utils.run_scheduled_backup(Config.DATABASE_BACKUP_FULL_EVERY,
+                                          Config.DATABASE_BACKUP_RETENTION_DAYS)
+)
+
+def _after_restore():
+    """Drop everything cached from the database as it was before a restore"""
+    registry.invalidate()
+    log_manager.recent.invalidate()
+    session_engine.invalidate()
+    if isinstance(ingest_writer, BatchWriter):
+        ingest_writer.invalidate()
+    log_manager.stats.reconcile()
+    if event_bus is not None:
+        for event_type in ("registry", "recent", "sessions"):
+            event_bus.publish({"type": event_type})
+
+db_utils.add_restore_listener(_after_restore)
+
+# Background maintenance jobs; retention runs through the same queue
+job_manager = JobManager()
+
+def _cleanup_job(progress, days_to_keep: int) -> dict:
+    """Retention cleanup as a background job"""
+    deleted_count = log_manager.cleanup_old_logs(days_to_keep, progress)
+    if event_bus is not None:
+        event_bus.publish({"type": "recent"})
+    return {"deleted_count": deleted_count, "days_to_keep": days_to_keep}
+
+retention_task = PeriodicTask(
+    "log-retention",
+    Config.DATABASE_CLEANUP_INTERVAL * 3600,
+    lambda: job_manager.submit("cleanup", _cleanup_job, Config.DATABASE_CLEANUP_DAYS)
+)
+
+# Closed months move to sealed partition files; the logs themselves do not change
+seal_task = PeriodicTask(
+    "partition-seal",
+    Config.PARTITION_SEAL_INTERVAL * 3600,
+    lambda: job_manager.submit("seal", log_manager.seal_partitions)
+)
+
+# Reporting rollups folded forward from the newest logs
+rollup_task = PeriodicTask("rollups", Config.ROLLUP_INTERVAL_SECONDS, log_manager.rollups.catch_up,
+                           initial_delay=0)
+
+# Report files built in the background and downloaded afterwards
+export_manager = ExportManager(db_manager, Config.EXPORT_DIR, retention_hours=Config.EXPORT_RETENTION_HOURS,
+                               partitions=log_manager.partitions)
+
+def _export_job(progress, *args) -> dict:
+    """Report export as a background job"""
+    result = export_manager.export(progress, *args)
+    result["download_url"] = f"/api/exports/{result['file']}"
+    return result
+
+def _cursor_args() -> dict:
+    """Keyset pagination cursors from the query string"""
+    return {
+        "before_id": request.args.get('before_id', type=int),
+        "after_id": request.args.get('after_id', type=int)
+    }
+
+def _time_range(default_days: int, params=None):
+    """``[from, to)`` in epoch ms from ``params`` (default: the query string); defaults to the last ``default_days``
+    
+    Raises ValueError for unparseable or reversed bounds.
+    """
+    params = request.args if params is None else params
+    end_ms = parse_time_param(params.get('to'), end_of_day=True)
+    start_ms = parse_time_param(params.get('from'))
+    if end_ms is None:
+        end_ms = to_epoch_ms(datetime.now())
+    if start_ms is None:
+        start_ms = end_ms - default_days * 24 * 3600 * 1000
+    if start_ms >= end_ms:
+        raise ValueError("'from' must be earlier than 'to'")
+    return start_ms, end_ms
+
+def _page_info(logs: list, limit: int) -> dict:
+    """Cursors for the older (``next``) and newer (``prev``) neighbouring pages"""
+    return {
+        "count": len(logs),
+        "next_cursor": logs[-1]["id"] if logs and len(logs) == limit else None,
+        "prev_cursor": logs[0]["id"] if logs else None
+    }
+
+def _join_cluster(socketio):
+    """Wire this process into a multi-worker deployment through the event bus
+    
+    The writer publishes every committed batch; web workers replay it through
+    their own listeners (broadcaster, recent cache). Registry edits and
+    cleanups made by any process invalidate the caches of the others.
+    """
+    def on_event(event):
+        if event["type"] == "logs":
+            log_manager.notify_committed([log_from_event(log) for log in event["logs"]])
+        elif event["type"] == "registry":
+            registry.invalidate()
+        elif event["type"] == "recent":
+            log_manager.recent.invalidate()
+        elif event["type"] == "sessions":
+            session_engine.invalidate()
+    
+    registry.add_listener(lambda: event_bus.publish({"type": "registry"}))
+    if Config.WORKER_ROLE == 'writer':
+        log_manager.add_listener(lambda logs: event_bus.publish(
+            {"type": "logs", "logs": [log_to_event(log) for log in logs]}))
+        session_engine.add_listener(lambda: event_bus.publish({"type": "sessions"}))
+        WriterService(ingest_writer, Config.WRITER_ADDRESS, Config.SECRET_KEY.encode(),
+                      timeout=Config.INGEST_TIMEOUT, spawn=socketio.start_background_task).start()
+    # Subscribe before the broadcaster reads the last id so no batch falls in between
+    event_bus.start(on_event)
+
+def _register_metrics(app, broadcaster):
+    """Time requests and refresh the live gauges on every scrape"""
+    metrics.instrument_app(app)
+    metrics.WORKER_INFO.set(1, role=Config.WORKER_ROLE, pid=os.getpid())
+    
+    def file_size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    
+    def collect():
+        metrics.INGEST_QUEUE_DEPTH.set(ingest_writer.qsize())
+        metrics.SOCKETIO_CLIENTS.set(broadcaster.client_count())
+        metrics.DB_SIZE_BYTES.set(file_size(Config.DATABASE_PATH), file="main")
+        metrics.DB_SIZE_BYTES.set(file_size(Config.DATABASE_PATH + "-wal"), file="wal")
+        metrics.DB_SIZE_BYTES.set(sum(file_size(log_manager.partitions.path(partition))
+                                      for partition in log_manager.partitions.catalog()), file="partitions")
+    
+    metrics.REGISTRY.add_collector(collect)
 
 def init_routes(app, socketio):
     """Initialize routes with the Flask app and SocketIO instance"""
     
+    # Committed scans are pushed to dashboards in coalesced frames
+    broadcaster = Broadcaster(
+        socketio,
+        interval=Config.BROADCAST_INTERVAL_MS / 1000,
+        max_frame=Config.BROADCAST_MAX_FRAME,
+        max_unacked=Config.BROADCAST_MAX_UNACKED,
+        history_size=Config.BROADCAST_HISTORY_SIZE,
+        stats_provider=log_manager.get_stats
+    )
+    
+    def publish_logs(logs):
+        for log in logs:
+            department = registry.department_of(log.user_id)
+            rooms = (f"dept:{department}",) if department else ()
+            if log.reader_id is not None:
+                rooms += (f"reader:{log.reader_id}",)
+            broadcaster.publish(log.to_dict(), rooms)
+    
+    log_manager.add_listener(publish_logs)
+    if Config.METRICS_ENABLED:
+        _register_metrics(app, broadcaster)
+    if event_bus is not None:
+        _join_cluster(socketio)
+    broadcaster.start(log_manager.get_last_id())
+    ingest_writer.start()
+    session_engine.start()
+    if Config.WORKER_ROLE != 'web':
+        # Scheduled maintenance runs once per deployment, in the writer
+        if Config.DATABASE_BACKUP_ENABLED:
+            backup_task.start()
+        if Config.DATABASE_CLEANUP_DAYS > 0:
+            retention_task.start()
+        if Config.PARTITION_HOT_MONTHS > 0:
+            seal_task.start()
+        rollup_task.start()
+        if Config.BINARY_INGEST_UDP or Config.BINARY_INGEST_TCP:
+            # Low-power readers send binary frames straight to the local writer
+            BinaryIngestServer(ingest_writer, udp_address=Config.BINARY_INGEST_UDP,
+                               tcp_address=Config.BINARY_INGEST_TCP,
+                               max_pending=Config.BINARY_INGEST_MAX_PENDING).start()
+    
     @app.route("/")
     def home():
         return render_template('index.html')
     
     @app.route("/log", methods=["POST"])
     def log_card():
+        # The user is resolved from the card registry; any "user" field is ignored
         uid = request.form.get("uid")
-        user = request.form.get("user", "Unknown")
         
         if not uid:
             return jsonify({"error": "Missing UID"}), 400
         
+        # Optional idempotency key: a reader resending the same seq after a
+        # timeout gets the original log back instead of a second row
+        reader_id = request.form.get("reader_id") or None
+        seq = request.form.get("seq")
+        if reader_id is not None and len(reader_id) > 64:
+            return jsonify({"error": "reader_id must be at most 64 characters"}), 400
+        if seq is not None:
+            if reader_id is None:
+                return jsonify({"error": "seq requires a reader_id"}), 400
+            try:
+                # isdigit() accepts superscripts that int() rejects
+                if not seq.isdecimal():
+                    raise ValueError(seq)
+                seq = int(seq)
+                if seq > MAX_SEQ:
+                    raise ValueError(seq)
+            except ValueError:
+                return jsonify({"error": f"seq must be an integer from 0 to {MAX_SEQ}"}), 400
+        
         try:
-            # Add log entry to database
-            log_entry = log_manager.add_log(uid, user)
+            # Queue log entry and wait for its batch to be committed;
+            # dashboards are updated by the broadcaster, not this request
+            if Config.WORKER_ROLE == 'web':
+                # Forwarded to the writer process over a cooperative socket
+                log_entry = ingest_writer.add_log(uid, timeout=Config.INGEST_TIMEOUT, reader_id=reader_id, seq=seq)
+            else:
+                log_entry = offload(ingest_writer.add_log, uid, timeout=Config.INGEST_TIMEOUT,
+                                    reader_id=reader_id, seq=seq)
             log_data = log_entry.to_dict()
-            
-            # Emit real-time update
-            socketio.emit("new_log", log_data)
+            metrics.SCANS_TOTAL.inc(transport="http", result="stored")
             
             return jsonify({"message": "Log entry created", "log": log_data}), 200
+        except DuplicateScan as e:
+            # Still a success for the reader, so it stops retrying
+            metrics.SCANS_TOTAL.inc(transport="http", result="duplicate")
+            return jsonify({"message": "Duplicate scan ignored", "log": e.log.to_dict(),
+                            "duplicate": e.reason}), 200
+        except IngestQueueFull:
+            metrics.SCANS_TOTAL.inc(transport="http", result="busy")
+            return jsonify({"error": "Server busy, retry shortly"}), 503
         except Exception as e:
+            metrics.SCANS_TOTAL.inc(transport="http", result="error")
             return jsonify({"error": f"Failed to create log entry: {str(e)}"}), 500
     
     @app.route("/api/logs")
     def get_logs():
-        """Get recent logs"""
+        """Get recent logs, or with ``since_id`` every log committed after that id"""
         try:
             limit = request.args.get('limit', 50, type=int)
             if limit > 1000:  # Prevent excessive queries
                 limit = 1000
+            if limit < 0:  # SQLite reads a negative LIMIT as no limit at all
+                limit = 0
+            
+            # The logs of the dashboard rooms, e.g. ?dept=Operations&reader=lobby
+            rooms = {"departments": request.args.getlist('dept'), "readers": request.args.getlist('reader')}
+            since_id = request.args.get('since_id', type=int)
+            if since_id is not None:
+                # Delta sync: oldest first, resume from ``last_id`` while ``has_more``
+                logs = offload(log_manager.get_logs_since, since_id, limit, **rooms)
+                return jsonify({
+                    "logs": logs,
+                    "count": len(logs),
+                    "last_id": logs[-1]["id"] if logs else since_id,
+                    "has_more": bool(logs) and len(logs) == limit
+                })
             
-            logs = log_manager.get_recent_logs(limit)
-            return jsonify({"logs": logs, "count": len(logs)})
+            cursors = _cursor_args()
+            if cursors["before_id"] is None and cursors["after_id"] is None and not any(rooms.values()):
+                # The latest page is pre-encoded in memory and rebuilt once per write
+                body = offload(log_manager.recent.get_encoded, limit,
+                               lambda logs: {"logs": logs, **_page_info(logs, limit)})
+                if body is not None:
+                    return Response(body, mimetype='application/json')
+            
+            logs = offload(log_manager.get_recent_logs, limit, **cursors, **rooms)
+            return jsonify({"logs": logs, **_page_info(logs, limit)})
         except Exception as e:
             return jsonify({"error": f"Failed to fetch logs: {str(e)}"}), 500
     
@@ -53,14 +352,25 @@ def init_routes(app, socketio):
     def get_stats():
         """Get current statistics"""
         try:
-            stats = log_manager.get_stats()
+            stats = offload(log_manager.get_stats)
             return jsonify(stats)
         except Exception as e:
             return jsonify({"error": f"Failed to fetch stats: {str(e)}"}), 500
     
+    @app.route("/api/stats/reconcile", methods=["POST"])
+    def reconcile_stats():
+        """Rebuild statistics counters from scratch (admin function)"""
+        if Config.WORKER_ROLE == 'web':
+            return jsonify({"error": "Statistics are reconciled by the writer process"}), 409
+        try:
+            stats = offload(log_manager.stats.reconcile)
+            return jsonify({"message": "Statistics reconciled", "stats": stats})
+        except Exception as e:
+            return jsonify({"error": f"Reconcile failed: {str(e)}"}), 500
+    
     @app.route("/api/search")
     def search_logs():
-        """Search logs by UID or user name"""
+        """Search logs by UID or user name prefix, optionally within [from, to)"""
         try:
             search_term = request.args.get('q', '')
             limit = request.args.get('limit', 50, type=int)
@@ -70,9 +380,18 @@ def init_routes(app, socketio):
             
             if limit > 1000:
                 limit = 1000
+            if limit < 0:
+                limit = 0
             
-            logs = log_manager.search_logs(search_term, limit)
-            return jsonify({"logs": logs, "count": len(logs), "search_term": search_term})
+            try:
+                start_ms = parse_time_param(request.args.get('from'))
+                end_ms = parse_time_param(request.args.get('to'), end_of_day=True)
+            except ValueError:
+                return jsonify({"error": "Invalid from/to. Use epoch ms, ISO datetime or YYYY-MM-DD"}), 400
+            
+            logs = offload(log_manager.search_logs, search_term, limit, start_ms=start_ms, end_ms=end_ms,
+                           **_cursor_args())
+            return jsonify({"logs": logs, **_page_info(logs, limit), "search_term": search_term})
         except Exception as e:
             return jsonify({"error": f"Search failed: {str(e)}"}), 500
     
@@ -89,35 +408,418 @@ def init_routes(app, socketio):
             limit = request.args.get('limit', 50, type=int)
             if limit > 1000:
                 limit = 1000
+            if limit < 0:
+                limit = 0
             
-            logs = log_manager.get_logs_by_date(date, limit)
-            return jsonify({"logs": logs, "count": len(logs), "date": date})
+            logs = offload(log_manager.get_logs_by_date, date, limit, **_cursor_args())
+            return jsonify({"logs": logs, **_page_info(logs, limit), "date": date})
         except Exception as e:
             return jsonify({"error": f"Failed to fetch logs for date: {str(e)}"}), 500
     
+    @app.route("/api/logs/range")
+    def get_logs_by_range():
+        """Get logs between ``from`` (inclusive) and ``to`` (exclusive)
+        
+        Both accept epoch milliseconds, ISO datetimes or YYYY-MM-DD dates;
+        a bare ``to`` date includes that whole day.
+        """
+        try:
+            try:
+                start_ms = parse_time_param(request.args.get('from'))
+                end_ms = parse_time_param(request.args.get('to'), end_of_day=True)
+            except ValueError:
+                return jsonify({"error": "Invalid from/to. Use epoch ms, ISO datetime or YYYY-MM-DD"}), 400
+            
+            if start_ms is not None and end_ms is not None and start_ms >= end_ms:
+                return jsonify({"error": "'from' must be earlier than 'to'"}), 400
+            
+            limit = request.args.get('limit', 50, type=int)
+            if limit > 1000:
+                limit = 1000
+            if limit < 0:
+                limit = 0
+            
+            logs = offload(log_manager.get_logs_in_range, start_ms, end_ms, limit, **_cursor_args())
+            return jsonify({
+                "logs": logs,
+                **_page_info(logs, limit),
+                "from": request.args.get('from'),
+                "to": request.args.get('to')
+            })
+        except Exception as e:
+            return jsonify({"error": f"Failed to fetch logs for range: {str(e)}"}), 500
+    
+    @app.route("/api/logs/export")
+    def export_logs():
+        """Stream every log in ``[from, to)`` as NDJSON or CSV, oldest first"""
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({"error": "Format must be 'ndjson' or 'csv'"}), 400
+        
+        try:
+            start_ms = parse_time_param(request.args.get('from'))
+            end_ms = parse_time_param(request.args.get('to'), end_of_day=True)
+        except ValueError:
+            return jsonify({"error": "Invalid from/to. Use epoch ms, ISO datetime or YYYY-MM-DD"}), 400
+        
+        try:
+            rows = offload_iter(log_manager.iter_log_rows(start_ms, end_ms))
+            # Run the query before the headers go out, so a failure is still a JSON error
+            first = next(rows, None)
+            rows = itertools.chain([first], rows) if first is not None else iter(())
+            if export_format == 'csv':
+                body, mimetype = stream_csv(rows), 'text/csv'
+            else:
+                body, mimetype = stream_ndjson(rows), 'application/x-ndjson'
+            
+            response = Response(stream_with_context(body), mimetype=mimetype)
+            response.headers['Content-Disposition'] = f'attachment; filename=rfid_logs.{export_format}'
+            return response
+        except Exception as e:
+            return jsonify({"error": f"Failed to export logs: {str(e)}"}), 500
+    
+    @app.route("/api/presence")
+    def presence():
+        """Cards currently checked in, served from memory"""
+        try:
+            present = offload(session_engine.presence)
+            return jsonify({"present": present, "count": len(present)})
+        except Exception as e:
+            return jsonify({"error": f"Failed to fetch presence: {str(e)}"}), 500
+    
+    @app.route("/api/attendance")
+    def attendance():
+        """Time present per user in ``[from, to)`` (default: the last 7 days)
+        
+        ``user`` (id or exact name) or ``uid`` narrows the report and lists
+        the matching sessions.
+        """
+        try:
+            try:
+                start_ms, end_ms = _time_range(7)
+            except ValueError:
+                return jsonify({"error": "Invalid from/to. Use epoch ms, ISO datetime or YYYY-MM-DD, "
+                                         "with 'from' before 'to'"}), 400
+            
+            uid = request.args.get('uid')
+            report = offload(session_engine.attendance, start_ms, end_ms, request.args.get('user'),
+                             registry.normalize_uid(uid) if uid else None)
+            return jsonify({**report, "from": request.args.get('from'), "to": request.args.get('to')})
+        except Exception as e:
+            return jsonify({"error": f"Failed to fetch attendance: {str(e)}"}), 500
+    
+    @app.route("/api/sessions/rebuild", methods=["POST"])
+    def rebuild_sessions():
+        """Re-pair every retained log into sessions (admin function); poll the returned job"""
+        if not session_engine.maintain:
+            return jsonify({"error": "Sessions are maintained by the writer process"}), 409
+        try:
+            job_id = job_manager.submit("sessions-rebuild", session_engine.rebuild)
+            return jsonify({
+                "message": "Session rebuild started",
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}"
+            }), 202
+        except Exception as e:
+            return jsonify({"error": f"Session rebuild failed: {str(e)}"}), 500
+    
+    def _report(name: str, build):
+        """Run a rollup query over the requested range (default: the last 30 days)"""
+        try:
+            try:
+                start_ms, end_ms = _time_range(30)
+            except ValueError:
+                return jsonify({"error": "Invalid from/to. Use epoch ms, ISO datetime or YYYY-MM-DD, "
+                                         "with 'from' before 'to'"}), 400
+            uid = request.args.get('uid')
+            filters = {"user": request.args.get('user'), "uid": registry.normalize_uid(uid) if uid else None}
+            result = offload(build, start_ms, end_ms, filters)
+            return jsonify({**result, "from": request.args.get('from'), "to": request.args.get('to')})
+        except Exception as e:
+            return jsonify({"error": f"Failed to build {name} report: {str(e)}"}), 500
+    
+    @app.route("/api/reports/heatmap")
+    def report_heatmap():
+        """Scans by weekday (0 = Sunday) and hour of day"""
+        return _report("heatmap", lambda start, end, filters: {
+            "heatmap": log_manager.rollups.heatmap(start, end, **filters)
+        })
+    
+    @app.route("/api/reports/hourly")
+    def report_hourly():
+        """Scans per hour, optionally for one user or card"""
+        return _report("hourly", lambda start, end, filters: {
+            "hours": log_manager.rollups.hourly(start, end, **filters)
+        })
+    
+    @app.route("/api/reports/daily")
+    def report_daily():
+        """Scans and distinct users per day, optionally for one user or card"""
+        return _report("daily", lambda start, end, filters: {
+            "days": log_manager.rollups.daily(start, end, **filters)
+        })
+    
+    @app.route("/api/reports/busiest-hours")
+    def report_busiest_hours():
+        """Hours of the day ranked by scans, plus the busiest individual hours"""
+        limit = min(request.args.get('limit', 10, type=int), 1000)
+        return _report("busiest hours", lambda start, end, filters:
+                       log_manager.rollups.busiest_hours(start, end, limit, **filters))
+    
+    @app.route("/api/reports/users")
+    def report_users():
+        """Per-user scan totals, active days and first/last scan"""
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        return _report("users", lambda start, end, filters: {
+            "users": log_manager.rollups.user_totals(start, end, limit, **filters)
+        })
+    
+    @app.route("/api/reports/rebuild", methods=["POST"])
+    def rebuild_reports():
+        """Recompute the rollups from the retained logs (admin function); poll the returned job"""
+        if Config.WORKER_ROLE == 'web':
+            return jsonify({"error": "Rollups are maintained by the writer process"}), 409
+        try:
+            job_id = job_manager.submit("rollups-rebuild", log_manager.rollups.rebuild)
+            return jsonify({
+                "message": "Rollup rebuild started",
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}"
+            }), 202
+        except Exception as e:
+            return jsonify({"error": f"Rollup rebuild failed: {str(e)}"}), 500
+    
+    @app.route("/api/exports", methods=["GET", "POST"])
+    def exports():
+        """List finished export files, or start building one; poll the returned job"""
+        try:
+            if request.method == "GET":
+                files = offload(export_manager.list_files)
+                for item in files:
+                    item["download_url"] = f"/api/exports/{item['file']}"
+                return jsonify({"exports": files, "count": len(files)})
+            
+            data = request.get_json(silent=True) or {}
+            report = data.get('report', 'daily')
+            export_format = data.get('format', 'csv')
+            if report not in REPORTS:
+                return jsonify({"error": f"Report must be one of: {', '.join(REPORTS)}"}), 400
+            try:
+                check_format(export_format)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except RuntimeError as e:
+                return jsonify({"error": str(e)}), 501
+            try:
+                start_ms, end_ms = _time_range(30, {k: str(v) for k, v in data.items() if k in ('from', 'to')})
+            except ValueError:
+                return jsonify({"error": "Invalid from/to. Use epoch ms, ISO datetime or YYYY-MM-DD, "
+                                         "with 'from' before 'to'"}), 400
+            user = str(data['user']) if data.get('user') is not None else None
+            uid = registry.normalize_uid(data['uid']) if data.get('uid') else None
+            
+            job_id = job_manager.submit("export", _export_job, report, export_format,
+                                        start_ms, end_ms, user, uid)
+            return jsonify({
+                "message": "Export started",
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}"
+            }), 202
+        except Exception as e:
+            return jsonify({"error": f"Export failed: {str(e)}"}), 500
+    
+    @app.route("/api/exports/<path:name>")
+    def download_export(name):
+        """Download a finished export file"""
+        extension = name.rsplit('.', 1)[-1]
+        if extension not in FORMATS:
+            return jsonify({"error": "Export not found"}), 404
+        return send_from_directory(os.path.abspath(export_manager.export_dir), name, as_attachment=True,
+                                   mimetype=FORMATS[extension])
+    
+    @app.route("/api/users", methods=["GET", "POST"])
+    def users():
+        """List registered users or register a new one"""
+        try:
+            if request.method == "GET":
+                users = offload(registry.list_users)
+                return jsonify({"users": users, "count": len(users)})
+            
+            data = request.get_json(silent=True) or {}
+            user = offload(registry.create_user, data.get('name'), data.get('department'))
+            return jsonify({"message": "User created", "user": user}), 201
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": f"User operation failed: {str(e)}"}), 500
+    
+    @app.route("/api/users/<int:user_id>", methods=["GET", "PUT", "DELETE"])
+    def user_detail(user_id):
+        """Get, update or delete a registered user"""
+        try:
+            if request.method == "DELETE":
+                try:
+                    if not offload(registry.delete_user, user_id):
+                        return jsonify({"error": "User not found"}), 404
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 409
+                return jsonify({"message": "User deleted", "id": user_id})
+            
+            if request.method == "PUT":
+                data = request.get_json(silent=True) or {}
+                user = offload(registry.update_user, user_id, data.get('name'), data.get('department'))
+            else:
+                user = offload(registry.get_user, user_id)
+            
+            if user is None:
+                return jsonify({"error": "User not found"}), 404
+            return jsonify({"user": user})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": f"User operation failed: {str(e)}"}), 500
+    
+    @app.route("/api/cards", methods=["GET", "POST"])
+    def cards():
+        """List registered cards or assign a card to a user"""
+        try:
+            if request.method == "GET":
+                cards = offload(registry.list_cards)
+                return jsonify({"cards": cards, "count": len(cards)})
+            
+            data = request.get_json(silent=True) or {}
+            if not isinstance(data.get('user_id'), int):
+                return jsonify({"error": "user_id must be an integer"}), 400
+            card = offload(registry.assign_card, data.get('uid'), data['user_id'])
+            return jsonify({"message": "Card assigned", "card": card}), 201
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": f"Card operation failed: {str(e)}"}), 500
+    
+    @app.route("/api/cards/<uid>", methods=["GET", "PUT", "DELETE"])
+    def card_detail(uid):
+        """Get, reassign or unregister a card"""
+        try:
+            if request.method == "DELETE":
+                if not offload(registry.delete_card, uid):
+                    return jsonify({"error": "Card not found"}), 404
+                return jsonify({"message": "Card deleted", "uid": uid})
+            
+            if request.method == "PUT":
+                data = request.get_json(silent=True) or {}
+                if not isinstance(data.get('user_id'), int):
+                    return jsonify({"error": "user_id must be an integer"}), 400
+                card = offload(registry.assign_card, uid, data['user_id'])
+            else:
+                card = offload(registry.get_card, uid)
+            
+            if card is None:
+                return jsonify({"error": "Card not found"}), 404
+            return jsonify({"card": card})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": f"Card operation failed: {str(e)}"}), 500
+    
+    @app.route("/api/backups", methods=["GET", "POST"])
+    def backups():
+        """List backups or take one now (``{"type": "full"|"incremental"}``)"""
+        try:
+            if request.method == "GET":
+                backup_files = offload(db_utils.list_backups)
+                return jsonify({"backups": backup_files, "count": len(backup_files)})
+            
+            if Config.WORKER_ROLE == 'web':
+                return jsonify({"error": "Backups are taken by the writer process"}), 409
+            data = request.get_json(silent=True) or {}
+            backup_type = data.get('type', 'full')
+            if backup_type == 'full':
+                backup_path = offload(db_utils.create_backup)
+            elif backup_type == 'incremental':
+                backup_path = offload(db_utils.create_incremental_backup)
+            else:
+                return jsonify({"error": "Type must be 'full' or 'incremental'"}), 400
+            # An incremental backup without a chain to extend starts one with a full backup
+            created_type = 'incremental' if backup_path.endswith('.pages.gz') else 'full'
+            return jsonify({"message": "Backup created", "path": backup_path, "type": created_type}), 201
+        except Exception as e:
+            return jsonify({"error": f"Backup failed: {str(e)}"}), 500
+    
     @app.route("/api/cleanup", methods=["POST"])
     def cleanup_logs():
-        """Clean up old logs (admin function)"""
+        """Start archiving and removing old logs (admin function); poll the returned job"""
+        if Config.WORKER_ROLE == 'web':
+            return jsonify({"error": "Old logs are removed by the writer process"}), 409
         try:
-            days_to_keep = request.json.get('days_to_keep', 90)
+            data = request.get_json(silent=True) or {}
+            days_to_keep = data.get('days_to_keep', Config.DATABASE_CLEANUP_DAYS)
             
-            if days_to_keep < 1:
-                return jsonify({"error": "Days to keep must be at least 1"}), 400
+            # JSON true/false are ints to isinstance; false would empty the hot table
+            if isinstance(days_to_keep, bool) or not isinstance(days_to_keep, int) or days_to_keep < 1:
+                return jsonify({"error": "Days to keep must be a whole number of at least 1"}), 400
             
-            deleted_count = log_manager.cleanup_old_logs(days_to_keep)
+            job_id = job_manager.submit("cleanup", _cleanup_job, days_to_keep)
             return jsonify({
-                "message": f"Cleanup completed",
-                "deleted_count": deleted_count,
+                "message": "Cleanup started",
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}",
                 "days_to_keep": days_to_keep
-            })
+            }), 202
         except Exception as e:
             return jsonify({"error": f"Cleanup failed: {str(e)}"}), 500
     
+    @app.route("/api/partitions", methods=["GET", "POST"])
+    def partitions():
+        """List sealed monthly partitions, or seal closed months now (admin function)"""
+        try:
+            if request.method == "GET":
+                items = offload(log_manager.partitions.list_partitions)
+                return jsonify({"partitions": items, "count": len(items),
+                                "hot_months": log_manager.partitions.hot_months})
+            
+            if Config.WORKER_ROLE == 'web':
+                return jsonify({"error": "Partitions are sealed by the writer process"}), 409
+            if Config.PARTITION_HOT_MONTHS <= 0:
+                return jsonify({"error": "Partitioning is disabled (PARTITION_HOT_MONTHS=0)"}), 409
+            job_id = job_manager.submit("seal", log_manager.seal_partitions)
+            return jsonify({
+                "message": "Sealing started",
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}"
+            }), 202
+        except Exception as e:
+            return jsonify({"error": f"Partition operation failed: {str(e)}"}), 500
+    
+    @app.route("/api/jobs")
+    def list_jobs():
+        """List recent background jobs"""
+        jobs = job_manager.list()
+        return jsonify({"jobs": jobs, "count": len(jobs)})
+    
+    @app.route("/api/jobs/<job_id>")
+    def get_job(job_id):
+        """Get the status and progress of a background job"""
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"job": job})
+    
+    @app.route("/metrics")
+    def metrics_endpoint():
+        """Prometheus metrics of this process"""
+        if not Config.METRICS_ENABLED:
+            return jsonify({"error": "Metrics are disabled (METRICS_ENABLED=false)"}), 404
+        try:
+            return Response(offload(metrics.REGISTRY.render), content_type=metrics.CONTENT_TYPE)
+        except Exception as e:
+            return jsonify({"error": f"Failed to render metrics: {str(e)}"}), 500
+    
     @app.route("/api/health")
     def health_check():
         """Health check endpoint"""
         try:
-            stats = log_manager.get_stats()
+            stats = offload(log_manager.get_stats)
             return jsonify({
                 "status": "healthy", 
                 "timestamp": datetime.now().isoformat(),
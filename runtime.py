@@ -0,0 +1,91 @@
+import importlib
+import os
+import selectors
+import socket
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from config import Config
+
+T = TypeVar("T")
+
+SERVER_MODES = ("threading", "eventlet", "gevent")
+
+
+def monkey_patch(mode: str = Config.SERVER_MODE):
+    """Make sockets cooperative for the green server modes
+
+    Must run before Flask or any networking module is imported. Threads are
+    left native on purpose: the ingest writer, scheduled jobs and the offload
+    pool below need real OS threads so SQLite calls never block the hub.
+    """
+    if mode == "eventlet":
+        os.environ.setdefault("EVENTLET_THREADPOOL_SIZE", str(Config.OFFLOAD_THREADS))
+        import eventlet
+        eventlet.monkey_patch(thread=False)
+    elif mode == "gevent":
+        from gevent import get_hub, monkey
+        monkey.patch_all(thread=False, queue=False)
+        get_hub().threadpool.maxsize = Config.OFFLOAD_THREADS
+    elif mode != "threading":
+        raise ValueError(f"Unknown SERVER_MODE '{mode}', expected one of {', '.join(SERVER_MODES)}")
+
+
+def _original(module: str, name: str) -> Any:
+    """``module.name`` as it was before ``monkey_patch``"""
+    if Config.SERVER_MODE == "eventlet":
+        from eventlet import patcher
+        return getattr(patcher.original(module), name)
+    if Config.SERVER_MODE == "gevent":
+        from gevent import monkey
+        return monkey.get_original(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+def native_selector() -> selectors.BaseSelector:
+    """A selector that blocks its OS thread, for an asyncio loop running beside the hub
+
+    The patched ``select`` would try to switch to the green hub, which does
+    not run on that thread.
+    """
+    if Config.SERVER_MODE == "threading":
+        return selectors.DefaultSelector()
+    # The stdlib PollSelector, bound to the unpatched poll(2)
+    selector_class = type("NativePollSelector", (selectors._PollLikeSelector,), {
+        "_selector_cls": _original("select", "poll"),
+        "_EVENT_READ": _original("select", "POLLIN"),
+        "_EVENT_WRITE": _original("select", "POLLOUT"),
+    })
+    return selector_class()
+
+
+def native_socket(family: int, type: int) -> socket.socket:
+    """An unpatched socket for use with ``native_selector``"""
+    return _original("socket", "socket")(family, type)
+
+
+def offload(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking call (SQLite, waiting on the ingest writer) off the event loop
+
+    In threading mode the call simply runs in the request thread.
+    """
+    if Config.SERVER_MODE == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    if Config.SERVER_MODE == "gevent":
+        from gevent import get_hub
+        return get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+def offload_iter(iterable: Iterable[T]) -> Iterator[T]:
+    """Iterate a blocking generator, fetching each item through ``offload``"""
+    if Config.SERVER_MODE == "threading":
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    sentinel = object()
+    while True:
+        item = offload(next, iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
@@ -0,0 +1,268 @@
+import heapq
+import logging
+import re
+import sqlite3
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from registry import LOG_ROW_COLUMNS, LOG_ROW_JOIN
+
+if TYPE_CHECKING:
+    from models import DatabaseManager
+    from partitions import PartitionManager
+
+logger = logging.getLogger(__name__)
+
+# Mirrors the unicode61 tokenizer: runs of letters and digits form a token
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Prefix indexes for every prefix length a search expands without merging
+# term doclists; longer prefixes narrow the matching terms enough on their own
+FTS_PREFIX = "prefix='1 2 3'"
+
+
+class SearchIndex:
+    """FTS5 prefix indexes over card UIDs and registered user names
+
+    ``card_logs_fts`` indexes the UID of every log and ``users_fts`` the
+    names in the registry. Both are external-content tables kept in sync by
+    triggers, so writes maintain them inside their own transactions and a
+    user rename is searchable immediately without touching any log rows.
+
+    Sealed partitions have no FTS index of their own; their logs are
+    matched by UID prefix on an index range and by ``user_id``.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", partitions: Optional["PartitionManager"] = None):
+        self.db_manager = db_manager
+        self.partitions = partitions
+        self.init_schema()
+
+    def init_schema(self):
+        """Create the FTS tables and sync triggers, building any new index"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE name IN ('card_logs_fts', 'users_fts')")
+            existing = set()
+            for name, sql in cursor.fetchall():
+                if FTS_PREFIX not in sql:
+                    # Indexed before the one-character prefix index; build it again
+                    cursor.execute(f'DROP TABLE {name}')
+                else:
+                    existing.add(name)
+
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS card_logs_fts USING fts5(
+                    uid,
+                    content='card_logs', content_rowid='id',
+                    {FTS_PREFIX}, tokenize='unicode61'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS card_logs_fts_ai AFTER INSERT ON card_logs BEGIN
+                    INSERT INTO card_logs_fts (rowid, uid) VALUES (new.id, new.uid);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS card_logs_fts_ad AFTER DELETE ON card_logs BEGIN
+                    INSERT INTO card_logs_fts (card_logs_fts, rowid, uid) VALUES ('delete', old.id, old.uid);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS card_logs_fts_au AFTER UPDATE OF uid ON card_logs BEGIN
+                    INSERT INTO card_logs_fts (card_logs_fts, rowid, uid) VALUES ('delete', old.id, old.uid);
+                    INSERT INTO card_logs_fts (rowid, uid) VALUES (new.id, new.uid);
+                END
+            ''')
+
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                    name,
+                    content='users', content_rowid='id',
+                    {FTS_PREFIX}, tokenize='unicode61'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+                    INSERT INTO users_fts (rowid, name) VALUES (new.id, new.name);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+                    INSERT INTO users_fts (users_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name ON users BEGIN
+                    INSERT INTO users_fts (users_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                    INSERT INTO users_fts (rowid, name) VALUES (new.id, new.name);
+                END
+            ''')
+            conn.commit()
+
+        if existing != {'card_logs_fts', 'users_fts'}:
+            self.rebuild()
+
+    def rebuild(self):
+        """Re-index every log UID and user name from scratch"""
+        with self.db_manager.connection() as conn:
+            conn.execute("INSERT INTO card_logs_fts (card_logs_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+            conn.commit()
+        logger.info("Search index rebuilt")
+
+    def optimize(self):
+        """Merge the UID index segments, dropping the entries of deleted logs
+
+        FTS5 records deletes as tombstones, so after sealing or purging a
+        month the index keeps its old size until it is merged.
+        """
+        with self.db_manager.connection() as conn:
+            conn.execute("INSERT INTO card_logs_fts (card_logs_fts) VALUES ('optimize')")
+            conn.commit()
+
+    @staticmethod
+    def build_query(search_term: str) -> Optional[str]:
+        """Turn free text into an FTS5 query matching every word as a prefix"""
+        tokens = _TOKEN_RE.findall(search_term.lower())
+        if not tokens:
+            return None
+        return " ".join(f'"{token}"*' for token in tokens)
+
+    def search_rows(self, search_term: str, limit: int = 50, before_id: Optional[int] = None,
+                    after_id: Optional[int] = None, start_ms: Optional[int] = None,
+                    end_ms: Optional[int] = None) -> List[Tuple[int, str, str, int]]:
+        """Return ``(id, uid, user, timestamp)`` rows whose UID or user name matches
+
+        Matches come newest logged first, in log id order, and page on the
+        id: ``before_id`` returns the matches logged before that log and
+        ``after_id`` those logged after it. Every source is read in id
+        order straight off an index (the FTS doclist, ``idx_user_id``) and
+        merged lazily, so a page reads about ``limit`` rows however many
+        logs or users match.
+        """
+        query = self.build_query(search_term)
+        if query is None or limit <= 0:
+            return []
+
+        # The id bounds also go on the FTS rowid, so FTS5 seeks straight to the cursor
+        id_conditions: List[str] = []
+        params: list = []
+        if before_id is not None:
+            id_conditions.append("{id} < ?")
+            params.append(before_id)
+        if after_id is not None:
+            id_conditions.append("{id} > ?")
+            params.append(after_id)
+        conditions: List[str] = []
+        if start_ms is not None:
+            conditions.append("l.timestamp >= ?")
+            params.append(start_ms)
+        if end_ms is not None:
+            conditions.append("l.timestamp < ?")
+            params.append(end_ms)
+
+        # Paging forwards walks up from the cursor, then flips to newest first
+        descending = after_id is None or before_id is not None
+        order = "DESC" if descending else "ASC"
+        fts_extra = "".join(f" AND {condition}" for condition in
+                            [c.format(id="f.rowid") for c in id_conditions] + conditions)
+        extra = "".join(f" AND {condition}" for condition in
+                        [c.format(id="l.id") for c in id_conditions] + conditions)
+
+        with self.db_manager.connection() as conn:
+            users_match = conn.execute('SELECT 1 FROM users_fts WHERE users_fts MATCH ? LIMIT 1',
+                                       (query,)).fetchone() is not None
+            sources = [conn.execute(f'''
+                SELECT {LOG_ROW_COLUMNS}
+                FROM card_logs_fts f
+                JOIN card_logs l ON l.id = f.rowid
+                LEFT JOIN users u ON u.id = l.user_id
+                WHERE card_logs_fts MATCH ?{fts_extra}
+                ORDER BY f.rowid {order}
+                LIMIT ?
+            ''', (query, *params, limit))]
+            if users_match:
+                newest = conn.execute('SELECT COALESCE(MAX(id), 0) FROM card_logs').fetchone()[0]
+                sources.append(iter(self._user_rows(conn, "card_logs", query, before_id, after_id, newest,
+                                                    extra, params, limit)))
+            rows = self._merge(sources, limit, descending)
+
+            if self.partitions is not None:
+                tokens = _TOKEN_RE.findall(search_term.upper())
+                # A UID is a single token; several words can only match a name
+                uid_prefix = tokens[0] if len(tokens) == 1 else None
+                for window in self.partitions.windows(conn, start_ms, end_ms, descending, include_hot=False):
+                    # A partition only holds logs up to its upto_id
+                    if (descending and len(rows) >= limit
+                            and max(p.upto_id for p in window.partitions) < rows[-1][0]):
+                        continue
+                    with self.partitions.attach(conn, window) as source:
+                        sealed = []
+                        if users_match:
+                            newest = max(p.upto_id for p in window.partitions)
+                            sealed.append(iter(self._user_rows(conn, source, query, before_id, after_id, newest,
+                                                               extra, params, limit)))
+                        if uid_prefix is not None:
+                            # Every string starting with the prefix sorts below prefix + U+10FFFF
+                            sealed.append(conn.execute(f'''
+                                SELECT {LOG_ROW_COLUMNS}
+                                FROM {source} l {LOG_ROW_JOIN}
+                                WHERE l.uid >= ? AND l.uid < ?{extra}
+                                ORDER BY l.id {order}
+                                LIMIT ?
+                            ''', (uid_prefix, uid_prefix + "\U0010ffff", *params, limit)))
+                        rows = self._merge([iter(rows), *sealed], limit, descending)
+
+        if not descending:
+            rows.reverse()
+        return rows
+
+    @staticmethod
+    def _user_rows(conn, source: str, query: str, before_id: Optional[int], after_id: Optional[int],
+                   newest: int, extra: str, params: list, limit: int) -> List[Tuple[int, str, str, int]]:
+        """Logs of every user whose name matches, nearest the cursor first
+
+        The matching users are joined into one query over an id window next
+        to the cursor, read through ``idx_user_id``. The window widens from
+        ``limit`` ids until it holds a page or runs past the oldest or
+        ``newest`` log, so no matching user is left out and a page never
+        sorts more than the logs inside its window.
+        """
+        descending = after_id is None or before_id is not None
+        if descending:
+            edge = min(before_id, newest + 1) if before_id is not None else newest + 1
+        else:
+            edge = after_id + 1
+        width = limit * 4
+        while True:
+            low, high = (edge - width, edge) if descending else (edge, edge + width)
+            rows = conn.execute(f'''
+                SELECT {LOG_ROW_COLUMNS}
+                FROM {source} l {LOG_ROW_JOIN}
+                WHERE l.user_id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)
+                  AND l.id >= ? AND l.id < ?{extra}
+                ORDER BY l.id {"DESC" if descending else "ASC"}
+                LIMIT ?
+            ''', (query, low, high, *params, limit)).fetchall()
+            if len(rows) >= limit or (low <= 0 if descending else high > newest):
+                return rows
+            width *= 4
+
+    @staticmethod
+    def _merge(sources: list, limit: int, descending: bool) -> List[Tuple[int, str, str, int]]:
+        """The first ``limit`` distinct rows of id-ordered sources, reading no further
+
+        Cursors among the sources are closed, so partitions can be detached.
+        """
+        rows: List[Tuple[int, str, str, int]] = []
+        for row in heapq.merge(*sources, key=lambda row: row[0], reverse=descending):
+            # A log matched by both its UID and its user comes out twice in a row
+            if rows and rows[-1][0] == row[0]:
+                continue
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        for source in sources:
+            if isinstance(source, sqlite3.Cursor):
+                source.close()
+        return rows
@@ -0,0 +1,219 @@
+"""Seed an empty database with a synthetic attendance history for benchmarks.
+
+Every workday of the last ``--days`` days, each user taps in around their
+shift start at their usual entrance, half of them go out for lunch and come
+back, and everyone taps out in the evening; a few people come in at the
+weekend and unknown visitor cards show up during office hours. Readers
+number their scans like the firmware does (``reader_id``/``seq``).
+
+Logs are inserted in timestamp order, so ids follow time like in
+production, with plain ``executemany`` in large transactions. The search
+index, statistics, rollups and sessions are then built once in bulk instead
+of row by row; two million logs take about two minutes, most of it pairing
+sessions.
+
+Usage:
+    python seed_data.py --db rfid_bench.db --rows 5000000
+    python seed_data.py --db rfid_bench.db --users 300 --days 90 --seed 7
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+from config import Config
+from models import DatabaseManager, LogManager
+from sessions import SessionEngine
+from timeutils import to_epoch_ms
+
+FIRST_NAMES = ("Alex", "Sam", "Maria", "John", "Aisha", "Wei", "Fatima", "Luca", "Priya", "Omar",
+               "Sofia", "Ken", "Nadia", "Tom", "Elena", "Ravi", "Grace", "Hugo", "Mina", "Ivan")
+LAST_NAMES = ("Rahman", "Smith", "Garcia", "Chen", "Khan", "Rossi", "Patel", "Novak", "Kim", "Silva",
+              "Hossain", "Muller", "Ahmed", "Tanaka", "Costa", "Jones", "Ali", "Haddad", "Berg", "Sato")
+DEPARTMENTS = ("Engineering", "Operations", "Sales", "Finance", "Support", "Logistics", "HR", "Security")
+
+# Shift starts (hour of day) and how many people work each
+SHIFTS = ((7, 0.2), (8, 0.6), (9, 0.2))
+# Taps per person per workday, used to size the user base for ``--rows``
+TAPS_PER_WORKDAY = 2 * 0.92 + 2 * 0.5 * 0.92
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+
+# ``(timestamp_ms, uid, user_id, reader)`` before readers assign their seq
+Tap = Tuple[int, str, object, int]
+
+
+class Person:
+    __slots__ = ("user_id", "uid", "shift_ms", "reader")
+
+    def __init__(self, user_id: int, uid: str, shift_ms: int, reader: int):
+        self.user_id = user_id
+        self.uid = uid
+        self.shift_ms = shift_ms
+        self.reader = reader
+
+
+def make_people(rng: random.Random, count: int, readers: int) -> Tuple[List[Person], List[tuple], List[tuple]]:
+    """People plus the ``users`` and ``cards`` rows to register them"""
+    people: List[Person] = []
+    users: List[tuple] = []
+    cards: List[tuple] = []
+    names: Dict[str, int] = {}
+    uids = set()
+    hours, weights = zip(*SHIFTS)
+    for user_id in range(1, count + 1):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        names[name] = names.get(name, 0) + 1
+        if names[name] > 1:
+            name = f"{name} {names[name]}"
+        uid = f"{rng.getrandbits(32):08X}"
+        while uid in uids:
+            uid = f"{rng.getrandbits(32):08X}"
+        uids.add(uid)
+        users.append((user_id, name, DEPARTMENTS[user_id % len(DEPARTMENTS)]))
+        cards.append((uid, user_id))
+        shift = rng.choices(hours, weights)[0]
+        people.append(Person(user_id, uid, shift * HOUR_MS, user_id % readers))
+    return people, users, cards
+
+
+def day_taps(rng: random.Random, day: date, people: List[Person], readers: int,
+             visitor_rate: float) -> List[Tap]:
+    """Every tap of one calendar day, unsorted"""
+    midnight = to_epoch_ms(datetime(day.year, day.month, day.day))
+    workday = day.weekday() < 5
+    attendance = 0.92 if workday else 0.05
+    taps: List[Tap] = []
+
+    def reader_of(person: Person) -> int:
+        # Mostly the entrance nearest their desk
+        return person.reader if rng.random() < 0.85 else rng.randrange(readers)
+
+    for person in people:
+        if rng.random() >= attendance:
+            continue
+        arrive = person.shift_ms + int(rng.gauss(-10, 12) * MINUTE_MS)
+        leave = person.shift_ms + 9 * HOUR_MS + int(rng.gauss(0, 30) * MINUTE_MS)
+        taps.append((midnight + arrive, person.uid, person.user_id, reader_of(person)))
+        if workday and rng.random() < 0.5:
+            out = 12 * HOUR_MS + int(rng.uniform(0, 75) * MINUTE_MS)
+            back = out + int(max(10.0, rng.gauss(40, 10)) * MINUTE_MS)
+            taps.append((midnight + out, person.uid, person.user_id, reader_of(person)))
+            taps.append((midnight + back, person.uid, person.user_id, reader_of(person)))
+        taps.append((midnight + leave, person.uid, person.user_id, reader_of(person)))
+
+    if workday:
+        for _ in range(int(len(people) * visitor_rate)):
+            at = 9 * HOUR_MS + int(rng.uniform(0, 8) * HOUR_MS)
+            taps.append((midnight + at, f"{rng.getrandbits(32):08X}", None, rng.randrange(readers)))
+    return taps
+
+
+def generate(rng: random.Random, people: List[Person], days: int, readers: int,
+             visitor_rate: float) -> Iterator[tuple]:
+    """``card_logs`` rows oldest first, ending now"""
+    now_ms = to_epoch_ms(datetime.now())
+    seqs = [0] * readers
+    first = date.today() - timedelta(days=days)
+    for offset in range(days + 1):
+        taps = day_taps(rng, first + timedelta(days=offset), people, readers, visitor_rate)
+        taps.sort()
+        for timestamp, uid, user_id, reader in taps:
+            if timestamp > now_ms:
+                return
+            seqs[reader] += 1
+            yield uid, user_id, timestamp, f"reader-{reader + 1:02d}", seqs[reader]
+
+
+def seed(db_path: str, users: int, days: int, readers: int, visitor_rate: float, seed_value: int,
+         batch_size: int = 200000) -> Dict:
+    """Fill an empty database and build every derived table; returns a summary"""
+    started = time.perf_counter()
+    db_manager = DatabaseManager(db_path)
+    with db_manager.connection() as conn:
+        if conn.execute('SELECT EXISTS (SELECT 1 FROM card_logs)').fetchone()[0]:
+            raise ValueError(f"{db_path} already has logs; seed an empty database")
+
+    rng = random.Random(seed_value)
+    people, user_rows, card_rows = make_people(rng, users, readers)
+
+    conn = db_manager.connect()
+    try:
+        # A throwaway benchmark file does not need every batch to be durable
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.executemany('INSERT INTO users (id, name, department) VALUES (?, ?, ?)', user_rows)
+        conn.executemany('INSERT INTO cards (uid, user_id) VALUES (?, ?)', card_rows)
+        conn.commit()
+
+        # Building the indexes once afterwards beats maintaining them per row
+        indexes = conn.execute("SELECT name, sql FROM sqlite_master "
+                               "WHERE type = 'index' AND tbl_name = 'card_logs' AND sql IS NOT NULL").fetchall()
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX {name}')
+
+        rows = 0
+        batch: List[tuple] = []
+        for row in generate(rng, people, days, readers, visitor_rate):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.executemany('INSERT INTO card_logs (uid, user_id, timestamp, reader_id, seq) '
+                                 'VALUES (?, ?, ?, ?, ?)', batch)
+                conn.commit()
+                rows += len(batch)
+                batch = []
+        if batch:
+            conn.executemany('INSERT INTO card_logs (uid, user_id, timestamp, reader_id, seq) '
+                             'VALUES (?, ?, ?, ?, ?)', batch)
+            conn.commit()
+            rows += len(batch)
+
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+    inserted = time.perf_counter()
+
+    # The search index and statistics seed themselves from the logs on first start
+    log_manager = LogManager(db_manager=db_manager, archive_dir=None)
+    log_manager.rollups.catch_up()
+    SessionEngine(db_manager, int(Config.SESSION_TIMEOUT_HOURS * 3600 * 1000),
+                  int(Config.SESSION_DEBOUNCE_SECONDS * 1000)).catch_up()
+    with db_manager.connection() as conn:
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    db_manager.close()
+    finished = time.perf_counter()
+
+    return {
+        "db": db_path,
+        "users": users,
+        "readers": readers,
+        "days": days,
+        "rows": rows,
+        "seed": seed_value,
+        "insert_seconds": round(inserted - started, 1),
+        "index_seconds": round(finished - inserted, 1),
+        "rows_per_sec": round(rows / max(inserted - started, 1e-9)),
+        "size_bytes": os.path.getsize(db_path)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=Config.DATABASE_PATH, help="Database file path (must have no logs)")
+    parser.add_argument("--rows", type=int, default=2000000, help="Approximate number of logs")
+    parser.add_argument("--users", type=int, help="Number of people; derived from --rows when omitted")
+    parser.add_argument("--days", type=int, default=365, help="Days of history ending today")
+    parser.add_argument("--readers", type=int, default=8, help="Number of entrances")
+    parser.add_argument("--visitor-rate", type=float, default=0.02, help="Visitor taps per user per workday")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed; the same seed and day give the same data")
+    args = parser.parse_args()
+
+    users = args.users or max(1, math.ceil(args.rows / (args.days * 5 / 7 * TAPS_PER_WORKDAY)))
+    print(json.dumps(seed(args.db, users, args.days, args.readers, args.visitor_rate, args.seed), indent=2))
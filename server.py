@@ -1,6 +1,11 @@
+from config import Config
+import runtime
+
+# Green server modes must patch sockets before Flask is imported
+runtime.monkey_patch()
+
 from flask import Flask
 from flask_socketio import SocketIO
-from config import Config
 from routes import init_routes
 
 def create_app():
@@ -26,13 +31,25 @@ if __name__ == "__main__":
     app, socketio = create_app()
     
     print(f"Starting RFID Log Server on {Config.HOST}:{Config.PORT}")
+    print(f"Server mode: {Config.SERVER_MODE}")
     print(f"Debug mode: {Config.DEBUG}")
     
-    socketio.run(
-        app, 
-        host=Config.HOST, 
-        port=Config.PORT, 
-        debug=Config.DEBUG, 
-        allow_unsafe_werkzeug=True
-    )
+    if Config.SERVER_MODE == 'threading':
+        # Werkzeug development server: one thread per connection, not for production
+        socketio.run(
+            app, 
+            host=Config.HOST, 
+            port=Config.PORT, 
+            debug=Config.DEBUG, 
+            allow_unsafe_werkzeug=True
+        )
+    else:
+        # eventlet/gevent WSGI server; the reloader would fork a second writer
+        socketio.run(
+            app,
+            host=Config.HOST,
+            port=Config.PORT,
+            debug=Config.DEBUG,
+            use_reloader=False
+        )
 
@@ -0,0 +1,517 @@
+import argparse
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from partitions import sealed_until
+from registry import UNKNOWN_USER
+from timeutils import from_epoch_ms, to_epoch_ms
+
+if TYPE_CHECKING:
+    from models import CardLog, DatabaseManager
+    from retention import ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+OPEN = "open"
+CLOSED = "closed"
+# Opened but never checked out within the timeout
+TIMED_OUT = "timeout"
+
+# A tap fed to the pairing state machine: ``(log_id, uid, user_id, user, timestamp_ms)``
+Tap = Tuple[int, str, Optional[int], str, int]
+
+TAP_COLUMNS = f"l.id, l.uid, l.user_id, COALESCE(u.name, '{UNKNOWN_USER}'), l.timestamp"
+SESSION_COLUMNS = (f"s.id, s.uid, s.user_id, COALESCE(u.name, '{UNKNOWN_USER}'), "
+                   "s.check_in, s.check_out, s.status")
+
+
+class Session(NamedTuple):
+    id: int
+    uid: str
+    user_id: Optional[int]
+    user: str
+    check_in: int
+    check_out: Optional[int]
+    status: str
+
+    @property
+    def last_tap(self) -> int:
+        """Timestamp of the last tap that changed this session"""
+        return self.check_out if self.check_out is not None else self.check_in
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "uid": self.uid,
+            "user_id": self.user_id,
+            "user": self.user,
+            "check_in": from_epoch_ms(self.check_in).strftime("%Y-%m-%d %H:%M:%S"),
+            "check_out": (from_epoch_ms(self.check_out).strftime("%Y-%m-%d %H:%M:%S")
+                          if self.check_out is not None else None),
+            "status": self.status
+        }
+
+
+class SessionEngine:
+    """Attendance sessions materialized incrementally from the tap stream
+
+    Taps of each card alternate between check-in and check-out. A tap
+    within ``debounce_ms`` of the card's previous accepted tap is a repeated
+    read and ignored; a session still open ``timeout_ms`` after its check-in
+    is marked timed out and the next tap opens a new one.
+
+    Committed logs are queued by ``submit`` and paired on a background
+    thread, each batch in one transaction together with the id of the last
+    log processed. After a restart, or whenever a batch was missed, the
+    engine catches up from ``card_logs`` past that checkpoint. A tap older
+    than the card's latest accepted tap (a reader uploading buffered scans)
+    re-pairs that card from the start of the session the tap falls into.
+    Taps dated in months already sealed into partitions are not paired:
+    the history they would re-pair has left ``card_logs``.
+
+    The latest session of every card is kept in memory, so ``presence`` is
+    served without a query. With ``maintain=False`` (web workers of a
+    cluster) the engine only reads what the writer process maintains.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", timeout_ms: int = 16 * 3600 * 1000,
+                 debounce_ms: int = 30 * 1000, maintain: bool = True, chunk_size: int = 5000):
+        self.db_manager = db_manager
+        self.timeout_ms = timeout_ms
+        self.debounce_ms = debounce_ms
+        self.maintain = maintain
+        self.chunk_size = chunk_size
+        # Serializes pairing; held across a whole batch transaction
+        self._lock = threading.RLock()
+        # Guards the in-memory view read by presence()
+        self._state_lock = threading.Lock()
+        self._latest: Dict[str, Session] = {}
+        self._open: Dict[str, Session] = {}
+        self._checkpoint: Optional[int] = None
+        self._queue: "queue.Queue[List[Tap]]" = queue.Queue()
+        self._listeners: List[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.init_schema()
+
+    def init_schema(self):
+        """Create the sessions table and its checkpoint"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY,
+                    uid TEXT NOT NULL,
+                    user_id INTEGER,
+                    check_in INTEGER NOT NULL,
+                    check_out INTEGER,
+                    in_log_id INTEGER NOT NULL,
+                    out_log_id INTEGER,
+                    status TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_uid ON sessions(uid, check_in)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_check_in ON sessions(check_in)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id, check_in)')
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_sessions_open ON sessions(uid) WHERE status = '{OPEN}'")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sessions_state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call ``callback()`` after every batch that changed a session"""
+        self._listeners.append(callback)
+
+    def start(self):
+        """Catch up and start pairing submitted logs (idempotent; no-op unless maintaining)"""
+        if not self.maintain or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sessions", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the pairing thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, logs: List["CardLog"]):
+        """Queue committed logs for pairing; used as a LogManager listener"""
+        if self.maintain:
+            self._queue.put([(log.id, log.uid, log.user_id, log.user, to_epoch_ms(log.timestamp)) for log in logs])
+
+    def invalidate(self):
+        """Forget the in-memory view; the next read reloads it from the database"""
+        with self._state_lock:
+            self._checkpoint = None
+            self._latest, self._open = {}, {}
+
+    def _run(self):
+        try:
+            self.catch_up()
+        except Exception as e:
+            logger.error(f"Session catch-up failed: {str(e)}")
+        while not self._stop.is_set():
+            try:
+                taps = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # Pair everything that queued up meanwhile in one transaction
+            while True:
+                try:
+                    taps.extend(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process(taps)
+            except Exception as e:
+                # The checkpoint did not move; the next batch catches up from card_logs
+                logger.error(f"Session pairing failed for {len(taps)} taps: {str(e)}")
+
+    def _process(self, taps: List[Tap]):
+        with self._lock:
+            self._ensure_loaded()
+            # Concurrent writers can notify out of id order; one tap per id, ascending
+            taps = sorted({tap[0]: tap for tap in taps if tap[0] > self._checkpoint}.values(),
+                          key=lambda tap: tap[0])
+            if not taps:
+                return
+            if taps[-1][0] - self._checkpoint != len(taps):
+                # Some logs never reached us (e.g. committed just before a restart,
+                # or by a writer whose notification is still on its way)
+                self.catch_up(taps[-1][0])
+                return
+            self._apply(taps)
+
+    def catch_up(self, upto_id: Optional[int] = None, progress: Optional["ProgressCallback"] = None) -> int:
+        """Pair every log after the checkpoint straight from ``card_logs``, in id order"""
+        processed = 0
+        while True:
+            with self._lock:
+                self._ensure_loaded()
+                params: List = [self._checkpoint]
+                bound = ''
+                if upto_id is not None:
+                    bound = 'AND l.id <= ?'
+                    params.append(upto_id)
+                with self.db_manager.connection() as conn:
+                    taps = conn.execute(f'''
+                        SELECT {TAP_COLUMNS}
+                        FROM card_logs l LEFT JOIN users u ON u.id = l.user_id
+                        WHERE l.id > ? {bound}
+                        ORDER BY l.id
+                        LIMIT ?
+                    ''', (*params, self.chunk_size)).fetchall()
+                if taps:
+                    self._apply(taps)
+            processed += len(taps)
+            if progress and taps:
+                progress(processed, None)
+            if len(taps) < self.chunk_size:
+                return processed
+
+    def _apply(self, taps: List[Tap]):
+        """Pair ``taps`` (ascending id) in one transaction, then publish the new state"""
+        # Sessions changed in this batch; None marks a card whose sessions were all removed
+        changed: Dict[str, Optional[Session]] = {}
+        repairs: Dict[str, int] = {}
+        upto_id = taps[-1][0]
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            floor = sealed_until(cursor)
+            for tap in taps:
+                uid = tap[1]
+                if floor is not None and tap[4] < floor:
+                    continue
+                if uid in repairs:
+                    # Re-paired from card_logs below, together with this tap
+                    continue
+                session = changed[uid] if uid in changed else self._latest.get(uid)
+                if session is not None and tap[4] < session.last_tap:
+                    repairs[uid] = tap[4]
+                    continue
+                self._step(cursor, changed, session, tap)
+            for uid, timestamp in repairs.items():
+                self._repair(cursor, changed, uid, timestamp, upto_id, floor)
+            cursor.execute('''
+                INSERT INTO sessions_state (name, value) VALUES ('last_log_id', ?)
+                ON CONFLICT(name) DO UPDATE SET value = excluded.value
+            ''', (upto_id,))
+            conn.commit()
+
+        with self._state_lock:
+            for uid, session in changed.items():
+                self._remember(uid, session)
+            self._checkpoint = upto_id
+        if changed:
+            for listener in self._listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    logger.error(f"Session listener failed: {str(e)}")
+
+    def _step(self, cursor: sqlite3.Cursor, changed: Dict[str, Optional[Session]],
+              session: Optional[Session], tap: Tap):
+        """Advance one card's state machine by one in-order tap"""
+        log_id, uid, user_id, user, timestamp = tap
+        if session is not None and timestamp - session.last_tap < self.debounce_ms:
+            return
+        if session is not None and session.status == OPEN:
+            if timestamp - session.check_in <= self.timeout_ms:
+                cursor.execute('UPDATE sessions SET check_out = ?, out_log_id = ?, status = ? WHERE id = ?',
+                               (timestamp, log_id, CLOSED, session.id))
+                changed[uid] = session._replace(check_out=timestamp, status=CLOSED)
+                return
+            cursor.execute('UPDATE sessions SET status = ? WHERE id = ?', (TIMED_OUT, session.id))
+        cursor.execute('''
+            INSERT INTO sessions (uid, user_id, check_in, in_log_id, status)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (uid, user_id, timestamp, log_id, OPEN))
+        changed[uid] = Session(cursor.lastrowid, uid, user_id, user, timestamp, None, OPEN)
+
+    def _repair(self, cursor: sqlite3.Cursor, changed: Dict[str, Optional[Session]], uid: str,
+                timestamp: int, upto_id: int, floor: Optional[int] = None):
+        """Re-pair one card from the session a late tap falls into"""
+        anchor = cursor.execute('SELECT MAX(check_in) FROM sessions WHERE uid = ? AND check_in <= ?',
+                                (uid, timestamp)).fetchone()[0]
+        if anchor is None:
+            anchor = timestamp
+        if floor is not None and anchor < floor:
+            # The session's check-in was sealed; keep it and replay only the hot taps
+            anchor = floor
+            cursor.execute(f'''
+                UPDATE sessions SET check_out = NULL, out_log_id = NULL, status = '{OPEN}'
+                WHERE uid = ? AND check_in < ? AND (check_out >= ? OR status = '{TIMED_OUT}')
+                  AND check_in = (SELECT MAX(check_in) FROM sessions WHERE uid = ? AND check_in < ?)
+            ''', (uid, floor, floor, uid, floor))
+        cursor.execute('DELETE FROM sessions WHERE uid = ? AND check_in >= ?', (uid, anchor))
+        session = self._load_latest(cursor, uid)
+        taps = cursor.execute(f'''
+            SELECT {TAP_COLUMNS}
+            FROM card_logs l LEFT JOIN users u ON u.id = l.user_id
+            WHERE l.uid = ? AND l.timestamp >= ? AND l.id <= ?
+            ORDER BY l.timestamp, l.id
+        ''', (uid, anchor, upto_id)).fetchall()
+        changed[uid] = session
+        for tap in taps:
+            self._step(cursor, changed, changed[uid], tap)
+
+    @staticmethod
+    def _load_latest(cursor: sqlite3.Cursor, uid: str) -> Optional[Session]:
+        row = cursor.execute(f'''
+            SELECT {SESSION_COLUMNS}
+            FROM sessions s LEFT JOIN users u ON u.id = s.user_id
+            WHERE s.uid = ?
+            ORDER BY s.check_in DESC, s.id DESC
+            LIMIT 1
+        ''', (uid,)).fetchone()
+        return Session(*row) if row else None
+
+    def _remember(self, uid: str, session: Optional[Session]):
+        if session is None:
+            self._latest.pop(uid, None)
+        else:
+            self._latest[uid] = session
+        if session is not None and session.status == OPEN:
+            self._open[uid] = session
+        else:
+            self._open.pop(uid, None)
+
+    def _ensure_loaded(self):
+        """Load the checkpoint and the latest session of every card"""
+        if self._checkpoint is not None:
+            return
+        with self.db_manager.connection() as conn:
+            checkpoint = conn.execute("SELECT value FROM sessions_state WHERE name = 'last_log_id'").fetchone()
+            # SQLite returns the bare columns of the row holding MAX(check_in)
+            rows = conn.execute(f'''
+                SELECT {SESSION_COLUMNS}
+                FROM sessions s LEFT JOIN users u ON u.id = s.user_id
+                WHERE s.id IN (SELECT id FROM (SELECT id, MAX(check_in) FROM sessions GROUP BY uid))
+            ''').fetchall()
+        with self._state_lock:
+            self._latest, self._open = {}, {}
+            for row in rows:
+                self._remember(row[1], Session(*row))
+            self._checkpoint = checkpoint[0] if checkpoint else 0
+
+    def presence(self, now_ms: Optional[int] = None) -> List[Dict]:
+        """Cards currently checked in, longest present first"""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        if self.maintain:
+            if self._checkpoint is None:
+                with self._lock:
+                    self._ensure_loaded()
+            with self._state_lock:
+                sessions = list(self._open.values())
+        else:
+            sessions = self._load_open()
+        present = [session for session in sessions if now_ms - session.check_in <= self.timeout_ms]
+        present.sort(key=lambda session: (session.check_in, session.id))
+        return [session.to_dict() for session in present]
+
+    def _load_open(self) -> List[Session]:
+        """Open sessions as maintained by the writer process, cached until ``invalidate``"""
+        with self._state_lock:
+            # Read-only engines keep no checkpoint of their own; a value marks the cache as filled
+            if self._checkpoint is not None:
+                return list(self._open.values())
+        with self.db_manager.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {SESSION_COLUMNS}
+                FROM sessions s LEFT JOIN users u ON u.id = s.user_id
+                WHERE s.status = '{OPEN}'
+            ''').fetchall()
+        sessions = [Session(*row) for row in rows]
+        with self._state_lock:
+            self._open = {session.uid: session for session in sessions}
+            self._checkpoint = 0
+        return sessions
+
+    def attendance(self, start_ms: int, end_ms: int, user: Optional[str] = None,
+                   uid: Optional[str] = None, now_ms: Optional[int] = None) -> Dict:
+        """Time present per user within ``[start_ms, end_ms)``, from the materialized sessions
+
+        Sessions are clipped to the range. A session that was never checked
+        out counts as a missing check-out and adds no time. ``user`` is a
+        user id or exact name; when it or ``uid`` is given the matching
+        sessions are listed too.
+        """
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        # No session is longer than the timeout, so the check_in range stays sargable
+        conditions = ['s.check_in >= ?', 's.check_in < ?']
+        params: List = [start_ms - self.timeout_ms, end_ms]
+        if user is not None:
+            if user.isdigit():
+                conditions.append('s.user_id = ?')
+                params.append(int(user))
+            else:
+                conditions.append('u.name = ?')
+                params.append(user)
+        if uid is not None:
+            conditions.append('s.uid = ?')
+            params.append(uid)
+
+        with self.db_manager.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {SESSION_COLUMNS}
+                FROM sessions s LEFT JOIN users u ON u.id = s.user_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY s.check_in, s.id
+            ''', params).fetchall()
+
+        totals: Dict[Tuple, Dict] = {}
+        listed: List[Dict] = []
+        for row in rows:
+            session = Session(*row)
+            if session.check_out is not None:
+                end = session.check_out
+            elif session.status == OPEN and now_ms - session.check_in <= self.timeout_ms:
+                end = now_ms
+            else:
+                end = None
+            if end is None:
+                # A missing check-out belongs to the range its check-in falls into
+                if not start_ms <= session.check_in < end_ms:
+                    continue
+            elif max(session.check_in, start_ms) >= min(end, end_ms):
+                continue
+
+            # Unknown cards are reported one per UID
+            key = (session.user_id, session.uid if session.user_id is None else None)
+            total = totals.setdefault(key, {
+                "user_id": session.user_id,
+                "user": session.user,
+                "sessions": 0,
+                "worked_seconds": 0,
+                "open_sessions": 0,
+                "missing_checkouts": 0
+            })
+            if session.user_id is None:
+                total["uid"] = session.uid
+            total["sessions"] += 1
+            if end is None:
+                total["missing_checkouts"] += 1
+                duration = 0
+            else:
+                duration = (min(end, end_ms) - max(session.check_in, start_ms)) // 1000
+                if session.check_out is None:
+                    total["open_sessions"] += 1
+            total["worked_seconds"] += duration
+            if user is not None or uid is not None:
+                listed.append({**session.to_dict(), "duration_seconds": duration})
+
+        users = sorted(totals.values(), key=lambda total: (-total["worked_seconds"], total["user"]))
+        for total in users:
+            total["worked_hours"] = round(total["worked_seconds"] / 3600, 2)
+        result = {"users": users, "count": len(users)}
+        if user is not None or uid is not None:
+            result["sessions"] = listed
+        return result
+
+    def rebuild(self, progress: Optional["ProgressCallback"] = None) -> Dict:
+        """Re-pair every log still in ``card_logs``
+
+        Sessions older than the oldest retained log are kept, so history
+        removed by retention cleanup survives a rebuild.
+        """
+        with self._lock:
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                oldest, first_id = cursor.execute('SELECT MIN(timestamp), MIN(id) FROM card_logs').fetchone()
+                if oldest is not None:
+                    # Sessions of sealed months are kept like those of purged ones
+                    oldest = max(oldest, sealed_until(cursor) or oldest)
+                    cursor.execute('DELETE FROM sessions WHERE check_in >= ?', (oldest,))
+                    # The last kept session of a card may be closed by a tap that is replayed
+                    cursor.execute(f'''
+                        UPDATE sessions SET check_out = NULL, out_log_id = NULL, status = '{OPEN}'
+                        WHERE (check_out >= ? OR status = '{TIMED_OUT}')
+                          AND id IN (SELECT id FROM (SELECT id, MAX(check_in) FROM sessions GROUP BY uid))
+                    ''', (oldest,))
+                    cursor.execute('''
+                        INSERT INTO sessions_state (name, value) VALUES ('last_log_id', ?)
+                        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+                    ''', (first_id - 1,))
+                conn.commit()
+            self.invalidate()
+            processed = self.catch_up(progress=progress)
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Session listener failed: {str(e)}")
+        with self.db_manager.connection() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        logger.info(f"Sessions rebuilt from {processed} logs: {count} sessions")
+        return {"logs_processed": processed, "sessions": count}
+
+
+if __name__ == "__main__":
+    from config import Config
+    from models import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Attendance session maintenance")
+    parser.add_argument("command", choices=["presence", "catch-up", "rebuild"])
+    parser.add_argument("--db", default=Config.DATABASE_PATH, help="Database file path")
+    args = parser.parse_args()
+
+    engine = SessionEngine(DatabaseManager(args.db), Config.SESSION_TIMEOUT_HOURS * 3600 * 1000,
+                           Config.SESSION_DEBOUNCE_SECONDS * 1000)
+    if args.command == "rebuild":
+        print(engine.rebuild())
+    elif args.command == "catch-up":
+        print({"logs_processed": engine.catch_up()})
+    else:
+        for present in engine.presence():
+            print(present)
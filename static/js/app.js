@@ -1,38 +1,47 @@
 let totalScans = 0;
-let uniqueUsers = new Set();
+let uniqueUsers = 0;
 let todayScans = 0;
-const today = new Date().toDateString();
+// Highest log id received; the resume handshake replays everything after it
+let lastLogId = null;
 
-// Load existing logs from database on page load
+// Load existing logs and counters from the server
 async function loadExistingLogs() {
     try {
-        const response = await fetch('/api/logs?limit=50');
-        const data = await response.json();
+        // The first page holds only the logs of the rooms the dashboard subscribes to
+        const [logsResponse, statsResponse] = await Promise.all([
+            fetch(`/api/logs?${logFilter('limit=50')}`),
+            fetch('/api/stats')
+        ]);
+        const data = await logsResponse.json();
+        applyStats(await statsResponse.json());
         
         if (data.logs && data.logs.length > 0) {
             // Process existing logs in reverse order (oldest first for display)
             const reversedLogs = [...data.logs].reverse();
-            reversedLogs.forEach(log => {
-                addLogRow(log);
-                uniqueUsers.add(log.user);
-                
-                const logDate = new Date(log.time).toDateString();
-                if (logDate === today) {
-                    todayScans++;
-                }
-            });
-            
-            totalScans = data.logs.length;
-            updateStats();
+            reversedLogs.forEach(recordLog);
         }
+        if (lastLogId === null) {
+            lastLogId = 0;
+        }
+        updateStats();
     } catch (error) {
         console.error('Failed to load existing logs:', error);
     }
 }
 
+// Counters always come from the server, so they never drift from the database
+function applyStats(stats) {
+    if (!stats || stats.total_scans === undefined) {
+        return;
+    }
+    totalScans = stats.total_scans;
+    uniqueUsers = stats.unique_users;
+    todayScans = stats.today_scans;
+}
+
 function updateStats() {
     document.getElementById('totalScans').textContent = totalScans;
-    document.getElementById('uniqueUsers').textContent = uniqueUsers.size;
+    document.getElementById('uniqueUsers').textContent = uniqueUsers;
     document.getElementById('todayScans').textContent = todayScans;
 }
 
@@ -52,11 +61,19 @@ function addLogRow(log) {
     const tbody = document.getElementById('logTableBody');
     const row = document.createElement('tr');
     
-    row.innerHTML = `
-        <td class="time">${log.time}</td>
-        <td><span class="uid">${log.uid}</span></td>
-        <td class="user">${log.user}</td>
-    `;
+    // Cells are filled with textContent: uid and user come from clients
+    const timeCell = row.insertCell();
+    timeCell.className = 'time';
+    timeCell.textContent = log.time;
+    
+    const uid = document.createElement('span');
+    uid.className = 'uid';
+    uid.textContent = log.uid;
+    row.insertCell().appendChild(uid);
+    
+    const userCell = row.insertCell();
+    userCell.className = 'user';
+    userCell.textContent = log.user;
     
     tbody.insertBefore(row, tbody.firstChild);
     
@@ -66,29 +83,104 @@ function addLogRow(log) {
     }
 }
 
-// Initialize SocketIO connection
-var socket = io();
+// Ids already shown, so a log delivered twice (replay, several rooms) counts once
+const seenIds = new Set();
 
-socket.on("new_log", function(log) {
-    totalScans++;
-    uniqueUsers.add(log.user);
-    
-    const logDate = new Date(log.time).toDateString();
-    if (logDate === today) {
-        todayScans++;
+function recordLog(log) {
+    if (seenIds.has(log.id)) {
+        return false;
     }
+    seenIds.add(log.id);
+    if (seenIds.size > 1000) {
+        seenIds.delete(seenIds.values().next().value);
+    }
+    lastLogId = Math.max(lastLogId || 0, log.id);
     
-    updateStats();
     addLogRow(log);
+    return true;
+}
+
+function clearLogs() {
+    document.getElementById('logTableBody').innerHTML = '';
+    seenIds.clear();
+    lastLogId = null;
+}
+
+// Optional room subscriptions from the page URL, e.g. /?dept=Engineering or /?reader=lobby
+function requestedRooms() {
+    const params = new URLSearchParams(window.location.search);
+    return [
+        ...params.getAll('dept').map(dept => `dept:${dept}`),
+        ...params.getAll('reader').map(reader => `reader:${reader}`)
+    ];
+}
+
+// Query string for /api/logs with the same dept/reader filter as requestedRooms()
+function logFilter(query) {
+    const params = new URLSearchParams(query);
+    const page = new URLSearchParams(window.location.search);
+    page.getAll('dept').forEach(dept => params.append('dept', dept));
+    page.getAll('reader').forEach(reader => params.append('reader', reader));
+    return params.toString();
+}
+
+function notify(added) {
+    if (added.length === 0) {
+        return;
+    }
     
     // Show notification
-    showToast(`${log.user} scanned card ${log.uid}`);
+    const last = added[added.length - 1];
+    if (added.length === 1) {
+        showToast(`${last.user} scanned card ${last.uid}`);
+    } else {
+        showToast(`${added.length} new scans, latest: ${last.user}`);
+    }
+}
+
+// Ask the server for just the logs missed since lastLogId; reload only if they are gone
+function resume(allowReload) {
+    socket.emit("resume", {last_id: lastLogId, rooms: requestedRooms()}, async function(reply) {
+        if (reply.status === "reload" && allowReload) {
+            clearLogs();
+            await loadExistingLogs();
+            resume(false);
+            return;
+        }
+        const added = reply.logs.filter(recordLog);
+        applyStats(reply.stats);
+        updateStats();
+        notify(added);
+    });
+}
+
+// Initialize SocketIO connection
+var socket = io();
+
+const initialLoad = new Promise(resolve => {
+    document.addEventListener('DOMContentLoaded', () => loadExistingLogs().then(resolve));
+});
+
+// Runs on the first connection and on every reconnect
+socket.on("connect", async function() {
+    await initialLoad;
+    resume(true);
+});
+
+// Scans arrive in batches; acknowledge each frame so the server keeps streaming
+socket.on("new_logs", function(frame) {
+    const added = frame.logs.filter(recordLog);
+    socket.emit("ack", {seq: frame.seq});
+    
+    applyStats(frame.stats);
+    updateStats();
+    notify(added);
 });
 
-// Load existing logs when page loads
-document.addEventListener('DOMContentLoaded', function() {
-    loadExistingLogs();
+// The server stopped streaming to us because we fell behind
+socket.on("resync", function() {
+    resume(true);
 });
 
 // Initialize stats
-updateStats(); 
\ No newline at end of file
+updateStats();
\ No newline at end of file
@@ -0,0 +1,192 @@
+import argparse
+import logging
+import sqlite3
+from collections import Counter
+from contextlib import closing
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Sequence
+
+from partitions import hot_filter
+from timeutils import LOCAL_DAY_SQL
+
+if TYPE_CHECKING:
+    from models import DatabaseManager
+    from partitions import Partition, PartitionManager
+
+logger = logging.getLogger(__name__)
+
+
+class StatsManager:
+    """Incrementally maintained scan statistics
+
+    Counters live in small side tables that are updated in the same
+    transaction as every insert and cleanup, so reading them is a handful of
+    primary-key lookups regardless of how large ``card_logs`` grows.
+    """
+
+    def __init__(self, db_manager: "DatabaseManager", partitions: Optional["PartitionManager"] = None):
+        self.db_manager = db_manager
+        self.partitions = partitions
+        self.init_schema()
+
+    def init_schema(self):
+        """Create the counter tables and seed them from existing logs"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stats_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+            # Distinct-user set with per-user scan counts; 0 collects unknown cards
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stats_users (
+                    user_id INTEGER PRIMARY KEY,
+                    scans INTEGER NOT NULL
+                )
+            ''')
+
+            # One counter row per calendar day; a new day starts at zero
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stats_daily (
+                    day TEXT PRIMARY KEY,
+                    scans INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+            cursor.execute("SELECT 1 FROM stats_counters WHERE name = 'total_scans'")
+            seeded = cursor.fetchone() is not None
+            conn.commit()
+
+        if not seeded:
+            self.reconcile()
+
+    def record_inserts(self, conn: sqlite3.Connection, rows: Iterable[Sequence]):
+        """Count newly inserted ``(user_id, timestamp)`` rows inside the caller's transaction"""
+        per_user: Counter = Counter()
+        per_day: Counter = Counter()
+        for user_id, timestamp in rows:
+            per_user[user_id or 0] += 1
+            per_day[timestamp.strftime("%Y-%m-%d")] += 1
+        self._apply(conn, per_user, per_day, 1)
+
+    def record_deletes(self, conn: sqlite3.Connection, per_user: Dict[int, int], per_day: Dict[str, int]):
+        """Subtract deleted rows inside the caller's transaction"""
+        self._apply(conn, per_user, per_day, -1)
+
+    def _apply(self, conn: sqlite3.Connection, per_user: Dict[int, int], per_day: Dict[str, int], sign: int):
+        cursor = conn.cursor()
+        total = sum(per_user.values())
+        if not total:
+            return
+
+        new_users = removed_users = 0
+        for user_id, count in per_user.items():
+            cursor.execute('INSERT OR IGNORE INTO stats_users (user_id, scans) VALUES (?, 0)', (user_id,))
+            new_users += cursor.rowcount
+            cursor.execute('UPDATE stats_users SET scans = scans + ? WHERE user_id = ?', (sign * count, user_id))
+            if sign < 0:
+                cursor.execute('DELETE FROM stats_users WHERE user_id = ? AND scans <= 0', (user_id,))
+                removed_users += cursor.rowcount
+
+        for day, count in per_day.items():
+            cursor.execute('''
+                INSERT INTO stats_daily (day, scans) VALUES (?, ?)
+                ON CONFLICT(day) DO UPDATE SET scans = scans + excluded.scans
+            ''', (day, sign * count))
+            if sign < 0:
+                cursor.execute('DELETE FROM stats_daily WHERE day = ? AND scans <= 0', (day,))
+
+        self._bump(cursor, 'total_scans', sign * total)
+        self._bump(cursor, 'unique_users', new_users - removed_users)
+
+    @staticmethod
+    def _bump(cursor: sqlite3.Cursor, name: str, delta: int):
+        cursor.execute('''
+            INSERT INTO stats_counters (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        ''', (name, delta))
+
+    def get_stats(self) -> Dict:
+        """Get current statistics from the maintained counters"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name, value FROM stats_counters')
+            counters = dict(cursor.fetchall())
+
+            cursor.execute('SELECT scans FROM stats_daily WHERE day = ?', (today,))
+            row = cursor.fetchone()
+
+        return {
+            "total_scans": counters.get('total_scans', 0),
+            "unique_users": counters.get('unique_users', 0),
+            "today_scans": row[0] if row else 0
+        }
+
+    def reconcile(self) -> Dict:
+        """Rebuild every counter from a full scan of ``card_logs`` and its sealed partitions"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM stats_counters')
+            cursor.execute('DELETE FROM stats_users')
+            cursor.execute('DELETE FROM stats_daily')
+
+            # The write lock held from here keeps the catalog consistent with card_logs
+            partitions = self.partitions.catalog(conn) if self.partitions else []
+            hot = f"card_logs{hot_filter(partitions)}"
+            cursor.execute(f'''
+                INSERT INTO stats_users (user_id, scans)
+                SELECT COALESCE(user_id, 0), COUNT(*) FROM {hot} GROUP BY 1
+            ''')
+            cursor.execute(f'''
+                INSERT INTO stats_daily (day, scans)
+                SELECT {LOCAL_DAY_SQL}, COUNT(*) FROM {hot} GROUP BY 1
+            ''')
+            for partition in partitions:
+                self._add_partition(cursor, partition)
+            cursor.execute('''
+                INSERT INTO stats_counters (name, value)
+                SELECT 'total_scans', COALESCE(SUM(scans), 0) FROM stats_users
+                UNION ALL
+                SELECT 'unique_users', COUNT(*) FROM stats_users
+            ''')
+            conn.commit()
+
+        stats = self.get_stats()
+        logger.info(f"Statistics reconciled: {stats}")
+        return stats
+
+    def _add_partition(self, cursor: sqlite3.Cursor, partition: "Partition"):
+        # Read through its own connection: nothing can be attached inside a transaction
+        with closing(self.partitions.open(partition)) as sealed:
+            per_user = sealed.execute('SELECT COALESCE(user_id, 0), COUNT(*) FROM card_logs GROUP BY 1').fetchall()
+            per_day = sealed.execute(f'SELECT {LOCAL_DAY_SQL}, COUNT(*) FROM card_logs GROUP BY 1').fetchall()
+        cursor.executemany('''
+            INSERT INTO stats_users (user_id, scans) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET scans = scans + excluded.scans
+        ''', per_user)
+        cursor.executemany('''
+            INSERT INTO stats_daily (day, scans) VALUES (?, ?)
+            ON CONFLICT(day) DO UPDATE SET scans = scans + excluded.scans
+        ''', per_day)
+
+
+if __name__ == "__main__":
+    from config import Config
+    from models import DatabaseManager
+    from partitions import PartitionManager
+
+    parser = argparse.ArgumentParser(description="Scan statistics maintenance")
+    parser.add_argument("command", choices=["show", "reconcile"])
+    parser.add_argument("--db", default=Config.DATABASE_PATH, help="Database file path")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    stats_manager = StatsManager(db_manager, PartitionManager(db_manager, Config.PARTITION_DIR))
+    if args.command == "reconcile":
+        print(stats_manager.reconcile())
+    else:
+        print(stats_manager.get_stats())
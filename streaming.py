@@ -0,0 +1,37 @@
+import csv
+import io
+import json
+import time
+from typing import Iterable, Iterator, Tuple
+
+Row = Tuple[int, str, str, int]
+
+CSV_HEADER = ("id", "time", "uid", "user")
+
+
+def _format_time(timestamp_ms: int) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp_ms // 1000))
+
+
+def stream_ndjson(rows: Iterable[Row]) -> Iterator[str]:
+    """Serialize raw log rows as newline-delimited JSON, one row at a time"""
+    dumps = json.dumps
+    for log_id, uid, user, timestamp in rows:
+        yield dumps({"id": log_id, "time": _format_time(timestamp), "uid": uid, "user": user}) + "\n"
+
+
+def stream_csv(rows: Iterable[Row], rows_per_chunk: int = 500) -> Iterator[str]:
+    """Serialize raw log rows as CSV, flushing every ``rows_per_chunk`` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    pending = 0
+    for log_id, uid, user, timestamp in rows:
+        writer.writerow((log_id, _format_time(timestamp), uid, user))
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+# Timestamps are stored as integer milliseconds since the Unix epoch so that
+# range predicates stay sargable against idx_timestamp.
+LOCAL_DAY_SQL = "DATE(timestamp / 1000, 'unixepoch', 'localtime')"
+
+
+def to_epoch_ms(value: datetime) -> int:
+    """Convert a naive local datetime to epoch milliseconds"""
+    return int(round(value.timestamp() * 1000))
+
+
+def from_epoch_ms(value: int) -> datetime:
+    """Convert epoch milliseconds to a naive local datetime"""
+    return datetime.fromtimestamp(value / 1000)
+
+
+def day_bounds(date: str) -> Tuple[int, int]:
+    """Return the ``[start, end)`` epoch-ms range for a YYYY-MM-DD local date"""
+    start = datetime.strptime(date, '%Y-%m-%d')
+    return to_epoch_ms(start), to_epoch_ms(start + timedelta(days=1))
+
+
+def parse_time_param(value: Optional[str], end_of_day: bool = False) -> Optional[int]:
+    """Parse an epoch-ms integer, ISO datetime or YYYY-MM-DD date into epoch ms
+
+    Bare dates resolve to the start of the day, or to the start of the next
+    day when ``end_of_day`` is set so that ``to=<date>`` includes that date.
+    Raises ValueError for unrecognised input.
+    """
+    if value is None or value == '':
+        return None
+    if value.isdigit():
+        return int(value)
+    if len(value) == 10:
+        start, end = day_bounds(value)
+        return end if end_of_day else start
+    return to_epoch_ms(datetime.fromisoformat(value))
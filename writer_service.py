@@ -0,0 +1,242 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from ingest import BatchWriter, DuplicateScan, IngestQueueFull
+from models import CardLog
+from runtime import offload
+from timeutils import from_epoch_ms, to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+Address = Union[str, Tuple[str, int]]
+
+# Every message is a 4-byte big-endian length followed by that many bytes of JSON
+_HEADER = struct.Struct(">I")
+_CHALLENGE_SIZE = 16
+
+
+def log_to_event(log: CardLog) -> Dict:
+    """A committed log as a JSON-safe dict, for RPC replies and bus events"""
+    return {"id": log.id, "uid": log.uid, "user": log.user, "user_id": log.user_id,
+            "timestamp": to_epoch_ms(log.timestamp), "reader_id": log.reader_id, "seq": log.seq}
+
+
+def log_from_event(data: Dict) -> CardLog:
+    """Inverse of ``log_to_event``"""
+    return CardLog(data["uid"], data["user"], from_epoch_ms(data["timestamp"]), data["id"], data["user_id"],
+                   data.get("reader_id"), data.get("seq"))
+
+
+def parse_address(address: str) -> Address:
+    """``host:port`` for TCP, anything else is a Unix socket path"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def connect(address: Address, authkey: bytes, timeout: Optional[float] = None) -> socket.socket:
+    """Open an authenticated connection to a WriterService"""
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        challenge = _recv_exact(sock, _CHALLENGE_SIZE)
+        sock.sendall(hmac.new(authkey, challenge, hashlib.sha256).digest())
+        sock.settimeout(None)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def _send_message(sock: socket.socket, message: Any):
+    body = json.dumps(message, separators=(",", ":")).encode()
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_message(sock: socket.socket) -> Any:
+    size, = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("Connection closed")
+        data += chunk
+    return data
+
+
+class WriterService:
+    """Expose a process's BatchWriter to the other workers of a cluster
+
+    Only this process writes scans, so SQLite sees one writer however many
+    web workers are running. Each client connection is served by its own
+    task, which submits scans to the shared group-commit queue.
+
+    ``spawn`` starts those tasks; pass ``socketio.start_background_task`` so
+    that in the green server modes they run on the event loop rather than in
+    OS threads, which would each spin up their own hub.
+    """
+
+    def __init__(self, writer: BatchWriter, address: str, authkey: bytes, timeout: float = 10.0,
+                 spawn: Optional[Callable[..., Any]] = None):
+        self.writer = writer
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self.spawn = spawn or self._spawn_thread
+        self._listener: Optional[socket.socket] = None
+
+    def start(self):
+        """Listen for worker connections (idempotent)"""
+        if self._listener is not None:
+            return
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                # Stale socket left by a previous run
+                os.unlink(self.address)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self.address)
+        listener.listen(128)
+        self._listener = listener
+        self.spawn(self._accept)
+
+    def stop(self):
+        """Stop accepting connections"""
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _accept(self):
+        listener = self._listener
+        while self._listener is listener:
+            try:
+                sock, _ = listener.accept()
+            except OSError as e:
+                if self._listener is listener:
+                    logger.error(f"Writer service accept failed: {str(e)}")
+                    continue
+                return
+            self.spawn(self._serve, sock)
+
+    @staticmethod
+    def _spawn_thread(target: Callable[..., Any], *args):
+        threading.Thread(target=target, args=args, name="writer-service", daemon=True).start()
+
+    def _serve(self, sock: socket.socket):
+        with sock:
+            if not isinstance(self.address, str):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                if not self._authenticate(sock):
+                    logger.warning("Writer service rejected a connection with a bad key")
+                    return
+                while True:
+                    command, *args = _recv_message(sock)
+                    _send_message(sock, self._handle(command, *args))
+            except (EOFError, OSError, ValueError, TypeError):
+                return
+
+    def _authenticate(self, sock: socket.socket) -> bool:
+        challenge = os.urandom(_CHALLENGE_SIZE)
+        sock.sendall(challenge)
+        sock.settimeout(self.timeout)
+        response = _recv_exact(sock, hashlib.sha256().digest_size)
+        sock.settimeout(None)
+        return hmac.compare_digest(response, hmac.new(self.authkey, challenge, hashlib.sha256).digest())
+
+    def _handle(self, command: str, uid: str, timestamp_ms: Optional[int], reader_id: Optional[str] = None,
+                seq: Optional[int] = None):
+        if command != "add_log":
+            return "error", f"Unknown command: {command}"
+        timestamp = from_epoch_ms(timestamp_ms) if timestamp_ms is not None else None
+        try:
+            future = self.writer.submit(uid, timestamp, reader_id, seq)
+            log = offload(future.result, self.timeout)
+        except IngestQueueFull:
+            return "busy", "Ingestion queue is full"
+        except DuplicateScan as e:
+            return "duplicate", {"reason": e.reason, "log": log_to_event(e.log)}
+        except Exception as e:
+            return "error", str(e)
+        return "ok", log_to_event(log)
+
+
+class RemoteWriter:
+    """Drop-in replacement for BatchWriter that forwards scans to the writer process
+
+    Connections are pooled; one in-flight scan per connection keeps the
+    protocol a plain request/reply. Call it directly from request handlers,
+    not through ``offload``: in the green server modes the sockets are
+    cooperative and only yield to the event loop while waiting.
+    """
+
+    def __init__(self, address: str, authkey: bytes, max_idle: int = 32):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._idle: "queue.LifoQueue[socket.socket]" = queue.LifoQueue(maxsize=max_idle)
+
+    def start(self):
+        """Nothing to start; connections are opened on demand"""
+
+    def stop(self):
+        """Close idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def qsize(self) -> int:
+        """Scans are queued in the writer process"""
+        return 0
+
+    def add_log(self, uid: str, timeout: Optional[float] = None, timestamp: Optional[datetime] = None,
+                reader_id: Optional[str] = None, seq: Optional[int] = None) -> CardLog:
+        """Send a scan to the writer and block until its batch is durable; raises DuplicateScan for repeats"""
+        try:
+            sock = self._idle.get_nowait()
+        except queue.Empty:
+            sock = connect(self.address, self.authkey, timeout)
+
+        try:
+            sock.settimeout(timeout)
+            _send_message(sock, ["add_log", uid, to_epoch_ms(timestamp) if timestamp else None, reader_id, seq])
+            status, payload = _recv_message(sock)
+        except BaseException:
+            # The reply may still arrive; never reuse a connection in an unknown state
+            sock.close()
+            raise
+
+        try:
+            self._idle.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+        if status == "busy":
+            raise IngestQueueFull(payload)
+        if status == "duplicate":
+            raise DuplicateScan(log_from_event(payload["log"]), payload["reason"])
+        if status != "ok":
+            raise RuntimeError(payload)
+        return log_from_event(payload)